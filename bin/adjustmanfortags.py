@@ -2,7 +2,7 @@
 #
 import os, sys, optparse, re
 from lsstdistrib.manifest import Manifest
-from lsstdistrib.tags import TagDef
+from lsstdistrib.tagstore import defaultTagStore
 
 extRe = re.compile(r"([\+\-])(\d+)$")
 textRe = re.compile(r"([\+\-])(\d+)")
@@ -41,7 +41,7 @@ def main():
         tagfile = os.path.join(sdir, "%s.list" % opts.tag)
     else:
         raise RuntimeError("No tag or tagfile specified")
-    tagged = TagDef(tagfile)
+    tagged = defaultTagStore.get(tagfile)
     
     deps = inman.getDeps()
     adjusted = []
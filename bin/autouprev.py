@@ -1,21 +1,24 @@
 #! /usr/bin/env python
 #
 from __future__ import with_statement
-import sys, os, re, optparse, shutil, pwd
+import sys, os, re, optparse, pwd
 
-from lsstdistrib.release import UpdateDependents
+from lsstdistrib.release import UpdateDependents, Release
+from lsstdistrib.journal import ReleaseJournal, UPREV
 from lsstdistrib.manifest import SortProducts
+from lsstdistrib.planner import UprevPlanner
 from lsstdistrib import version as onvers
 
 prog = os.path.basename(sys.argv[0])
 if prog.endswith(".py"):
     prog = prog[:-3]
 
-usage = "%prog [ -h ] [-o FILE -u LIST -T TAG -rn ] [ -d DIR ] product ..."
+usage = "%prog [ -h ] [-o FILE -u LIST -T TAG -J FILE -rn ] [ -d DIR ] product ...\n       %prog [ -h ] -J FILE --undo [ -d DIR ]"
 description = \
 """Create new manifest files for all dependents of the given products, up-reving them
 to use these products.  Normally, the products that are specified have been recently
-released.  
+released.  With -J, the run is journaled so that, if interrupted, it can be 
+resumed by running the same command again or undone with --undo.
 """
 
 log = sys.stderr
@@ -31,12 +34,21 @@ def main():
     if not os.path.isdir(opts.serverdir):
         fail("server root given with -d is not an existing directory:\n" + 
              opts.serverdir, 2)
-    if len(args) < 1:
+    if opts.undo and not opts.journal:
+        fail("--undo requires -J", 2)
+    if len(args) < 1 and not opts.undo:
         fail("no products specified", 2)
 
     if opts.silent:
         log = None
 
+    journal = None
+    if opts.journal:
+        journal = ReleaseJournal(opts.journal)
+        if opts.undo:
+            journal.undo(log=(opts.verbose and log) or None)
+            return
+
     products = []
     for arg in args:
         products.append(parseProduct(arg))
@@ -56,36 +68,30 @@ def main():
             tmp.extend(i.split(','))
         opts.nouprprods = tmp
 
-    uprev = UpdateDependents(products, opts.serverdir, log=log)
-    if not opts.creator:
-        opts.creator = re.sub(r",.*", "", pwd.getpwuid(os.getuid())[4])
-    uprev.creator = opts.creator
-    uprev.submitter = opts.submitter
-
     # set the reference tags
     for i in xrange(len(opts.reftag)):
         opts.reftag.extend(opts.reftag.pop(0).split(','))
     if "current" not in opts.reftag:
         opts.reftag.append("current")
-    for tag in reversed(opts.reftag):
-        uprev.updateFromTag(tag)
-        
-    if opts.uprprods or opts.nouprprods:
-        # restrict the products we up-rev
-        deps = uprev.getDependents()
-        for prodname in deps.keys():
-            if (opts.uprprods and prodname not in opts.uprprods) or \
-               prodname in opts.nouprprods:
-                del deps[prodname]
-        uprev.setDependents(deps)
-        
+
     if opts.noaction:
         if not opts.silent:
             print >> log, "No new files being written;", \
                 "here's what we would write without --noaction:"
-        updated = getNewManifestPaths(uprev)
+        # work out the up-rev in memory
+        planner = UprevPlanner(opts.serverdir, opts.reftag, log=log)
+        plan = planner.plan(map(lambda p: p[:2], products), 
+                            opts.uprprods or None, opts.nouprprods)
+        if opts.verbose and log:
+            plan.write(log, True, opts.serverdir)
+        updated = plan.getProducts()
     else:
-        updated = uprev.createManifests()
+        updated = uprevProducts(products, opts, journal)
+        if opts.release:
+            rel = Release(map(lambda p: (p[0], "%s+%s" % (p[1], p[2]), p[3]),
+                              updated), 
+                          opts.serverdir, journal=journal)
+            rel.releaseAll(True)
 
     ostrm = sys.stdout
     if opts.outfile:
@@ -98,10 +104,6 @@ def main():
             if opts.release:
                 writtenfile = "%s-%s+%s.manifest" % (prod[0],prod[1],prod[2])
                 prodpath = os.path.join(opts.serverdir,'manifests',writtenfile)
-                            
-                if not opts.noaction:
-                    # print "cp", prod[3], deployedpath
-                    shutil.copyfile(prod[3], prodpath)
 
                 if sorter:
                     sorter.addProduct(writtenfile, 
@@ -129,6 +131,32 @@ def main():
     if opts.outfile:
         ostrm.close()
 
+def uprevProducts(products, opts, journal=None):
+    uprev = UpdateDependents(products, opts.serverdir, log=log, 
+                             journal=journal)
+    if journal and journal.getPlan(UPREV) is not None:
+        # resume the interrupted run as it was planned
+        return uprev.createManifests()
+
+    if not opts.creator:
+        opts.creator = re.sub(r",.*", "", pwd.getpwuid(os.getuid())[4])
+    uprev.creator = opts.creator
+    uprev.submitter = opts.submitter
+
+    for tag in reversed(opts.reftag):
+        uprev.updateFromTag(tag)
+        
+    if opts.uprprods or opts.nouprprods:
+        # restrict the products we up-rev
+        deps = uprev.getDependents()
+        for prodname in deps.keys():
+            if (opts.uprprods and prodname not in opts.uprprods) or \
+               prodname in opts.nouprprods:
+                del deps[prodname]
+        uprev.setDependents(deps)
+        
+    return uprev.createManifests()
+
 def parseDeployedManifestFilename(filename):
     filename = os.path.splitext(os.path.basename(filename))[0]
     info = filename.split('-', 1)
@@ -154,19 +182,6 @@ def parseProduct(prodpath):
         
     return out
 
-def getNewManifestPaths(uprev):
-    deps = uprev.getDependents()
-    blds = uprev.setUpgradedBuildNumbers()
-
-    out = []
-    for prod in deps:
-        pdir = uprev.server.getProductDir(prod, deps[prod])
-        filename = "b%s.manifest" % blds[prod]
-        out.append( (prod, onvers.baseVersion(deps[prod]), 
-                         blds[prod], os.path.join(pdir, filename)) )
-
-    return out
-
 def loadconfig():
     import lsstdistrib.config as config
     import lsstdistrib.utils  as utils
@@ -222,6 +237,12 @@ def setopts():
     parser.add_option("--creator", action="store", metavar="NAME", 
                       dest="creator",
                     help="record NAME as the creator into the manifests")
+    parser.add_option("-J", "--journal", action="store", metavar="FILE",
+                      dest="journal",
+                    help="journal the run in FILE, resuming the run it records if it exists")
+    parser.add_option("--undo", action="store_true", default=False,
+                      dest="undo",
+                    help="remove the files written by the run journaled with -J")
 
     return parser
 
@@ -0,0 +1,121 @@
+#! /usr/bin/env python
+#
+from __future__ import with_statement
+import sys, os, re, optparse
+
+from lsstdistrib.bench.synth import SyntheticServer
+from lsstdistrib.bench.suite import BenchmarkSuite
+
+prog = os.path.basename(sys.argv[0])
+if prog.endswith(".py"):
+    prog = prog[:-3]
+
+usage = "%prog [ -h ] [ -g ] [ -o FILE ] [ options ] -d DIR [ benchmark ... ]"
+description = \
+"""Time the main server operations against a distribution server,
+writing the results as JSON.  With -g, a synthetic server is first
+generated in DIR.  If benchmark names are given, only those are run; the
+available benchmarks are: """ + ", ".join(BenchmarkSuite.benchmarks) + "."
+
+log = sys.stderr
+
+def main():
+    global log
+    (opts, args) = setopts().parse_args()
+
+    if not opts.serverdir:
+        fail("-d option missing from arguments", 2)
+    for name in args:
+        if name not in BenchmarkSuite.benchmarks:
+            fail("unknown benchmark: " + name, 2)
+    if opts.silent:
+        log = None
+
+    params = None
+    if opts.generate:
+        synth = SyntheticServer(opts.serverdir, opts.products, opts.versions,
+                                opts.builds, opts.depth, opts.fanout, 
+                                opts.stacksize, seed=opts.seed)
+        if log:
+            print >> log, "Generating server in", opts.serverdir
+        try:
+            synth.generate()
+        except RuntimeError, ex:
+            fail(str(ex))
+        params = synth.getParameters()
+    elif not os.path.isdir(opts.serverdir):
+        fail("server root given with -d is not an existing directory:\n" +
+             opts.serverdir, 2)
+
+    suite = BenchmarkSuite(opts.serverdir, opts.repeat, opts.targets, 
+                           seed=opts.seed, log=log)
+    results = suite.run(args or None)
+    if params:
+        results["synthetic"] = params
+
+    if opts.outfile:
+        with open(opts.outfile, 'w') as fd:
+            suite.writeJSON(results, fd)
+    else:
+        suite.writeJSON(results, sys.stdout)
+
+def setopts():
+    parser = optparse.OptionParser(prog=prog, usage=usage,
+                                   description=description)
+    parser.add_option("-s", "--silent", action="store_true", dest="silent",
+                      default=False, help="suppress progress messages")
+    parser.add_option("-d", "--server-dir", action="store", dest="serverdir",
+                      metavar="DIR", 
+                      help="the root directory of the distribution server")
+    parser.add_option("-o", "--output", action="store", dest="outfile",
+                      metavar="FILE", 
+                      help="write the results to FILE instead of standard out")
+    parser.add_option("-r", "--repeat", action="store", type="int", 
+                      dest="repeat", default=3, metavar="N",
+                      help="run each benchmark N times (default: 3)")
+    parser.add_option("-t", "--targets", action="store", type="int", 
+                      dest="targets", default=5, metavar="N",
+                      help="the number of products to treat as released (default: 5)")
+    parser.add_option("-S", "--seed", action="store", type="int", 
+                      dest="seed", default=0, 
+                      help="the random number seed (default: 0)")
+    parser.add_option("-g", "--generate", action="store_true", 
+                      dest="generate", default=False, 
+                      help="generate a synthetic server in DIR first")
+    parser.add_option("-n", "--products", action="store", type="int", 
+                      dest="products", default=1000, metavar="N",
+                      help="with -g, the number of products (default: 1000)")
+    parser.add_option("-V", "--versions", action="store", type="int", 
+                      dest="versions", default=2, metavar="N",
+                      help="with -g, the versions per product (default: 2)")
+    parser.add_option("-b", "--builds", action="store", type="int", 
+                      dest="builds", default=2, metavar="N",
+                      help="with -g, the builds per version (default: 2)")
+    parser.add_option("-D", "--depth", action="store", type="int", 
+                      dest="depth", default=6, metavar="N",
+                      help="with -g, the number of dependency levels (default: 6)")
+    parser.add_option("-F", "--fanout", action="store", type="int", 
+                      dest="fanout", default=3, metavar="N",
+                      help="with -g, the maximum direct dependencies (default: 3)")
+    parser.add_option("-k", "--stack-size", action="store", type="int", 
+                      dest="stacksize", default=100, metavar="N",
+                      help="with -g, the products per independent stack (default: 100)")
+
+    return parser
+
+def fail(msg, exitcode=1):
+    raise FatalError(msg, exitcode)
+
+class FatalError(Exception):
+    def __init__(self, msg, exitcode):
+        Exception.__init__(self, msg)
+        self.exitcode = exitcode
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except FatalError, ex:
+        if log:
+            print >> log, "%s: %s" % (prog, str(ex))
+        sys.exit(ex.exitcode)
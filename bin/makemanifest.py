@@ -32,6 +32,7 @@ class Manifest(object):
         """
         self.recs = {}
         self.keys = []
+        self.prodkeys = {}
         self.name = name
         self.vers = version
         self.flav = flavor
@@ -67,10 +68,11 @@ class Manifest(object):
         @param installid  a complete handle for the deployment bundle.
         """
         key = ":".join([pkgname, flavor, version])
-        if not self.recs.has_key(key):
+        if key not in self.recs:
             self.keys.append(key)
             self.recs[key] = [pkgname, flavor, version,
                               tablefile, installdir, installid]
+            self.prodkeys.setdefault(pkgname, []).append(key)
 
     def addLSSTRecord(self, pkgname, version, pkgpath=None, build="1", 
                       flavor="generic", id="lsstbuild"):
@@ -161,7 +163,7 @@ class Manifest(object):
 
         @param pkgname    the name of the package
         """
-        return bool(filter(lambda k: k.startswith(pkgname+':'), self.keys))
+        return pkgname in self.prodkeys
 
     def recordToString(self, pkgname, flavor, version):
         """return the requested record in manifest format.
@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+#
+from __future__ import with_statement
+import sys, os, re, optparse
+
+from lsstdistrib.server import Repository
+from lsstdistrib.catalog import Catalog
+
+prog = os.path.basename(sys.argv[0])
+if prog.endswith(".py"):
+    prog = prog[:-3]
+
+usage = "%prog [ -h ] [ -s ] [ -c ] [ -d DIR ]"
+description = \
+"""(Re-)build the catalog database of the products, builds, and deployed 
+manifests on the distribution server.
+"""
+
+log = sys.stderr
+
+defaultServerRoot=None
+
+def main():
+    global log
+    (opts, args) = loadconfig()
+
+    if not opts.serverdir:
+        fail("-d option missing from arguments", 2)
+    if not os.path.isdir(opts.serverdir):
+        fail("server root given with -d is not an existing directory:\n" +
+             opts.serverdir, 2)
+
+    if opts.silent:
+        log = None
+
+    repos = Repository(opts.serverdir)
+    catalog = Catalog(repos.getCatalogFile(), repos)
+    if opts.check:
+        if not catalog.isCurrent():
+            fail("catalog is missing or out of date: " + catalog.file)
+        if log:
+            print >> log, "Catalog is up to date:", catalog.file
+        return
+
+    catalog.rebuild()
+    if log:
+        print >> log, "Catalogued %d deployed manifests into %s" % \
+            (len(catalog.listDeployed()), catalog.file)
+    catalog.close()
+
+def loadconfig():
+    import lsstdistrib.config as config
+    import lsstdistrib.utils  as utils
+
+    try:
+        configfile = os.path.join(os.environ['DEVENV_SERVERTOOLS_DIR'], "conf",
+                                  "common_conf.py")
+        utils.loadConfigfile(configfile)
+    except Exception, ex:
+        print >> sys.stderr, "Warning: unable to load system config file:", str(ex)
+
+    cl = setopts()
+    (opts, args) = cl.parse_args()
+
+    if not opts.serverdir and getattr(config, 'serverdir', None):
+        opts.serverdir = config.serverdir
+
+    return (opts, args)
+
+def setopts():
+    parser = optparse.OptionParser(prog=prog, usage=usage,
+                                   description=description)
+    parser.add_option("-s", "--silent", action="store_true", dest="silent",
+                      default=False, help="suppress all output")
+    parser.add_option("-c", "--check", action="store_true", dest="check",
+                      default=False, 
+                      help="only check that the catalog is up to date")
+    parser.add_option("-d", "--server-dir", action="store", dest="serverdir",
+                      metavar="DIR", default=defaultServerRoot,
+                      help="the root directory of the distribution server")
+
+    return parser
+
+def fail(msg, exitcode=1):
+    raise FatalError(msg, exitcode)
+
+class FatalError(Exception):
+    def __init__(self, msg, exitcode):
+        Exception.__init__(self, msg)
+        self.exitcode = exitcode
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except FatalError, ex:
+        if log:
+            print >> log, "%s: %s" % (prog, str(ex))
+        sys.exit(ex.exitcode)
+
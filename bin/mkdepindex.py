@@ -0,0 +1,92 @@
+#! /usr/bin/env python
+#
+from __future__ import with_statement
+import sys, os, re, optparse
+
+from lsstdistrib.manifest import DeployedManifests
+from lsstdistrib.server import Repository
+
+prog = os.path.basename(sys.argv[0])
+if prog.endswith(".py"):
+    prog = prog[:-3]
+
+usage = "%prog [ -h ] [ -s ] [ -d DIR ]"
+description = \
+"""(Re-)build the reverse-dependency index of the latest deployed manifests
+used to quickly find the dependents of a product.
+"""
+
+log = sys.stderr
+
+defaultServerRoot=None
+
+def main():
+    global log
+    (opts, args) = loadconfig()
+
+    if not opts.serverdir:
+        fail("-d option missing from arguments", 2)
+    if not os.path.isdir(opts.serverdir):
+        fail("server root given with -d is not an existing directory:\n" +
+             opts.serverdir, 2)
+
+    if opts.silent:
+        log = None
+
+    repos = Repository(opts.serverdir)
+    indexfile = repos.getDependencyIndexFile()
+    deployed = DeployedManifests(repos.getManifestDir(), indexfile=indexfile)
+    deployed.index.rebuild()
+    deployed.index.save()
+
+    if log:
+        print >> log, "Indexed %d manifests into %s" % \
+            (len(deployed.index.latest), indexfile)
+
+def loadconfig():
+    import lsstdistrib.config as config
+    import lsstdistrib.utils  as utils
+
+    try:
+        configfile = os.path.join(os.environ['DEVENV_SERVERTOOLS_DIR'], "conf",
+                                  "common_conf.py")
+        utils.loadConfigfile(configfile)
+    except Exception, ex:
+        print >> sys.stderr, "Warning: unable to load system config file:", str(ex)
+
+    cl = setopts()
+    (opts, args) = cl.parse_args()
+
+    if not opts.serverdir and getattr(config, 'serverdir', None):
+        opts.serverdir = config.serverdir
+
+    return (opts, args)
+
+def setopts():
+    parser = optparse.OptionParser(prog=prog, usage=usage,
+                                   description=description)
+    parser.add_option("-s", "--silent", action="store_true", dest="silent",
+                      default=False, help="suppress all output")
+    parser.add_option("-d", "--server-dir", action="store", dest="serverdir",
+                      metavar="DIR", default=defaultServerRoot,
+                      help="the root directory of the distribution server")
+
+    return parser
+
+def fail(msg, exitcode=1):
+    raise FatalError(msg, exitcode)
+
+class FatalError(Exception):
+    def __init__(self, msg, exitcode):
+        Exception.__init__(self, msg)
+        self.exitcode = exitcode
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except FatalError, ex:
+        if log:
+            print >> log, "%s: %s" % (prog, str(ex))
+        sys.exit(ex.exitcode)
+
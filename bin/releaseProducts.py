@@ -13,7 +13,7 @@ serverdir=None
 from lsstdistrib.release import UpdateDependents, UprevProduct
 from lsstdistrib.manifest import BuildDependencies, SortProducts, Manifest, DeployedManifests
 from lsstdistrib import version as onvers
-from lsstdistrib.tags import TagDef
+from lsstdistrib.tagstore import defaultTagStore
 
 prog = os.path.basename(sys.argv[0])
 if prog.endswith(".py"):
@@ -151,13 +151,14 @@ def lookupDependents(deployed, products):
 
     tagged = None
     if opts.reftag:
-        tagged = tags.TagDef(serverdir, opts.reftag)
+        tagged = defaultTagStore.get(os.path.join(serverdir, 
+                                                  "%s.list" % opts.reftag))
         
     out = {}    #dependendents
     for prod in products:
         version = None
         if tagged:
-            version = opts.reftag.getVersion(prod[0])
+            version = tagged.getVersion(prod[0])
         if not version:
             version = deployed.getLatestVersion(prod[0])
             
@@ -4,14 +4,18 @@ from __future__ import with_statement
 import sys, os, re, optparse, pdb
 
 from lsstdistrib.release import Release
+from lsstdistrib.journal import ReleaseJournal, RELEASE
+from lsstdistrib.deploy import defaultThreads
 
 prog = os.path.basename(sys.argv[0])
 if prog.endswith(".py"):
     prog = prog[:-3]
 
-usage = "%(prog)s [ -h ] [ -vs ] [ -d DIR ] manifest ..."
+usage = "%(prog)s [ -h ] [ -vs ] [ -J FILE ] [ -d DIR ] manifest ...\n       %(prog)s [ -h ] -J FILE [ --undo ] [ -d DIR ]"
 description = \
-"""Copy new manifest files into the manifests directory.  
+"""Copy new manifest files into the manifests directory.  With -J, the run is 
+journaled so that, if interrupted, it can be resumed by running again with the
+same journal (the manifests need not be given again) or undone with --undo.
 """
 
 log = sys.stderr
@@ -27,19 +31,33 @@ def main():
     if not os.path.isdir(opts.serverdir):
         fail("server root given with -d is not an existing directory:\n" + 
              opts.serverdir, 2)
-    if len(args) < 1:
-        fail("no manifests specified", 2)
+    if opts.undo and not opts.journal:
+        fail("--undo requires -J", 2)
 
     global log
     if opts.silent:
         log = None
 
+    journal = None
+    if opts.journal:
+        journal = ReleaseJournal(opts.journal)
+        if opts.undo:
+            journal.undo(log=log)
+            return
+    if len(args) < 1 and not (journal and journal.getPlan(RELEASE) is not None):
+        fail("no manifests specified", 2)
+
     manifests = []
     for arg in args:
         manifests.append(Release.parseProductManifestPath(arg))
 
-    releaser = Release(manifests, opts.serverdir, log)
+    releaser = Release(manifests, opts.serverdir, log, threads=opts.threads,
+                       journal=journal)
     failed = releaser.releaseAll(opts.overwrite, opts.atomic)
+    if opts.verbose and log:
+        for dest, method, secs in releaser.timings:
+            print >> log, "%-40s %-8s %8.4fs" % \
+                (os.path.basename(dest), method, secs)
 
 
 def loadconfig():
@@ -79,6 +97,18 @@ def setopts():
                       default=False,
                       help="do not fail if this release would overwrite a" + 
                       " previous one")
+    parser.add_option("-j", "--threads", action="store", dest="threads",
+                      type="int", metavar="N", default=defaultThreads,
+                      help="deploy with up to N threads (default: %d)" % 
+                           defaultThreads)
+    parser.add_option("-J", "--journal", action="store", dest="journal",
+                      metavar="FILE",
+                      help="journal the run in FILE, resuming the run it" +
+                      " records if it exists")
+    parser.add_option("--undo", action="store_true", dest="undo",
+                      default=False,
+                      help="remove the manifests deployed by the run" +
+                      " journaled with -J")
 
     return parser
 
@@ -272,8 +272,17 @@ function uprevDependents {
     tagarg=
     [ -n "$reftags" ] && tagarg="-T $reftags"
 
-    echo autouprev.py -d $stagesrvr $outfile $tagarg --submitter=$asuser -r $prodname/${version}+${bn} | tee -a $log
-    autouprev.py -d $stagesrvr $outfile $tagarg --submitter=$asuser -r $prodname/${version}+${bn} ||  return 9
+    # the journal outlives the session directory so that an interrupted 
+    # up-rev can be resumed (by rerunning the command) or undone
+    local journal=$workdir/$prodname-${version}+${bn}.journal
+
+    echo autouprev.py -d $stagesrvr $outfile $tagarg --submitter=$asuser -J $journal -r $prodname/${version}+${bn} | tee -a $log
+    autouprev.py -d $stagesrvr $outfile $tagarg --submitter=$asuser -J $journal -r $prodname/${version}+${bn} || {
+        echo "${prog}: up-rev journaled in $journal; to undo it:" | tee -a $log
+        echo "  autouprev.py -d $stagesrvr -J $journal --undo" | tee -a $log
+        return 9
+    }
+    rm -f $journal
 
     synctoweb || return 10
     [ -n "$testserver" ] || synctostd || return 10
@@ -243,16 +243,15 @@ for tag in ${tags[*]}; do
     }
     tagfile=$sessiondir/$tag.list
 
-    for prod in ${products[*]}; do
-        pv=(`echo $prod | sed -e 's/-/ /'`)
-        echo tagRelease.py -d $sessiondir ${pv[*]} $tag >> $log
-        tmplog=$sessiondir/tagRelease-py.log
-        tagRelease.py -d $sessiondir ${pv[*]} $tag > $tmplog 2>&1 || {
-            cat $tmplog
-            [ -n "$dolog" ] && cat $tmplog >> $log 
-            exit 1
-        }
-    done
+    # tag all of the products with one rewrite of the tag file
+    pvs=(`echo ${products[*]} | sed -e 's/\(^\| \)\([^ -]*\)-/\1\2\//g'`)
+    echo tagRelease.py -d $sessiondir -T $tag ${pvs[*]} >> $log
+    tmplog=$sessiondir/tagRelease-py.log
+    tagRelease.py -d $sessiondir -T $tag ${pvs[*]} > $tmplog 2>&1 || {
+        cat $tmplog
+        [ -n "$dolog" ] && cat $tmplog >> $log 
+        exit 1
+    }
 
     # copy them back to the server
     cp $tagfile $stagesrvr || { 
@@ -4,7 +4,7 @@ from __future__ import with_statement
 from __future__ import absolute_import
 import sys, os, re, optparse
 
-from lsstdistrib.tags import TagDef
+from lsstdistrib.tagstore import defaultTagStore
 from lsstdistrib.manifest import Manifest
 from lsstdistrib import version as onvers
 
@@ -79,7 +79,7 @@ def main():
 
     # open up our reference tag file
     reftagfile = os.path.join(opts.serverdir, "%s.list" % opts.reftag)
-    reftags = TagDef(reftagfile)
+    reftags = defaultTagStore.get(reftagfile)
 
     # use a previous manifest of our product as the template for the up-reved
     # one
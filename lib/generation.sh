@@ -0,0 +1,24 @@
+#! /bin/bash
+#
+# functions for honoring the generation marker of a server's manifests
+# directory (see lsstdistrib.generation).  The marker is odd while a batch
+# of manifests is being published and is changed again when it finishes.
+#
+function currentGeneration {
+    # print the current generation of the server rooted at $1
+    local gen=`cat $1/manifests/.generation 2>/dev/null`
+    echo ${gen:-0}
+}
+
+function stableGeneration {
+    # print the generation of the server rooted at $1 once no publication 
+    # is in progress; give up (returning 1) after about 10 seconds
+    local gen tries=0
+    while true; do
+        gen=`currentGeneration $1`
+        [ $(($gen % 2)) -eq 0 ] && { echo $gen; return 0; }
+        tries=$(($tries + 1))
+        [ $tries -ge 100 ] && { echo $gen; return 1; }
+        sleep 0.1
+    done
+}
@@ -10,12 +10,29 @@ function rsyncToWebServer {
     local subdir=
     [ -n "$1" ] && subdir=/$1
 
-    echo rsync -avz $delete --exclude=.git\* --exclude=\*~ $localServerMirror$subdir/ $testPackageServerDir$subdir
-    rsync -avz $delete --exclude=.git\* --exclude=\*~ $localServerMirror$subdir/ $testPackageServerDir$subdir || return 1
+    # copy a consistent set of manifests:  wait out any publication in 
+    # progress, and copy again if one happened during the copy.
+    # The server's local bookkeeping (the generation marker, dependents 
+    # index, and catalog) is not copied.
+    local exclude=('--exclude=.git*' '--exclude=*~' '--exclude=/.release-*' '--exclude=manifests/.generation*' --exclude=dependents.index '--exclude=catalog.sqlite*')
+    local gen tries=0
+    while true; do
+        gen=`stableGeneration $localServerMirror` || {
+            echo "${FUNCNAME}: manifest publication still in progress; not copying"
+            return 1
+        }
+        echo rsync -avz $delete "${exclude[@]}" $localServerMirror$subdir/ $testPackageServerDir$subdir
+        rsync -avz $delete "${exclude[@]}" $localServerMirror$subdir/ $testPackageServerDir$subdir || return 1
+        [ "`currentGeneration $localServerMirror`" = "$gen" ] && break
+        tries=$(($tries + 1))
+        [ $tries -ge 3 ] && { echo "${FUNCNAME}: manifests changed during copy"; return 1; }
+    done
 
     return 0
 }
 
+. $DEVENV_SERVERTOOLS_DIR/lib/generation.sh
+
 packageServerName=sw.lsstcorp.org/pkgs
 testPackageServerPath=test/w12
 testPackageServerDir=/lsst/DC3/distrib/servers/$testPackageServerPath
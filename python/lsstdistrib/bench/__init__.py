@@ -0,0 +1,6 @@
+"""
+tools for measuring the performance of the server tools against 
+synthetic distribution servers of realistic size.  The synth module
+generates the servers, and the suite module times the main operations 
+against them.
+"""
@@ -0,0 +1,228 @@
+"""
+a module for timing the main server operations against a (typically 
+synthetic) distribution server.  The main functionality is provided via 
+the BenchmarkSuite class, whose results can be written out as JSON so that
+runs can be compared over time.  
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, time, random, json, platform
+
+from ..manifest import DeployedManifests, SortProducts
+from ..release import UpdateDependents, Release
+from ..server import Repository
+
+class BenchmarkSuite(object):
+    """
+    a set of timed operations against a distribution server.  Each 
+    operation is run a given number of times.  After each run, the 
+    manifests an operation adds to the server are removed and the files 
+    that releasing updates (the dependency index, the catalog, and the 
+    manifests directory's generation marker) are restored to their 
+    previous contents, so that the server's files are left as they were 
+    found; directory modification times are not restored.  The suite 
+    should not be run against a server that is in use.  The products each
+    operation works on are chosen with a seeded random number generator 
+    so that results are repeatable.
+    """
+
+    benchmarks = [ "latestProducts", "dependsOn", "dependsOnAny", 
+                   "dependsOnPython", "dependsOnAnyPython", "allDependents",
+                   "sortProducts", "createManifests", "releaseAll" ]
+
+    def __init__(self, serverdir, repeat=3, targets=5, sortCount=50, 
+                 seed=0, log=None):
+        """
+        @param serverdir   the root directory of the server
+        @param repeat      the number of times to run each operation
+        @param targets     the number of released products to find the
+                              dependents of 
+        @param sortCount   the number of products to sort into dependency 
+                              order
+        @param seed        the seed for choosing products
+        @param log         a file stream to report progress to.  If None, 
+                              messages will not be written.
+        """
+        self.repos = Repository(serverdir)
+        self.repeat = max(repeat, 1)
+        self.ntargets = targets
+        self.sortCount = sortCount
+        self.seed = seed
+        self.log = log
+
+    def _deployed(self, scanner="grep"):
+        return DeployedManifests(self.repos.getManifestDir(), scanner=scanner)
+
+    def chooseProducts(self, count):
+        """
+        return a repeatable random selection of the latest products as 
+        product-version pairs, sorted by name.
+        """
+        latest = self._deployed().latestProducts()
+        rand = random.Random(self.seed)
+        return sorted(rand.sample(latest, min(count, len(latest))))
+
+    def chooseTargets(self):
+        """
+        return the products to treat as released:  a repeatable random 
+        selection among the products with the most dependents.  
+        """
+        deployed = self._deployed()
+        latest = deployed.latestProducts()
+        counts = deployed.dependsOnAny(map(lambda p: p[0], latest))
+        latest.sort(key=lambda p: -len(counts[p[0]]))
+        pool = latest[:max(self.ntargets * 4, 1)]
+        rand = random.Random(self.seed)
+        return sorted(rand.sample(pool, min(self.ntargets, len(pool))))
+
+    def timeit(self, name, func, setup=None, cleanup=None):
+        """
+        time an operation, returning a dictionary describing the timings.
+        @param name     the name of the operation
+        @param func     the function to time.  It is passed the value 
+                          returned by setup (or None).  
+        @param setup    a function called before each run; its time is not
+                          included.  
+        @param cleanup  a function called after each run with the values 
+                          returned by setup and func; its time is not 
+                          included.  
+        """
+        times = []
+        for i in xrange(self.repeat):
+            data = setup and setup()
+            start = time.time()
+            result = func(data)
+            times.append(time.time() - start)
+            if cleanup:
+                cleanup(data, result)
+
+        ordered = sorted(times)
+        out = { "name": name, "times": times, "min": ordered[0],
+                "median": ordered[len(ordered)//2], 
+                "mean": sum(times) / len(times) }
+        if self.log:
+            print >> self.log, "%-20s min %9.4fs  median %9.4fs" % \
+                (name, out["min"], out["median"])
+        return out
+
+    def benchLatestProducts(self):
+        return self.timeit("latestProducts", 
+                           lambda d: self._deployed().latestProducts())
+
+    def benchDependsOn(self, scanner="grep", name="dependsOn"):
+        targets = self.chooseTargets()
+        def func(data):
+            deployed = self._deployed(scanner)
+            for prod in targets:
+                deployed.dependsOn(prod[0])
+        return self.timeit(name, func)
+
+    def benchDependsOnAny(self, scanner="grep", name="dependsOnAny"):
+        names = map(lambda p: p[0], self.chooseTargets())
+        return self.timeit(name, 
+                   lambda d: self._deployed(scanner).dependsOnAny(names))
+
+    def benchDependsOnPython(self):
+        return self.benchDependsOn("python", "dependsOnPython")
+
+    def benchDependsOnAnyPython(self):
+        return self.benchDependsOnAny("python", "dependsOnAnyPython")
+
+    def benchAllDependents(self):
+        targets = self.chooseTargets()
+        def func(data):
+            deployed = self._deployed()
+            for prod in targets:
+                deployed.getAllDependents(prod[0])
+        return self.timeit("allDependents", func)
+
+    def benchSortProducts(self):
+        names = map(lambda p: p[0], self.chooseProducts(self.sortCount))
+        return self.timeit("sortProducts", 
+                   lambda d: SortProducts(self.repos.root, names).sort())
+
+    def _createManifests(self, data=None):
+        upd = UpdateDependents(self.chooseTargets(), self.repos.root)
+        return upd.createManifests()
+
+    def _removeCreated(self, created, deployed=False):
+        for prod, version, build, filename in created:
+            if os.path.exists(filename):
+                os.remove(filename)
+            if deployed:
+                dest = self.repos.getManifestFile(prod, 
+                                                  "%s+%s" % (version, build))
+                if os.path.exists(dest):
+                    os.remove(dest)
+
+    def benchCreateManifests(self):
+        return self.timeit("createManifests", self._createManifests,
+                           cleanup=lambda d, r: self._removeCreated(r))
+
+    def _stateFiles(self):
+        # the files besides manifests that releasing updates
+        return [self.repos.getDependencyIndexFile(), 
+                self.repos.getCatalogFile(),
+                self.repos.getGenerationMarker().file]
+
+    def _saveState(self):
+        # return the contents of the state files (None for a missing one)
+        out = {}
+        for filename in self._stateFiles():
+            out[filename] = None
+            if os.path.exists(filename):
+                with open(filename, 'rb') as fd:
+                    out[filename] = fd.read()
+        return out
+
+    def _restoreState(self, saved):
+        for filename, data in saved.items():
+            if data is not None:
+                with open(filename, 'wb') as fd:
+                    fd.write(data)
+            elif os.path.exists(filename):
+                os.remove(filename)
+
+    def benchReleaseAll(self):
+        def setup():
+            saved = self._saveState()
+            return (saved, self._createManifests())
+        def func(data):
+            rel = Release(map(lambda c: (c[0], "%s+%s" % c[1:3], c[3]), 
+                              data[1]), self.repos.root)
+            rel.releaseAll()
+        def cleanup(data, result):
+            self._removeCreated(data[1], True)
+            self._restoreState(data[0])
+        return self.timeit("releaseAll", func, setup=setup, cleanup=cleanup)
+
+    def run(self, names=None):
+        """
+        run the benchmarks and return the results as a dictionary
+        @param names   the names of the benchmarks to run (see the 
+                          benchmarks class attribute); if None, all are run.
+        """
+        if names is None:
+            names = self.benchmarks
+        mandir = self.repos.getManifestDir()
+        out = { "server": self.repos.root,
+                "manifests": len(os.listdir(mandir)),
+                "products": len(self._deployed().latestProducts()),
+                "repeat": self.repeat, "seed": self.seed,
+                "python": platform.python_version(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": [] }
+        for name in names:
+            if name not in self.benchmarks:
+                raise ValueError("Unknown benchmark: " + name)
+            func = getattr(self, "bench" + name[0].upper() + name[1:])
+            out["results"].append(func())
+        return out
+
+    def writeJSON(results, strm):
+        """write results returned by run() to a stream as JSON"""
+        json.dump(results, strm, indent=2, sort_keys=True)
+        strm.write("\n")
+
+    writeJSON = staticmethod(writeJSON)
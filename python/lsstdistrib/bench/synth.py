@@ -0,0 +1,233 @@
+"""
+a module for generating synthetic distribution servers for benchmarking.
+The generated tree follows the layout modeled by 
+lsstdistrib.server.Repository:  undeployed manifests are written into 
+product directories (under the external and pseudo subdirectories as
+appropriate), deployed manifests into the manifests directory, and tag
+lists into the root directory.  The main functionality is provided via 
+the SyntheticServer class.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, random, cStringIO
+
+from ..manifest import Manifest
+from ..server import Repository
+
+tagListHeader = """EUPS distribution %s version list. Version 1.0
+#
+# pkg            flavor     version        extra_dir  pkg_dir
+#--------------  ---------  -------------  ---------  --------------
+"""
+
+class SyntheticServer(object):
+    """
+    a generator of a synthetic distribution server.  
+
+    Products are organized into independent stacks (so that the size of a 
+    manifest does not grow with the total number of products).  Within a 
+    stack, products are arranged into dependency levels; each product 
+    depends directly on up to fanout products from lower levels, and its
+    manifests list its full set of dependencies in dependency order.  The
+    first products of each stack are external products, and the last may
+    be pseudo products.  
+
+    Every product has the given number of versions, and every version the 
+    given number of builds; each build is both written as an undeployed 
+    manifest into its product directory and deployed into the manifests 
+    directory.  The manifests of a product refer to the latest build of 
+    the latest version of each of its dependencies.  
+
+    The tree generated for a given set of parameters (including the seed) 
+    is always the same.
+    """
+
+    def __init__(self, rootdir, products=100, versions=2, builds=2, 
+                 depth=6, fanout=3, stackSize=100, externalFraction=0.3, 
+                 pseudoFraction=0.05, tags=("current", "stable"), seed=0,
+                 storage=None):
+        """
+        configure the server to generate
+        @param rootdir           the root directory of the server to create
+        @param products          the total number of products
+        @param versions          the number of versions per product
+        @param builds            the number of builds per version
+        @param depth             the number of dependency levels in a stack
+        @param fanout            the maximum number of direct dependencies 
+                                    of a product
+        @param stackSize         the number of products in a stack
+        @param externalFraction  the fraction of each stack that are 
+                                    external products
+        @param pseudoFraction    the fraction of each stack that are 
+                                    pseudo products
+        @param tags              the names of the tag lists to create.  The 
+                                    first tags the latest version of every
+                                    product, the second the version before
+                                    that, and so on.  
+        @param seed              the seed for the random number generator
+        @param storage           the storage backend to write the server 
+                                    into (see lsstdistrib.storage).  If 
+                                    None, it is written to the local 
+                                    filesystem.
+        """
+        self.root = rootdir
+        self.nproducts = products
+        self.nversions = max(versions, 1)
+        self.nbuilds = max(builds, 1)
+        self.depth = max(depth, 1)
+        self.fanout = fanout
+        self.stackSize = max(stackSize, 1)
+        self.externalFraction = externalFraction
+        self.pseudoFraction = pseudoFraction
+        self.tags = list(tags)
+        self.seed = seed
+        self.repos = Repository(rootdir, storage)
+        self.storage = self.repos.storage
+
+        self.products = []
+        self.categories = []
+        self.deps = []
+
+    def getParameters(self):
+        """
+        return a dictionary of the parameters the server is generated with
+        """
+        return { "products": self.nproducts, "versions": self.nversions,
+                 "builds": self.nbuilds, "depth": self.depth, 
+                 "fanout": self.fanout, "stackSize": self.stackSize,
+                 "externalFraction": self.externalFraction, 
+                 "pseudoFraction": self.pseudoFraction,
+                 "tags": self.tags, "seed": self.seed }
+
+    def getVersions(self, id):
+        """
+        return the (build-less) versions of the product with the given id,
+        oldest first.
+        """
+        return map(lambda v: "%d.%d.%d" % (id % 7 + 1, v // 10, v % 10),
+                   xrange(self.nversions))
+
+    def getLatestVersion(self, id):
+        """return the latest deployed version of the product with the given id"""
+        return "%s+%d" % (self.getVersions(id)[-1], self.nbuilds)
+
+    def makeGraph(self):
+        """
+        choose the products and their dependencies.  This is called by 
+        generate() but may be called on its own to inspect the graph 
+        without writing anything.
+        """
+        rand = random.Random(self.seed)
+        self.products = []
+        self.categories = []
+        self.deps = []
+
+        for start in xrange(0, self.nproducts, self.stackSize):
+            size = min(self.stackSize, self.nproducts - start)
+            next = int(round(size * self.externalFraction))
+            npseudo = int(round(size * self.pseudoFraction))
+
+            for i in xrange(size):
+                id = start + i
+                if i < next:
+                    cat = "external"
+                elif i >= size - npseudo:
+                    cat = "pseudo"
+                else:
+                    cat = ''
+                self.products.append("%sprod%05d" % (cat[:1], id))
+                self.categories.append(cat)
+
+                # products in a level depend only on those in lower levels
+                level = i * self.depth // size
+                lower = level * size // self.depth
+                lower += (level * size % self.depth > 0)
+                if level == 0 or lower == 0:
+                    self.deps.append([])
+                    continue
+                count = rand.randint(1, min(self.fanout, lower))
+                self.deps.append(sorted(map(lambda d: start + d,
+                                            rand.sample(xrange(lower), count))))
+
+    def getClosures(self):
+        """
+        return, for each product id, the sorted list of the ids of all 
+        the products it depends on, directly or indirectly.  
+        """
+        out = []
+        for id in xrange(len(self.products)):
+            closure = set(self.deps[id])
+            for dep in self.deps[id]:
+                closure.update(out[dep])
+            out.append(sorted(closure))
+        return out
+
+    def generate(self):
+        """
+        write out the server tree.  The root directory must not already
+        contain a manifests directory.  
+        @return dict   counts of what was generated
+        """
+        mandir = self.repos.getManifestDir()
+        if self.storage.exists(mandir):
+            raise RuntimeError("Server already exists: " + self.root)
+        self.storage.makedirs(mandir)
+
+        self.makeGraph()
+        closures = self.getClosures()
+
+        count = 0
+        for id in xrange(len(self.products)):
+            count += self._writeProduct(id, closures[id])
+
+        for i in xrange(len(self.tags)):
+            self._writeTagList(self.tags[i], i)
+
+        return { "products": len(self.products), "manifests": count,
+                 "tags": len(self.tags) }
+
+    def _writeProduct(self, id, closure):
+        prodname = self.products[id]
+        pkgpath = self.categories[id] or None
+
+        # the dependency records are the same for every build
+        template = Manifest(prodname, "0")
+        for dep in closure:
+            template.addLSSTRecord(self.products[dep], 
+                                   self.getLatestVersion(dep),
+                                   self.categories[dep] or None)
+
+        count = 0
+        for version in self.getVersions(id):
+            pdir = self.repos.getProductDir(prodname, version, 
+                                            category=self.categories[id])
+            self.storage.makedirs(pdir)
+            for build in xrange(1, self.nbuilds+1):
+                fullver = "%s+%d" % (version, build)
+                man = Manifest(prodname, fullver, pkgpath)
+                for rec in template:
+                    man.addRecord(*rec)
+                man.addSelfRecord()
+
+                buf = cStringIO.StringIO()
+                man.write(buf)
+                for path in (os.path.join(pdir, "b%d.manifest" % build),
+                             self.repos.getManifestFile(prodname, fullver)):
+                    with self.storage.open(path, 'w') as fd:
+                        fd.write(buf.getvalue())
+                count += 1
+
+        return count
+
+    def _writeTagList(self, tag, age):
+        with self.storage.open(self.repos.getTagListFile(tag), 'w') as fd:
+            fd.write(tagListHeader % tag)
+            for id in xrange(len(self.products)):
+                versions = self.getVersions(id)
+                if age >= len(versions):
+                    continue
+                fd.write("%-16s generic    %-14s %s\n" % 
+                         (self.products[id], 
+                          "%s+%d" % (versions[-1-age], self.nbuilds),
+                          self.categories[id]))
@@ -0,0 +1,311 @@
+"""
+an optional SQLite catalog of the contents of a distribution server.  The
+catalog records the products (with their categories and product
+directories), the deployed builds of each version, and the records of 
+every deployed manifest, so that DeployedManifests and
+Repository can answer their queries without listing directories or
+scanning manifest files.  The main functionality is provided via the
+Catalog class.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, sqlite3, threading
+
+from . import version as onvers
+from .manifest import DeployedManifests, Manifest, manifestFilename, extension
+from .depindex import manifestSignature
+
+schemaVersion = "2"
+
+schema = """
+CREATE TABLE meta (
+    key      TEXT PRIMARY KEY,
+    value    TEXT
+);
+CREATE TABLE products (
+    name     TEXT PRIMARY KEY,
+    category TEXT NOT NULL,
+    dir      TEXT NOT NULL
+);
+CREATE TABLE deployed (
+    product  TEXT NOT NULL,
+    version  TEXT,
+    base     TEXT,
+    build    INTEGER,
+    PRIMARY KEY (product, version)
+);
+CREATE INDEX deployed_base ON deployed (product, base);
+CREATE TABLE records (
+    product    TEXT NOT NULL,
+    version    TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    pkg        TEXT NOT NULL,
+    flavor     TEXT NOT NULL,
+    pkgversion TEXT NOT NULL,
+    tablefile  TEXT,
+    installdir TEXT,
+    installid  TEXT,
+    PRIMARY KEY (product, version, seq)
+);
+CREATE INDEX records_pkg ON records (pkg, pkgversion);
+"""
+
+class Catalog(object):
+    """
+    a catalog of a distribution server's contents held in an SQLite
+    database file.
+
+    The catalog is populated in full by rebuild() (see bin/mkcatalog.py)
+    and is then kept up to date by Release.releaseAll() (via addDeployed())
+    and UpdateDependents.writeUpgradedManifest() (via noteUndeployed()),
+    each change being made in a single transaction.  The catalog records
+    the modification time of the manifests directory when it was last
+    brought up to date along with a signature of the sizes and 
+    modification times of the deployed manifests (see 
+    lsstdistrib.depindex.manifestSignature()); if the directory has 
+    changed since (e.g. because a manifest was copied in by hand) or a 
+    manifest has been rewritten in place, the catalog is considered stale,
+    and its deployed-manifest queries should not be trusted until it is
+    rebuilt.  As with DependencyIndex, the manifests themselves are 
+    checked only the first time a Catalog instance is checked.
+
+    The dependency edges of the server are the manifest records whose
+    package is not the manifest's own product.
+    """
+
+    def __init__(self, dbfile, repos):
+        """
+        open a catalog.  The database file is not opened until it is needed.
+        @param dbfile   the path to the SQLite database file
+        @param repos    the Repository the catalog describes
+        """
+        self.file = dbfile
+        self.repos = repos
+        self._local = threading.local()
+        self._conns = []
+        self._lock = threading.Lock()
+        self._checked = False
+
+    def exists(self):
+        """return True if the catalog's database file exists"""
+        return os.path.exists(self.file)
+
+    def _connect(self):
+        # each thread gets its own connection, as a connection may not be 
+        # shared between threads (e.g. the workers of a DeployEngine).  
+        # They are opened without sqlite3's same-thread check only so that
+        # close() can close them all.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.file, check_same_thread=False)
+            conn.text_factory = str
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        """close the connections to the database"""
+        with self._lock:
+            conns, self._conns = self._conns, []
+            self._local = threading.local()
+        for conn in conns:
+            conn.close()
+
+    def _mandirMtime(self):
+        return repr(os.stat(self.repos.getManifestDir()).st_mtime)
+
+    def _signature(self, prodvers):
+        # the signature of the manifest files of the given deployed products
+        return manifestSignature(self.repos.getManifestDir(),
+                                 map(_manifestFile, prodvers))
+
+    def _getMeta(self, key):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = ?",
+                                      (key,)).fetchone()
+        return row and row[0]
+
+    def _setMeta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                     (key, value))
+
+    def isCurrent(self):
+        """
+        return True if the catalog exists and reflects the current contents
+        of the manifests directory.
+        """
+        if not self.exists():
+            return False
+        try:
+            if self._getMeta("schema") != schemaVersion:
+                return False
+            if self._getMeta("mtime") != self._mandirMtime():
+                return False
+            if not self._checked:
+                if self._getMeta("signature") != \
+                   self._signature(self.listDeployed()):
+                    return False
+                self._checked = True
+            return True
+        except sqlite3.DatabaseError:
+            return False
+
+    def rebuild(self):
+        """
+        (re-)build the catalog in full from the server's contents.
+        """
+        # imported here to avoid a circular import
+        from .server import BuildNumberIndex
+
+        deployed = DeployedManifests(self.repos.getManifestDir(), cacheSize=0)
+        mtime = self._mandirMtime()
+        builds = BuildNumberIndex(self.repos, deployed)
+        builds.build()
+        prods = deployed.listAll()
+        signature = self._signature(prods)
+        mans = deployed.getManifests(filter(lambda p: p[1] is not None, prods))
+
+        # the catalog is written to a temporary file and moved into place
+        # so that readers see either the old catalog or the new one.
+        tmpfile = "%s.tmp%d" % (self.file, os.getpid())
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        conn = sqlite3.connect(tmpfile)
+        conn.text_factory = str
+        try:
+            conn.executescript(schema)
+            with conn:
+                self._setMeta(conn, "schema", schemaVersion)
+                conn.executemany("INSERT INTO products VALUES (?, ?, ?)",
+                             map(lambda p: (p[0], self._category(p[1]), p[1]),
+                                 builds.productDirs.items()))
+                for prodname, version in filter(lambda p: p[1] is None, prods):
+                    conn.execute("INSERT INTO deployed VALUES "
+                                 "(?, NULL, NULL, NULL)", (prodname,))
+                for man in mans:
+                    self._insertDeployed(conn, man)
+                self._setMeta(conn, "mtime", mtime)
+                self._setMeta(conn, "signature", signature)
+        finally:
+            conn.close()
+
+        self.close()
+        os.rename(tmpfile, self.file)
+        self._checked = True
+
+    def _category(self, pdir):
+        parent = os.path.dirname(pdir)
+        if parent == self.repos.getExternalProductRoot():
+            return self.repos.externalDirName
+        if parent == self.repos.getPseudoProductRoot():
+            return self.repos.pseudoDirName
+        return ''
+
+    def _insertDeployed(self, conn, man):
+        v = onvers.Version(man.vers)
+        build = None
+        if v.qualifier == '+':
+            build = v.build
+        conn.execute("DELETE FROM records WHERE product = ? AND version = ?",
+                     (man.name, man.vers))
+        conn.execute("INSERT OR REPLACE INTO deployed VALUES (?, ?, ?, ?)",
+                     (man.name, man.vers, onvers.baseVersion(man.vers), build))
+        rows = []
+        for rec in man:
+            if rec[0] != '#':
+                rows.append((man.name, man.vers, len(rows)) + tuple(rec))
+        conn.executemany("INSERT INTO records VALUES (?,?,?,?,?,?,?,?,?)", rows)
+
+    def addDeployed(self, prodvers, restamp=True):
+        """
+        add newly deployed manifests to the catalog in a single
+        transaction.
+        @param prodvers   a list of product-version pairs for the manifests
+                            just copied into the manifests directory
+        @param restamp    if True, mark the catalog as reflecting the
+                            current manifests directory.  This should be
+                            False if the catalog was stale before the
+                            manifests were deployed.
+        """
+        deployed = DeployedManifests(self.repos.getManifestDir(), cacheSize=0)
+        mans = deployed.getManifests(prodvers)
+        conn = self._connect()
+        with conn:
+            for man in mans:
+                self._insertDeployed(conn, man)
+            if restamp:
+                self._setMeta(conn, "mtime", self._mandirMtime())
+                self._setMeta(conn, "signature", self._signature(
+                    conn.execute("SELECT product, version FROM deployed")))
+        if restamp:
+            self._checked = True
+
+    def noteUndeployed(self, prodname, version, build):
+        """
+        record that an undeployed manifest for the given build has been
+        written into its product directory:  a product new to the server
+        is added with its product directory (so that getProductDir() finds
+        it).  The build numbers of undeployed manifests are not catalogued,
+        as tools that do not update the catalog write them too; see 
+        BuildNumberIndex.
+        @param prodname   the name of the product
+        @param version    the version of the product
+        @param build      the build number of the manifest
+        """
+        conn = self._connect()
+        with conn:
+            row = conn.execute("SELECT 1 FROM products WHERE name = ?",
+                               (prodname,)).fetchone()
+            if not row:
+                pdir = self.repos.getProductDir(prodname)
+                conn.execute("INSERT INTO products VALUES (?, ?, ?)",
+                             (prodname, self._category(pdir), pdir))
+
+    def listDeployed(self):
+        """
+        return all deployed products as product-version pairs (as with
+        DeployedManifests.listAll()).
+        """
+        return self._connect().execute(
+            "SELECT product, version FROM deployed").fetchall()
+
+    def getProductDir(self, prodname):
+        """
+        return the product directory (without a version) of the given
+        product, or None if the product is not in the catalog.
+        """
+        row = self._connect().execute("SELECT dir FROM products WHERE name = ?",
+                                      (prodname,)).fetchone()
+        return row and row[0]
+
+    def dependents(self, prodnames, version=None, flavor=None):
+        """
+        return the deployed manifests containing records for any of the
+        given products.
+        @param prodnames  the names of the products of interest
+        @param version    if not None, match only records for this version
+        @param flavor     if not None, match only records for this flavor
+        @return list   (product, dependent, dependent_version) tuples, one
+                          for each matching manifest
+        """
+        prodnames = list(prodnames)
+        if not prodnames:
+            return []
+        sql = "SELECT DISTINCT pkg, product, version FROM records " \
+              "WHERE pkg IN (%s)" % ",".join("?" * len(prodnames))
+        args = prodnames
+        if version:
+            sql += " AND pkgversion = ?"
+            args.append(version)
+        if flavor:
+            sql += " AND flavor = ?"
+            args.append(flavor)
+        return self._connect().execute(sql, args).fetchall()
+
+def _manifestFile(prodver):
+    # the name of the deployed manifest file for a product-version pair
+    # as listed by DeployedManifests.listAll()
+    if prodver[1] is None:
+        return prodver[0] + extension
+    return manifestFilename(*prodver)
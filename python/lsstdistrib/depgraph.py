@@ -0,0 +1,269 @@
+"""
+a module for representing the dependencies between products as a directed
+graph and for putting products into dependency order.  The main
+functionality is provided via the DependencyGraph class.
+"""
+from __future__ import absolute_import
+
+import sys, os, heapq
+
+class DependencyCycleError(RuntimeError):
+    """
+    an exception indicating that a set of products cannot be put into
+    dependency order because some of them depend on each other.
+    """
+
+    def __init__(self, products, msg=None):
+        """
+        @param products   the products making up the cycle, in dependency
+                            order (each depends on the one that follows it,
+                            and the last depends on the first)
+        """
+        if not msg:
+            msg = "Dependency cycle found among products: " + \
+                  " -> ".join(list(products) + products[:1])
+        RuntimeError.__init__(self, msg)
+        self.products = products
+
+class DependencyGraph(object):
+    """
+    a directed graph of products in which an edge from one product to
+    another indicates that the first depends on the second.  Products are
+    numbered in the order they are added, and this order is used to break
+    ties when sorting, so results are deterministic.
+
+    The transitive dependencies and dependents of every product are held 
+    as integer bitsets (bit i set for the product with id i).  They are 
+    computed for the whole graph in a single pass the first time a 
+    closure query is made and are reused until the graph is changed.
+    """
+
+    def __init__(self):
+        self.products = []
+        self._ids = {}
+        self._deps = []
+        self._rdeps = []
+        self._closure = None
+        self._rclosure = None
+
+    def __len__(self):
+        return len(self.products)
+
+    def __contains__(self, prodname):
+        return prodname in self._ids
+
+    def hasProduct(self, prodname):
+        """return True if the product is a node in this graph"""
+        return prodname in self._ids
+
+    def addProduct(self, prodname):
+        """
+        add a product to the graph if it is not already there and return
+        its integer id.
+        """
+        id = self._ids.get(prodname)
+        if id is None:
+            id = len(self.products)
+            self._ids[prodname] = id
+            self.products.append(prodname)
+            self._deps.append(set())
+            self._rdeps.append(set())
+            self._closure = self._rclosure = None
+        return id
+
+    def addDependency(self, prodname, depname):
+        """
+        record that one product depends on another, adding either product
+        to the graph as necessary.
+        @param prodname   the name of the dependent product
+        @param depname    the name of the product it depends on
+        """
+        id = self.addProduct(prodname)
+        did = self.addProduct(depname)
+        if id != did and did not in self._deps[id]:
+            self._deps[id].add(did)
+            self._rdeps[did].add(id)
+            self._closure = self._rclosure = None
+
+    def addManifest(self, manifest, prodname=None, restrictTo=None):
+        """
+        add the dependencies described by a manifest:  the product is taken
+        to depend on every other product listed in its manifest.
+        @param manifest    the Manifest instance
+        @param prodname    the name of the product the manifest is for.  If
+                             None, the manifest's own name is used.
+        @param restrictTo  if not None, a collection of product names; only
+                             dependencies on these products will be added.
+        """
+        if not prodname:
+            prodname = manifest.name
+        self.addProduct(prodname)
+        for rec in manifest:
+            name = rec[0]
+            if name == '#' or name == prodname:
+                continue
+            if restrictTo is not None and name not in restrictTo:
+                continue
+            self.addDependency(prodname, name)
+
+    def getDependencies(self, prodname):
+        """return the names of the products the given one directly depends on"""
+        return map(lambda i: self.products[i],
+                   sorted(self._deps[self._ids[prodname]]))
+
+    def getDependents(self, prodname):
+        """return the names of the products that directly depend on the given one"""
+        return map(lambda i: self.products[i],
+                   sorted(self._rdeps[self._ids[prodname]]))
+
+    def getAllDependencies(self, prodname):
+        """
+        return the names of all the products the given one depends on, 
+        directly or indirectly, in the order they were added to the graph.
+        """
+        if self._closure is None:
+            self._closure = self._closures(self._deps)
+        return self._names(self._closure[self._ids[prodname]])
+
+    def getAllDependents(self, prodname):
+        """
+        return the names of all the products that depend on the given one, 
+        directly or indirectly, in the order they were added to the graph.
+        """
+        if self._rclosure is None:
+            self._rclosure = self._closures(self._rdeps)
+        return self._names(self._rclosure[self._ids[prodname]])
+
+    def dependsOn(self, prodname, depname):
+        """
+        return True if the first product depends on the second, directly 
+        or indirectly.
+        """
+        if self._closure is None:
+            self._closure = self._closures(self._deps)
+        return bool(self._closure[self._ids[prodname]] >> self._ids[depname] & 1)
+
+    def getAffected(self, prodnames):
+        """
+        return the names of the products that would need to be rebuilt if
+        any of the given products changed--i.e. all of their transitive 
+        dependents, excluding the given products themselves--in dependency 
+        order.
+        """
+        if self._rclosure is None:
+            self._rclosure = self._closures(self._rdeps)
+        bits = 0
+        given = 0
+        for prodname in prodnames:
+            id = self._ids[prodname]
+            bits |= self._rclosure[id]
+            given |= 1 << id
+        return self.sort(self._names(bits & ~given))
+
+    def _names(self, bits):
+        # return the names of the products whose bits are set, in id order
+        return [self.products[i] 
+                for i, b in enumerate(bin(bits)[:1:-1]) if b == '1']
+
+    def _closures(self, adj):
+        # return the transitive closure of the given adjacency sets as a 
+        # list of bitsets.  The strongly connected components are found 
+        # with (an iterative form of) Tarjan's algorithm, which completes 
+        # each component after all those it leads to, so each closure can
+        # be assembled from the finished closures of its neighbors.  The
+        # members of a cycle share a closure (less their own bits).
+        n = len(adj)
+        closure = [0] * n
+        index = [None] * n
+        low = [0] * n
+        onstack = [False] * n
+        stack = []
+        count = 0
+        for root in xrange(n):
+            if index[root] is not None:
+                continue
+            index[root] = low[root] = count
+            count += 1
+            stack.append(root)
+            onstack[root] = True
+            work = [(root, iter(adj[root]))]
+            while work:
+                id, todo = work[-1]
+                for nid in todo:
+                    if index[nid] is None:
+                        index[nid] = low[nid] = count
+                        count += 1
+                        stack.append(nid)
+                        onstack[nid] = True
+                        work.append((nid, iter(adj[nid])))
+                        break
+                    elif onstack[nid]:
+                        low[id] = min(low[id], index[nid])
+                else:
+                    work.pop()
+                    if work:
+                        pid = work[-1][0]
+                        low[pid] = min(low[pid], low[id])
+                    if low[id] == index[id]:
+                        members = []
+                        while True:
+                            mid = stack.pop()
+                            onstack[mid] = False
+                            members.append(mid)
+                            if mid == id:
+                                break
+                        bits = 0
+                        for mid in members:
+                            for nid in adj[mid]:
+                                bits |= closure[nid] | (1 << nid)
+                        for mid in members:
+                            closure[mid] = bits & ~(1 << mid)
+        return closure
+
+    def sort(self, products=None):
+        """
+        return the products in dependency order, such that no product
+        depends on one that follows it, using Kahn's algorithm.  Among
+        products whose dependencies have all been placed, the one added to
+        the graph earliest comes first.
+        @param products   if not None, sort only these products, considering
+                            only the dependencies among them.
+        @throws DependencyCycleError  if the products cannot be ordered
+        """
+        if products is None:
+            ids = set(xrange(len(self.products)))
+        else:
+            ids = set(map(lambda p: self._ids[p], products))
+
+        remaining = {}
+        for id in ids:
+            remaining[id] = len(self._deps[id] & ids)
+        ready = filter(lambda id: remaining[id] == 0, ids)
+        heapq.heapify(ready)
+
+        out = []
+        while ready:
+            id = heapq.heappop(ready)
+            out.append(self.products[id])
+            for rid in self._rdeps[id]:
+                if rid in remaining:
+                    remaining[rid] -= 1
+                    if remaining[rid] == 0:
+                        heapq.heappush(ready, rid)
+            del remaining[id]
+
+        if remaining:
+            raise DependencyCycleError(self._findCycle(remaining))
+        return out
+
+    def _findCycle(self, ids):
+        # walk dependencies within the given (unsortable) set of nodes until
+        # a node is revisited; every node in the set has a dependency in it.
+        path = []
+        onpath = {}
+        id = min(ids)
+        while id not in onpath:
+            onpath[id] = len(path)
+            path.append(id)
+            id = min(filter(lambda d: d in ids, self._deps[id]))
+        return map(lambda i: self.products[i], path[onpath[id]:])
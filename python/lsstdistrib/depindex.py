@@ -0,0 +1,266 @@
+"""
+an on-disk reverse-dependency index over the latest deployed manifests.
+The index lets DeployedManifests.dependsOn() answer its queries without
+rescanning the manifests directory.  The main functionality is provided
+via the DependencyIndex class.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, hashlib
+
+headerLineMagic = "servertools dependency index"
+defaultIndexHeader = headerLineMagic + " for %s. Version 1.0\n"
+mtimeLineMagic = "# mtime: "
+signatureLineMagic = "# signature: "
+
+def manifestSignature(mandir, filenames):
+    """
+    return a digest of the sizes and modification times of the given 
+    manifest files, which changes if any of them is rewritten (even in 
+    place, which does not change the modification time of the directory).
+    A missing file contributes a marker of its absence.
+    @param mandir      the manifests directory
+    @param filenames   the names of the files within mandir
+    """
+    sig = hashlib.md5()
+    for filename in sorted(filenames):
+        try:
+            st = os.stat(os.path.join(mandir, filename))
+            stamp = "%d %r" % (st.st_size, st.st_mtime)
+        except OSError:
+            stamp = "-"
+        sig.update("%s %s\n" % (filename, stamp))
+    return sig.hexdigest()
+
+class DependencyIndex(object):
+    """
+    a reverse-dependency index of the latest deployed manifests.  For each
+    product that appears as a record in one of the latest manifests, the
+    index holds the dependents (the products whose manifests contain that
+    record) along with the flavor and version of the record.
+
+    On disk, the index is a simple text file with one line per manifest
+    record of the form:
+
+       dependent dependent_version pkg flavor version
+
+    A manifest with no records is recorded with a two-column line giving
+    only its product and version.  The header records the modification
+    time of the manifests directory at the time the index was written 
+    along with a signature of the sizes and modification times of the 
+    indexed manifest files; if the directory has changed since (e.g. 
+    because a manifest was copied in by hand) or any of the indexed 
+    manifests has been rewritten in place, the index is considered stale.
+    The directory is checked on every query; as checking the manifests 
+    means a stat of each of them, they are checked only the first time the
+    index is checked after it is loaded, so a manifest rewritten in place 
+    after that is noticed only by a new DependencyIndex.
+    """
+
+    def __init__(self, indexfile, deployed):
+        """
+        create an index stored in a given file.  The index is not loaded
+        until it is needed.
+        @param indexfile   the path to the file to store the index in
+        @param deployed    the DeployedManifests instance the index
+                              describes
+        """
+        self.file = indexfile
+        self.deployed = deployed
+        self.latest = None
+        self.recs = None
+        self.rdeps = None
+        self.mtime = None
+        self.signature = None
+        self._checked = False
+
+    def _clear(self):
+        self.latest = {}
+        self.recs = {}
+        self.rdeps = {}
+        self.mtime = None
+        self.signature = None
+        self._checked = False
+
+    def _mandirMtime(self):
+        return repr(os.stat(self.deployed.dir).st_mtime)
+
+    def _signature(self, prodvers):
+        # the signature of the manifest files of the given product-version 
+        # pairs
+        return manifestSignature(self.deployed.dir, 
+                  map(lambda p: self.deployed.manifestFilename(*p), prodvers))
+
+    def isLoaded(self):
+        """return True if the index data is currently held in memory"""
+        return self.latest is not None
+
+    def isStale(self):
+        """
+        return True if the manifests directory or any of the indexed 
+        manifests has changed since the index was last written or loaded.
+        The indexed manifests are only checked the first time after the
+        index is loaded.
+        """
+        if self.mtime is None or self.mtime != self._mandirMtime():
+            return True
+        if not self._checked:
+            if self.signature != self._signature(self.latest.items()):
+                return True
+            self._checked = True
+        return False
+
+    def load(self):
+        """
+        load the index from its file.
+        @return bool   True if the index was loaded and is current; False
+                         if the file does not exist or is stale.
+        """
+        self._clear()
+        if not os.path.exists(self.file):
+            return False
+
+        with open(self.file) as fd:
+            line = fd.readline()
+            if not line.startswith(headerLineMagic):
+                raise RuntimeError(self.file + ": not a dependency index file")
+            for line in fd:
+                if line.startswith(mtimeLineMagic):
+                    self.mtime = line[len(mtimeLineMagic):].strip()
+                    continue
+                if line.startswith(signatureLineMagic):
+                    self.signature = line[len(signatureLineMagic):].strip()
+                    continue
+                if line.startswith('#'):
+                    continue
+                parts = line.split()
+                if len(parts) < 2:
+                    continue
+                self.latest[parts[0]] = parts[1]
+                if len(parts) >= 5:
+                    self._addRecord(parts[0], parts[1], *parts[2:5])
+
+        return not self.isStale()
+
+    def _addRecord(self, prodname, version, pkg, flavor, pkgversion):
+        self.recs.setdefault(prodname, []).append((pkg, flavor, pkgversion))
+        self.rdeps.setdefault(pkg, []).append((flavor, pkgversion,
+                                               prodname, version))
+
+    def _addManifest(self, prodname, version, man=None):
+        self.latest[prodname] = version
+        if man is None:
+            man = self.deployed.getManifest(prodname, version)
+        for rec in man:
+            if rec[0] != '#':
+                self._addRecord(prodname, version, *rec[:3])
+
+    def _removeManifest(self, prodname):
+        self.latest.pop(prodname, None)
+        for pkg in set(map(lambda r: r[0], self.recs.pop(prodname, []))):
+            keep = filter(lambda r: r[2] != prodname, self.rdeps[pkg])
+            if keep:
+                self.rdeps[pkg] = keep
+            else:
+                del self.rdeps[pkg]
+
+    def ensureCurrent(self, save=True):
+        """
+        make sure the in-memory index reflects the manifests directory,
+        loading it from disk or rebuilding it as necessary.
+        @param save   if True, save a rebuilt index to its file.  A failure
+                         to write the file is ignored.
+        """
+        if self.isLoaded() and not self.isStale():
+            return
+        if not self.load():
+            self.rebuild()
+            if save:
+                try:
+                    self.save()
+                except (IOError, OSError):
+                    pass
+
+    def rebuild(self):
+        """
+        rebuild the index in full from the latest deployed manifests.  The
+        index is not saved to disk; call save() to do this.
+        """
+        self._clear()
+        mtime = self._mandirMtime()
+        latest = self.deployed.latestProducts()
+        signature = self._signature(latest)
+        for prod, man in zip(latest, self.deployed.getManifests(latest)):
+            self._addManifest(prod[0], prod[1], man)
+        self.mtime = mtime
+        self.signature = signature
+        self._checked = True
+
+    def update(self, prodvers):
+        """
+        incrementally update the index to account for newly deployed
+        manifests.  A manifest replaces the indexed one for its product
+        only if its version is later.  The index is not saved to disk; call
+        save() to do this.
+        @param prodvers   a list of product-version pairs for the newly
+                             deployed manifests
+        """
+        if not self.isLoaded():
+            self.ensureCurrent(False)
+        vcmp = self.deployed.vcmp
+        for prodname, version in prodvers:
+            current = self.latest.get(prodname)
+            if current is not None:
+                if current != version and vcmp(version, current) <= 0:
+                    continue
+                self._removeManifest(prodname)
+            self._addManifest(prodname, version)
+        self.mtime = self._mandirMtime()
+        self.signature = self._signature(self.latest.items())
+        self._checked = True
+
+    def save(self):
+        """
+        write the index out to its file.  The file is first written to a
+        temporary file and then moved into place.
+        """
+        if not self.isLoaded():
+            raise RuntimeError("dependency index not loaded")
+
+        tmpfile = "%s.tmp%d" % (self.file, os.getpid())
+        with open(tmpfile, 'w') as fd:
+            fd.write(defaultIndexHeader % self.deployed.dir)
+            fd.write("%s%s\n" % (mtimeLineMagic, self.mtime))
+            fd.write("%s%s\n" % (signatureLineMagic, self.signature))
+            for prodname in sorted(self.latest.keys()):
+                version = self.latest[prodname]
+                recs = self.recs.get(prodname)
+                if not recs:
+                    fd.write("%s %s\n" % (prodname, version))
+                    continue
+                for rec in recs:
+                    fd.write("%s %s %s %s %s\n" % ((prodname, version) + rec))
+        os.rename(tmpfile, self.file)
+
+    def dependsOn(self, prodname, version=None, flavor=None):
+        """
+        return a list of product-version pairs of the latest products whose
+        manifests include the given product.  The pairs are ordered by
+        product name.
+        @param prodname   the name of the product
+        @param version    if not None, restrict the matches to records for
+                             this version
+        @param flavor     if not None, restrict the matches to records for
+                             this flavor
+        """
+        self.ensureCurrent()
+        out = {}
+        for rflav, rvers, dep, depver in self.rdeps.get(prodname, []):
+            if flavor and rflav != flavor:
+                continue
+            if version and rvers != version:
+                continue
+            out[dep] = depver
+        return map(lambda p: (p, out[p]), sorted(out.keys()))
+
@@ -0,0 +1,208 @@
+"""
+a module for deploying files within a distribution server.  Because the
+product directories and the manifests directory are on the same
+filesystem, a file can usually be deployed without copying its contents:
+by hard-linking it or, where the filesystem supports it, by cloning it
+(a "reflink").  Otherwise, it is copied, with os.sendfile() where that is
+available.  The main functionality is provided via the DeployEngine class.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, errno, shutil, time, threading
+
+from .storage import defaultStorage
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+defaultThreads = 8
+
+# the Linux ioctl request for cloning a file's contents
+FICLONE = 0x40049409
+
+# the buffer used when copying files.  Python 2 has no os.sendfile(), so the
+# copy goes through user space; a buffer much larger than copyfileobj()'s
+# 16k default cuts the number of read/write calls for the large files
+# (libraries, data) that make up most of a deployed tree.
+COPYBUFSIZE = 1024*1024
+
+# the errors that indicate a deployment method is not supported for a
+# particular pair of files, so that the next method should be tried.
+fallbackErrors = set(filter(lambda e: e is not None,
+                            map(lambda n: getattr(errno, n, None),
+                                ["EXDEV", "EPERM", "EMLINK", "ENOTSUP",
+                                 "EOPNOTSUPP", "EINVAL", "ENOTTY", "ENOSYS",
+                                 "EBADF", "EACCES"])))
+
+class DeployEngine(object):
+    """
+    a deployer of files into place, doing its work on a bounded pool of
+    threads.  Each file is deployed with the first of the engine's methods
+    that works for it:
+       link     a hard link.  The deployed file shares its contents with
+                   its source, so neither should be modified in place
+                   afterward (which the tools in this package never do).
+       reflink  a copy-on-write clone of the source, where the filesystem
+                   supports it (e.g. btrfs or XFS on Linux)
+       copy     a copy of the contents, via os.sendfile() where available
+    If the storage is not the local filesystem, files are always copied
+    via the storage backend.
+    """
+    methods = ("link", "reflink", "copy")
+
+    def __init__(self, storage=None, threads=defaultThreads, methods=None):
+        """
+        @param storage   the storage backend holding the files (see
+                           lsstdistrib.storage).  If None, the local
+                           filesystem is used.
+        @param threads   the maximum number of threads to use.  If 1 or
+                           less, all work is done in the calling thread.
+        @param methods   the deployment methods to try, in order.  If None,
+                           all methods are tried in the order given by the
+                           methods class attribute.
+        """
+        self.storage = storage or defaultStorage
+        self.threads = threads
+        if methods is not None:
+            for method in methods:
+                if method not in DeployEngine.methods:
+                    raise ValueError("Unknown deployment method: " + method)
+            self.methods = tuple(methods)
+
+    def map(self, func, items):
+        """
+        apply a function to each of a list of items on the thread pool and
+        return the results in order.  An exception raised by the function
+        is raised again here.
+        """
+        items = list(items)
+        threads = min(self.threads or 1, len(items))
+        if threads <= 1:
+            return map(func, items)
+
+        # (multiprocessing's ThreadPool is not used as shutting it down
+        # takes a tenth of a second.)
+        results = [None] * len(items)
+        errors = []
+        todo = iter(xrange(len(items)))
+        lock = threading.Lock()
+        def work():
+            while True:
+                with lock:
+                    i = next(todo, None)
+                if i is None:
+                    return
+                try:
+                    results[i] = func(items[i])
+                except Exception:
+                    errors.append( (i, sys.exc_info()) )
+
+        workers = map(lambda i: threading.Thread(target=work), xrange(threads))
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if errors:
+            exc = min(errors)[1]
+            raise exc[0], exc[1], exc[2]
+        return results
+
+    def exists(self, paths):
+        """return a list of flags indicating which of the given paths exist"""
+        return self.map(self.storage.exists, paths)
+
+    def deployAll(self, pairs, overwrite=False):
+        """
+        deploy a list of files on the thread pool.
+        @param pairs      a list of (source, destination) path pairs
+        @param overwrite  if True, replace destinations that already exist
+        @return list   a (method, seconds, error) triple for each pair, in
+                          order, giving the method used, the time taken,
+                          and, if the deployment failed, the exception
+                          (an EnvironmentError) raised; otherwise, the
+                          error is None.
+        """
+        return self.map(lambda p: self._tryDeploy(p[0], p[1], overwrite),
+                        pairs)
+
+    def _tryDeploy(self, src, dest, overwrite):
+        start = time.time()
+        try:
+            method = self.deploy(src, dest, overwrite)
+            return (method, time.time() - start, None)
+        except EnvironmentError, ex:
+            return (None, time.time() - start, ex)
+
+    def deploy(self, src, dest, overwrite=False):
+        """
+        deploy a single file and return the name of the method used.
+        @param src        the path to the file to deploy
+        @param dest       the path to deploy it to
+        @param overwrite  if True, replace the destination if it exists;
+                            otherwise, fail if it does.  A replacement is
+                            made by renaming a new file over the old one.
+        @throws EnvironmentError  if the file could not be deployed
+        """
+        if not self.storage.isLocal():
+            if not overwrite and self.storage.exists(dest):
+                raise OSError(errno.EEXIST, "File exists", dest)
+            self.storage.copy(src, dest)
+            return "copy"
+
+        target = dest
+        if overwrite:
+            target = "%s.tmp%d-%d" % (dest, os.getpid(),
+                                      threading.current_thread().ident)
+            if os.path.lexists(target):
+                os.remove(target)
+
+        for i in xrange(len(self.methods)):
+            method = self.methods[i]
+            try:
+                _deployers[method](src, target)
+                break
+            except EnvironmentError, ex:
+                if i+1 >= len(self.methods) or ex.errno not in fallbackErrors:
+                    raise
+
+        if target != dest:
+            os.rename(target, dest)
+        return method
+
+def _link(src, dest):
+    os.link(src, dest)
+
+def _createExclusive(dest, src):
+    # create a new file, failing if it exists
+    mode = os.stat(src).st_mode & 0777
+    return os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+
+def _reflink(src, dest):
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "reflinks not supported")
+    with open(src, 'rb') as infd:
+        outfd = _createExclusive(dest, src)
+        try:
+            fcntl.ioctl(outfd, FICLONE, infd.fileno())
+        except EnvironmentError:
+            os.close(outfd)
+            os.remove(dest)
+            raise
+        os.close(outfd)
+
+def _copy(src, dest):
+    with open(src, 'rb') as infd:
+        outfd = _createExclusive(dest, src)
+        try:
+            with os.fdopen(os.dup(outfd), 'wb') as out:
+                shutil.copyfileobj(infd, out, COPYBUFSIZE)
+        except EnvironmentError:
+            os.close(outfd)
+            os.remove(dest)
+            raise
+        os.close(outfd)
+
+_deployers = { "link": _link, "reflink": _reflink, "copy": _copy }
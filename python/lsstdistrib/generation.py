@@ -0,0 +1,100 @@
+"""
+a module for the generation marker of a manifests directory.  The marker
+is a small file holding an integer that is incremented before and after
+the manifests directory is changed as a batch (see
+Release.releaseAll()):  an odd value means that a change is in progress.
+A reader that notes the generation before reading the directory and checks
+that it is unchanged (and even) afterward knows that it saw either the
+whole of the old set of manifests or the whole of the new set.  The main
+functionality is provided via the GenerationMarker class.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, time
+
+from .storage import defaultStorage
+
+markerFileName = ".generation"
+
+class GenerationMarker(object):
+    """
+    the generation marker for a directory.
+    """
+
+    def __init__(self, dir, storage=None):
+        """
+        @param dir       the directory whose changes are marked
+        @param storage   the storage backend holding the directory (see
+                            lsstdistrib.storage).  If None, the local
+                            filesystem is used.
+        """
+        self.file = os.path.join(dir, markerFileName)
+        self.storage = storage or defaultStorage
+
+    def read(self):
+        """
+        return the current generation, or 0 if the marker does not exist
+        """
+        try:
+            return int(self.storage.read(self.file).strip() or 0)
+        except (IOError, OSError):
+            return 0
+        except ValueError:
+            # caught mid-write on a backend without atomic replacement
+            return 1
+
+    def _write(self, generation):
+        if self.storage.isLocal():
+            # written in full before it is renamed into place, so that
+            # readers always see a complete value
+            tmpfile = "%s.tmp%d" % (self.file, os.getpid())
+            with open(tmpfile, 'w') as fd:
+                print >> fd, generation
+            os.rename(tmpfile, self.file)
+        else:
+            with self.storage.open(self.file, 'w') as fd:
+                print >> fd, generation
+        return generation
+
+    def begin(self):
+        """
+        mark the start of a change and return the new (odd) generation.
+        If a previous change was left unfinished, it is superseded.
+        """
+        generation = self.read()
+        return self._write(generation + 1 + generation % 2)
+
+    def end(self):
+        """
+        mark the end of a change and return the new (even) generation.
+        """
+        generation = self.read()
+        return self._write(generation + generation % 2)
+
+    def isStable(self, generation):
+        """return True if the given generation has no change in progress"""
+        return generation % 2 == 0
+
+    def consistent(self, func, timeout=10.0, interval=0.01):
+        """
+        call a function that reads the directory and return its result,
+        retrying as needed so that the result reflects a single generation.
+        @param func      the function to call (with no arguments)
+        @param timeout   the number of seconds to wait for a change in
+                           progress to finish.  After this, the result of a
+                           last call is returned regardless (so that a
+                           change left unfinished by a crashed process does
+                           not block readers forever).
+        @param interval  the number of seconds to wait between tries
+        """
+        deadline = time.time() + timeout
+        while True:
+            generation = self.read()
+            if self.isStable(generation):
+                out = func()
+                if self.read() == generation:
+                    return out
+            if time.time() > deadline:
+                return func()
+            time.sleep(interval)
@@ -0,0 +1,229 @@
+"""
+a module for the write-ahead journal of an up-rev or release run.  Before
+a run changes anything on the server, it records in the journal the full
+set of steps it plans to take--the manifests that UpdateDependents will
+write and the files that Release will deploy--and then records each step
+as it completes.  An interrupted run can then be resumed from the journal
+without recomputing its plan or rescanning the server's manifests, and the
+steps of a run can be undone without working out again what it did.  The
+main functionality is provided via the ReleaseJournal class.
+
+The journal is a text file with one JSON-encoded entry per line, each
+flushed to disk before the step it describes is taken, so that a journal
+left by a crashed run is complete up to (at most) a partially written last
+line, which is ignored.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, json
+
+from .storage import defaultStorage
+from .generation import GenerationMarker
+
+# the kinds of steps journaled
+UPREV   = "uprev"      # undeployed manifests written into product directories
+RELEASE = "release"    # manifests deployed into the manifests directory
+
+class ReleaseJournal(object):
+    """
+    a write-ahead journal of the steps of a run.  Each kind of step (UPREV
+    or RELEASE) is planned once, as a list of items, each a dictionary
+    describing one file to be created and holding at least the key "file",
+    its path.  An UPREV item also holds the full text of the manifest
+    ("text"); a RELEASE item, the path of the file being deployed ("src").
+    The journal itself is always kept on the local filesystem.
+    """
+
+    def __init__(self, filename):
+        """
+        open a journal, loading its entries if the file exists
+        @param filename   the path to the journal file
+        """
+        self.file = filename
+        self.plans = {}
+        self.done = {}
+        self.replaced = set()
+        self.load()
+
+    def load(self):
+        """
+        (re-)load the journal's entries from its file
+        """
+        self.plans = {}
+        self.done = {}
+        self.replaced = set()
+        if not os.path.exists(self.file):
+            return
+        with open(self.file) as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line, object_hook=_encode)
+                except ValueError:
+                    # the last entry of a crashed run
+                    break
+                self._apply(entry)
+
+    def _apply(self, entry):
+        op = entry["op"]
+        if op == "plan":
+            self.plans[entry["step"]] = entry["items"]
+            self.done[entry["step"]] = []
+        elif op == "done":
+            self.done.setdefault(entry["step"], []).extend(entry["files"])
+            if entry.get("replaced"):
+                self.replaced.update(entry["replaced"])
+        elif op == "undone":
+            undone = set(entry["files"])
+            for step in self.done:
+                self.done[step] = filter(lambda f: f not in undone,
+                                         self.done[step])
+
+    def _append(self, entry):
+        # the entry is on disk before this returns
+        with open(self.file, 'a') as fd:
+            fd.write(json.dumps(entry) + "\n")
+            fd.flush()
+            os.fsync(fd.fileno())
+        self._apply(entry)
+
+    def exists(self):
+        """return True if the journal file exists"""
+        return os.path.exists(self.file)
+
+    def getPlan(self, step):
+        """
+        return the list of items planned for the given kind of step or
+        None if that step has not been planned.
+        """
+        return self.plans.get(step)
+
+    def plan(self, step, items):
+        """
+        record the plan for a kind of step.  This must be called before
+        any of the items are carried out.
+        @param step    the kind of step (UPREV or RELEASE)
+        @param items   the list of item dictionaries
+        """
+        if step in self.plans:
+            raise RuntimeError("%s: %s step already planned" % (self.file, step))
+        self._append({"op": "plan", "step": step, 
+                      "items": map(lambda i: _encode(dict(i)), items)})
+
+    def noteDone(self, step, files, replaced=None):
+        """
+        record that items of a planned step have been carried out.
+        @param step      the kind of step
+        @param files     the paths of the files created
+        @param replaced  the paths among files that replaced existing files
+        """
+        if not files:
+            return
+        entry = {"op": "done", "step": step, "files": list(files)}
+        if replaced:
+            entry["replaced"] = list(replaced)
+        self._append(entry)
+
+    def isDone(self, step, filename):
+        """return True if the item creating the given file has been done"""
+        return filename in self.done.get(step, [])
+
+    def getPending(self, step):
+        """return the planned items of a step that have not been done"""
+        done = set(self.done.get(step, []))
+        return filter(lambda i: i["file"] not in done, self.plans.get(step, []))
+
+    def isComplete(self, step):
+        """return True if the step was planned and all of its items done"""
+        return step in self.plans and not self.getPending(step)
+
+    def isCarriedOut(self, step, item, storage=None):
+        """
+        return True if the file of a planned item exists with the contents
+        the item calls for.  This detects an item carried out by a run that
+        was interrupted before it could record it as done.
+        """
+        storage = storage or defaultStorage
+        try:
+            if not storage.exists(item["file"]):
+                return False
+            if step == UPREV:
+                return storage.read(item["file"]) == item["text"]
+            if storage.isLocal():
+                st1, st2 = os.stat(item["src"]), os.stat(item["file"])
+                if (st1.st_dev, st1.st_ino) == (st2.st_dev, st2.st_ino):
+                    return True
+            return storage.read(item["file"]) == storage.read(item["src"])
+        except EnvironmentError:
+            return False
+
+    def undo(self, storage=None, log=None):
+        """
+        undo the steps of the run, latest first:  remove the manifests
+        deployed into the manifests directory (under the directory's
+        generation marker; see lsstdistrib.generation), and then the
+        manifests written into the product directories.  A deployed file
+        that replaced an existing one cannot be restored and is left in
+        place.
+        @param storage   the storage backend holding the server's files.
+                           If None, the local filesystem is used.
+        @param log       a file stream to report messages to
+        @return list   the paths of the files removed
+        """
+        storage = storage or defaultStorage
+        removed = []
+        for step in (RELEASE, UPREV):
+            done = set(self.done.get(step, []))
+            items = filter(lambda i: i["file"] in done or
+                                     self.isCarriedOut(step, i, storage),
+                           self.plans.get(step, []))
+            items.reverse()
+            if not items:
+                continue
+
+            undone = []
+            marker = None
+            if step == RELEASE:
+                marker = GenerationMarker(os.path.dirname(items[0]["file"]),
+                                          storage)
+                marker.begin()
+            try:
+                for item in items:
+                    if item["file"] in self.replaced:
+                        if log:
+                            print >> log, "Can't restore replaced file:", \
+                                item["file"]
+                        continue
+                    if storage.exists(item["file"]):
+                        storage.remove(item["file"])
+                    undone.append(item["file"])
+                    if log:
+                        print >> log, "Removed", item["file"]
+            finally:
+                if marker:
+                    marker.end()
+                if undone:
+                    self._append({"op": "undone", "files": undone})
+                removed.extend(undone)
+
+        return removed
+
+    def remove(self):
+        """delete the journal file"""
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        self.plans = {}
+        self.done = {}
+        self.replaced = set()
+
+def _encode(obj):
+    # the json module decodes strings as unicode; paths and manifest text
+    # are handled as (UTF-8) byte strings throughout this package.
+    for key, value in obj.items():
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        elif isinstance(value, list):
+            value = map(lambda v: (isinstance(v, unicode) and 
+                                   v.encode("utf-8")) or v, value)
+        obj[str(key)] = value
+    return obj
@@ -5,11 +5,16 @@ software stack.  The main functionality is provided via the Manifest class.
 from __future__ import absolute_import
 from __future__ import with_statement
 
-import sys, os, re, cStringIO, time
+import sys, os, re, time, multiprocessing
 from subprocess import Popen, PIPE
 from copy import copy
+from collections import OrderedDict
 
 from . import version as onvers
+from .storage import defaultStorage
+from .generation import GenerationMarker
+from .depindex import DependencyIndex
+from .depgraph import DependencyGraph
 
 defaultColumnNames = \
 "pkg flavor version tablefile installation_directory installID".split()
@@ -21,6 +26,10 @@ defaultManifestHeader = headerLineMagic + \
 headerLineRe = re.compile(headerLineMagic + r" for (\S+) \((\S+)\)")
 
 extension = ".manifest"
+defaultCacheSize = 256
+scanChunkSize = 256
+fileBufferSize = 1 << 16
+selfRecordTailSize = 4096
 
 class Manifest(object):
     """
@@ -28,6 +37,9 @@ class Manifest(object):
     notions of LSST conventions.
     """
 
+    # True if the records are shared with a cached manifest (see _own())
+    _shared = False
+
     def __init__(self, name, version, pkgpath=None, flavor="generic"):
         """create a manifest for a given package
 
@@ -41,6 +53,7 @@ class Manifest(object):
         """
         self.recs = {}
         self.keys = []
+        self.prodkeys = {}
         self.name = name
         self.vers = version
         self.flav = flavor
@@ -48,7 +61,11 @@ class Manifest(object):
         self.hdr = defaultManifestHeader
         self.colnames = copy(defaultColumnNames)
         self.colnames[0] = "# " + self.colnames[0]
+        self.collen = map(len, self.colnames)
         self.commcount = 0
+        # counts every change:  records and comments added and record 
+        # values assigned in place
+        self.modcount = 0
         self.creator = None
         self.submitter = None
 
@@ -56,13 +73,78 @@ class Manifest(object):
         """return the package name, version, and flavor as a 3-tuple"""
         return (self.name, self.vers, self.flav)
 
+    def copy(self):
+        """
+        return a copy of this manifest that shares no mutable data with it.
+        In particular, each record is copied so that changes to records in 
+        the copy do not affect this manifest.  
+        """
+        out = Manifest(self.name, self.vers, self.pkgpath, self.flav)
+        out.hdr = self.hdr
+        out.colnames = self.colnames[:]
+        out.collen = self.collen[:]
+        out.commcount = self.commcount
+        out.creator = self.creator
+        out.submitter = self.submitter
+        out.keys = self.keys[:]
+        out.recs = dict((k, out._adopt(v.copy())) 
+                        for k, v in self.recs.iteritems())
+        out.prodkeys = dict((k, v[:]) for k, v in self.prodkeys.iteritems())
+        return out
+
+    def _adopt(self, rec):
+        # make this manifest the owner of a record so that changes to its
+        # values are counted in modcount
+        rec._owner = self
+        return rec
+
+    def __setstate__(self, state):
+        # records do not keep their owner when pickled.  (A shallow copy 
+        # keeps the records, and their owner, of the original.)
+        self.__dict__.update(state)
+        for rec in state.get("recs", {}).itervalues():
+            if type(rec) is ManifestRecord and rec._owner is None:
+                self._adopt(rec)
+
+    def _share(self):
+        # return a manifest that shares this one's records until it is 
+        # changed
+        out = copy(self)
+        out._shared = True
+        return out
+
+    def _own(self):
+        # give a shared manifest its own lists of its records before 
+        # records are added or replaced.  The records themselves stay 
+        # shared until _ownRecord() copies them one at a time.
+        if not self._shared:
+            return
+        self.keys = self.keys[:]
+        self.recs = self.recs.copy()
+        self.prodkeys = dict((k, v[:]) for k, v in self.prodkeys.iteritems())
+        self.colnames = self.colnames[:]
+        self.collen = self.collen[:]
+        self._shared = False
+
+    def _ownRecord(self, key):
+        # return the record with the given key, first replacing it with a 
+        # private copy if it is shared with a ManifestCache:  called by the
+        # methods that hand out records to be changed in place.
+        rec = self.recs.get(key)
+        if type(rec) is _SharedRecord:
+            self._own()
+            rec = self.recs[key] = self._adopt(rec.copy())
+        return rec
+
     def addComment(self, comment):
         """append a comment to the manifest"""
+        self._own()
         self.commcount += 1
         key = '#'+str(self.commcount)
         self.keys.append(key)
-        self.recs[key] = ['#'] + [ '' ] * len(self.colnames)
-        self.recs[key][-1] = comment
+        self.recs[key] = self._adopt(ManifestRecord('#', '', '', '', '', 
+                                                    comment))
+        self.modcount += 1
 
     def addRecord(self, pkgname, flavor, version,
                   tablefile, installdir, installid):
@@ -78,11 +160,23 @@ class Manifest(object):
                              this package should be installed by default.
         @param installid  a complete handle for the deployment bundle.
         """
+        self._own()
         key = self._reckey(pkgname, flavor, version)
-        if not self.recs.has_key(key):
+        if key not in self.recs:
             self.keys.append(key)
-            self.recs[key] = [pkgname, flavor, version,
-                              tablefile, installdir, installid]
+            self.recs[key] = self._adopt(ManifestRecord(pkgname, flavor, 
+                                                        version, tablefile, 
+                                                        installdir, installid))
+            self.prodkeys.setdefault(pkgname, []).append(key)
+            self._noteWidths(self.recs[key])
+            self.modcount += 1
+
+    def _noteWidths(self, values):
+        # widen the columns as necessary to fit the given record values
+        collen = self.collen
+        for i in xrange(len(collen)):
+            if len(values[i]) > collen[i]:
+                collen[i] = len(values[i])
 
     def addLSSTRecord(self, prodname, version, pkgpath=None, build=None, 
                       flavor="generic", id="lsstbuild", buildqual="+"):
@@ -191,19 +285,19 @@ class Manifest(object):
 
         @param prodname    the name of the package
         """
-        return bool(filter(lambda k: k.startswith(prodname+':'), self.keys))
+        return prodname in self.prodkeys
 
     def getSelf(self):
         """
         return the record data that applies to the owning product itself.
         """
-        return self.recs.get(self._reckey(self.name, self.flav, self.vers))
+        return self._ownRecord(self._reckey(self.name, self.flav, self.vers))
 
     def getRecord(self, prodname, version, flavor="generic"):
         """
         return the record data that applies to the owning product itself.
         """
-        return self.recs.get(self._reckey(prodname, flavor, version))
+        return self._ownRecord(self._reckey(prodname, flavor, version))
 
     def getProduct(self, prodname):
         """
@@ -212,10 +306,10 @@ class Manifest(object):
         there should only be one occurance of a product in the manifest.
         @param prodname    the name of the product for which a record is desired
         """
-        keys = filter(lambda k: k.startswith(prodname+':'), self.keys)
-        if len(keys) == 0:
+        keys = self.prodkeys.get(prodname)
+        if not keys:
             return None
-        return self.recs[keys[-1]]
+        return self._ownRecord(keys[-1])
 
     def recordToString(self, pkgname, flavor, version):
         """return the requested record in manifest format.
@@ -233,9 +327,7 @@ class Manifest(object):
 
     def __repr__(self):
         """return all lines of the manifest in proper manifest format"""
-        out = cStringIO.StringIO()
-        self.write(out)
-        return out.getvalue()
+        return "".join(self._lines())
 
     def str(self):
         """return all lines of the manifest in proper manifest format"""
@@ -246,109 +338,482 @@ class Manifest(object):
 
         @param strm  the output stream to write the records to
         """
-        collen = self._collen()
+        strm.writelines(self._lines())
+
+    def writeFile(self, filename):
+        """
+        write the manifest to a file, replacing any existing one
+        @param filename   the path to the file to write
+        """
+        with open(filename, 'w', fileBufferSize) as fd:
+            self.write(fd)
+
+    def _lines(self):
+        # generate the lines of the manifest one at a time.  The column 
+        # widths are kept up to date as records are added, so this is a 
+        # single pass over the records.
+        collen = self.collen
         fmt = "%%-%ds %%-%ds %%-%ds %%-%ds %%-%ds %%s\n" % tuple(collen[:-1])
         
-        strm.write(self.hdr % (self.name, self.vers))
+        yield self.hdr % (self.name, self.vers)
         if self.creator or self.submitter:
             if self.creator:
-                strm.write("# Creator: %s\n" % self.creator)
+                yield "# Creator: %s\n" % self.creator
                 if self.submitter:
-                    strm.write("# Submitter: %s\n" % self.submitter)
-            strm.write("# Time: %s\n" % 
-                       time.strftime("%Y/%m/%d %H:%M:%S %Z", time.localtime()))
-        strm.write((fmt % tuple(self.colnames)))
-        strm.write("#" + " ".join(map(lambda x: '-' * x, collen))[1:109])
-        strm.write("\n")
+                    yield "# Submitter: %s\n" % self.submitter
+            yield "# Time: %s\n" % \
+                  time.strftime("%Y/%m/%d %H:%M:%S %Z", time.localtime())
+        yield fmt % tuple(self.colnames)
+        yield "#" + " ".join(map(lambda x: '-' * x, collen))[1:109] + "\n"
 
+        recs = self.recs
         for key in self.keys:
+            rec = recs[key]
             if key.startswith('#'):
-                strm.write("# %s\n" % self.recs[key][-1])
+                yield "# %s\n" % rec[-1]
             else:
-                strm.write(fmt % tuple(self.recs[key]))
+                yield fmt % rec._astuple()
 
     def getDeps(self):
         """
-        return an ordered list of Dependencies in this manifest
+        return an ordered, read-only view of the Dependencies in this 
+        manifest.  The view supports len(), iteration, and indexing 
+        (including negative indices); each Dependency is created only as 
+        it is accessed and refers to the manifest's record directly (so 
+        changing its data changes the manifest).  Getting the view copies
+        nothing, even for a manifest shared with a ManifestCache:  such a 
+        manifest gets its own copy of a record only when a Dependency's 
+        data is changed.  Use list() to get an independent list.
         """
-        out = []
-        for key in self.keys:
-            out.append(Dependency(self.recs[key]))
-
-        return out
+        return _DependencyView(self)
 
     class _iterator(object):
+        # iterates over the manifest's records without copying them; 
+        # adding records or comments during iteration is an error, while 
+        # changing a record in place is not.  Records are only ever 
+        # appended, so an addition shows as a change in the number of keys.
+        __slots__ = ("_man", "_nxtIdx", "_nkeys")
         def __init__(self, manifest):
-            self._keys = manifest.keys[:]
-            self._recs = manifest.recs.copy()
+            self._man = manifest
             self._nxtIdx = 0
-            if len(self._keys) == 0:
-                self._nxtIdx = 1
+            self._nkeys = len(manifest.keys)
         def __iter__(self):
             return self
         def next(self):
-            if self._nxtIdx >= len(self._keys):
+            man = self._man
+            if len(man.keys) != self._nkeys:
+                raise ManifestModifiedError(man)
+            if self._nxtIdx >= len(man.keys):
                 raise StopIteration()
             try:
-                return self._recs[self._keys[self._nxtIdx]]
+                return man.recs[man.keys[self._nxtIdx]]
             finally:
                 self._nxtIdx += 1
 
     def __iter__(self):
+        """
+        iterate over the records (and comments) of this manifest without 
+        copying them.  The records of a manifest shared with a ManifestCache
+        (e.g. one from DeployedManifests.getManifest()) are read-only until
+        they are changed through getDeps(), getSelf(), getRecord(), or 
+        getProduct(); assigning to one reached by iteration raises 
+        TypeError.
+        """
         return self._iterator(self)
             
     def _collen(self):
-        x = self.recs.values()
-        x.append(self.colnames)
-        return map(lambda y: max(map(lambda x: len(x[y]), x)),
-                   xrange(0,len(self.colnames)))
+        return self.collen[:]
+
+    def resetColumnWidths(self):
+        """
+        recompute the column widths used by write() from scratch.  The 
+        widths are updated automatically as records are added but not when 
+        the values of a record already in the manifest are changed in place.
+        """
+        self._own()
+        self.collen = map(len, self.colnames)
+        for key in self.keys:
+            if not key.startswith('#'):
+                self._noteWidths(self.recs[key])
+        self.modcount += 1
     
-    def fromFile(filename, flavor="generic", product=None, version=None):
+    def fromFile(filename, flavor="generic", product=None, version=None,
+                 storage=None):
         """
         create a manifest from the contents of existing one
+        @param storage   the storage backend to read the file from (see 
+                            lsstdistrib.storage).  If None, the file is 
+                            read from the filesystem.
         """
-        with open(filename) as fd:
-            line = fd.readline()
-            if line.startswith(headerLineMagic):
-                mat = headerLineRe.search(line)
-                if not mat and (not product or not version):
-                    raise RuntimeError(filename+": Can't determine product/version due to bad opening line")
-                if not product:
-                    product = mat.group(1)
-                if not version:
-                    version = mat.group(2)
-            if not product or not version:
-                raise RuntimeError(filename+": Can't determine product/version due to missing header line")
-
-            out = Manifest(product, version, flavor)
+        if storage is not None and not storage.isLocal():
+            data = storage.read(filename)
+        else:
+            with open(filename, 'rb', fileBufferSize) as fd:
+                data = fd.read()
+        return Manifest._parse(data, filename, flavor, product, version)
 
-            for line in fd:
-                if line.startswith('#'):
-                    continue
+    fromFile = staticmethod(fromFile)
 
-                parts = re.split(r'\s+', line, len(defaultColumnNames))
-                if len(parts) < 4:
-                    continue
-                if len(parts) < len(defaultColumnNames):
-                    parts += [""] * (len(defaultColumnNames) - len(parts))
-                out.addRecord(*parts[:len(defaultColumnNames)])
+    def fromFiles(filenames, flavor="generic", processes=None, prodvers=None):
+        """
+        create manifests from the contents of many existing ones.  This is
+        intended for tools that need to read hundreds of manifests at once.
+        @param filenames   the paths to the manifest files
+        @param flavor      the flavor to assign to the manifests
+        @param processes   if greater than 1, the number of worker 
+                              processes to spread the parsing over
+        @param prodvers    if not None, the product-version pairs the files
+                              are known to describe (overriding their 
+                              header lines), in the order of filenames
+        @return list   the Manifest instances, in the order of filenames
+        """
+        if prodvers is None:
+            args = map(lambda f: (f, flavor), filenames)
+        else:
+            args = map(lambda f, p: (f, flavor, p[0], p[1]), 
+                       filenames, prodvers)
+        if processes > 1 and len(args) > 1:
+            pool = multiprocessing.Pool(min(processes, len(args)))
+            try:
+                return pool.map(_loadManifestFile, args, 
+                                max(len(args) // (processes * 4), 1))
+            finally:
+                pool.close()
+                pool.join()
+        return map(_loadManifestFile, args)
+
+    fromFiles = staticmethod(fromFiles)
+
+    def _parse(data, filename, flavor="generic", product=None, version=None):
+        lines = data.splitlines()
+        line = (lines and lines[0]) or ''
+        if line.startswith(headerLineMagic):
+            mat = headerLineRe.search(line)
+            if not mat and (not product or not version):
+                raise RuntimeError(filename+": Can't determine product/version due to bad opening line")
+            if not product:
+                product = mat.group(1)
+            if not version:
+                version = mat.group(2)
+        if not product or not version:
+            raise RuntimeError(filename+": Can't determine product/version due to missing header line")
+
+        out = Manifest(product, version, flavor=flavor)
+
+        # records are added directly rather than via addRecord() 
+        ncols = len(defaultColumnNames)
+        recs = out.recs
+        keys = out.keys
+        prodkeys = out.prodkeys
+        for line in lines[1:]:
+            if line.startswith('#'):
+                continue
+
+            parts = line.split(None, ncols)
+            if len(parts) < 3:
+                continue
+            if len(parts) < ncols:
+                parts += [""] * (ncols - len(parts))
+            key = ":".join(parts[:3])
+            if key in recs:
+                continue
+            keys.append(key)
+            rec = ManifestRecord(*parts[:ncols])
+            rec._owner = out
+            recs[key] = rec
+            prodkeys.setdefault(parts[0], []).append(key)
+            out._noteWidths(parts)
 
-            return out
+        return out
 
-    fromFile = staticmethod(fromFile)
+    _parse = staticmethod(_parse)
 
     def merge(self, other):
         """
         merge the dependencies in the given manifest in to this manifest
         """
         for key in other.keys:
-            if not self.hasProduct(other.recs[key][0]):
+            if key.startswith('#'):
+                continue
+            if other.recs[key][0] not in self.prodkeys:
                 self.addRecord(*other.recs[key])
 
+class LazyManifest(Manifest):
+    """
+    a Manifest read from a file whose records are not parsed until they 
+    are first needed.  The header--the product name and version and the 
+    creator, submitter, and time comments--is read immediately.  getSelf()
+    does not force the records to be parsed:  as the self record is 
+    normally the last in the file, it is first looked for in the tail of 
+    the file.  
+    """
+    _lazyAttrs = ("recs", "keys", "prodkeys", "collen")
+
+    def __init__(self, filename, flavor="generic", product=None, version=None):
+        """
+        read the header of a manifest file
+        @param filename   the path to the manifest file
+        @param flavor     the flavor to assign to the manifest
+        @param product    the name of the product; if None, it is taken from
+                            the header
+        @param version    the version of the product; if None, it is taken 
+                            from the header
+        """
+        header = []
+        with open(filename) as fd:
+            for line in fd:
+                if header and not line.startswith('#'):
+                    break
+                header.append(line)
+        man = Manifest._parse("".join(header[:1]), filename, flavor, 
+                              product, version)
+        Manifest.__init__(self, man.name, man.vers, flavor=flavor)
+        self.file = filename
+        self.time = None
+        for line in header[1:]:
+            if line.startswith("# Creator: "):
+                self.creator = line[len("# Creator: "):].strip()
+            elif line.startswith("# Submitter: "):
+                self.submitter = line[len("# Submitter: "):].strip()
+            elif line.startswith("# Time: "):
+                self.time = line[len("# Time: "):].strip()
+
+        for attr in self._lazyAttrs:
+            delattr(self, attr)
+
+    def isLoaded(self):
+        """return True if the records have been parsed"""
+        return "recs" in self.__dict__
+
+    def __getattr__(self, name):
+        # only called for the record attributes until they are loaded
+        if name in self._lazyAttrs:
+            self._load()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def _load(self):
+        man = Manifest.fromFile(self.file, self.flav, self.name, self.vers)
+        for rec in man.recs.itervalues():
+            self._adopt(rec)
+        self.recs = man.recs
+        self.keys = man.keys
+        self.prodkeys = man.prodkeys
+        self.collen = man.collen
+
+    def getSelf(self):
+        """
+        return the record data that applies to the owning product itself.
+        """
+        if not self.isLoaded():
+            rec = self._readSelfRecord()
+            if rec:
+                return rec
+        return Manifest.getSelf(self)
+
+    def _readSelfRecord(self):
+        # look for the self record in the tail of the file, returning None 
+        # if it is not there
+        with open(self.file, 'rb') as fd:
+            fd.seek(0, 2)
+            size = fd.tell()
+            fd.seek(max(size - selfRecordTailSize, 0))
+            lines = fd.read().splitlines()
+        if size > selfRecordTailSize:
+            lines = lines[1:]
+
+        ncols = len(defaultColumnNames)
+        for line in reversed(lines):
+            parts = line.split(None, ncols)
+            if len(parts) < 3 or parts[0] != self.name or \
+               parts[1] != self.flav or parts[2] != self.vers:
+                continue
+            if len(parts) < ncols:
+                parts += [""] * (ncols - len(parts))
+            return ManifestRecord(*parts[:ncols])
+        return None
+
+class _DependencyView(object):
+    # the read-only view of a manifest's records returned by 
+    # Manifest.getDeps()
+    __slots__ = ("_man",)
+
+    def __init__(self, manifest):
+        self._man = manifest
+
+    def __len__(self):
+        return len(self._man.keys)
+
+    def _dependency(self, key):
+        rec = self._man.recs[key]
+        if type(rec) is _SharedRecord:
+            rec = _RecordRef(self._man, key)
+        return Dependency(rec)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return map(self._dependency, self._man.keys[i])
+        return self._dependency(self._man.keys[i])
+
+    def __iter__(self):
+        man = self._man
+        nkeys = len(man.keys)
+        for i in xrange(nkeys):
+            if len(man.keys) != nkeys:
+                raise ManifestModifiedError(man)
+            yield self._dependency(man.keys[i])
+
+class _RecordRef(object):
+    # stands in for a record shared with a ManifestCache as the data of a 
+    # Dependency from Manifest.getDeps():  it reads whatever record the 
+    # manifest holds under its key, and gives the manifest its own copy of
+    # the record before the first change.
+    __slots__ = ("_man", "_key")
+
+    def __init__(self, manifest, key):
+        self._man = manifest
+        self._key = key
+
+    def _rec(self):
+        return self._man.recs[self._key]
+
+    def __len__(self):
+        return len(self._rec())
+
+    def __iter__(self):
+        return iter(self._rec())
+
+    def __getitem__(self, i):
+        return self._rec()[i]
+
+    def __setitem__(self, i, value):
+        self._man._ownRecord(self._key)[i] = value
+
+    def __eq__(self, other):
+        if isinstance(other, _RecordRef):
+            other = other._rec()
+        return self._rec() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return self._rec().__reduce__()
+
+    def __repr__(self):
+        return repr(self._rec())
+
+class ManifestModifiedError(RuntimeError):
+    """
+    an exception indicating that records were added to a manifest while 
+    it was being iterated over.
+    """
+    def __init__(self, manifest, msg=None):
+        if not msg:
+            msg = "Manifest for %s %s changed during iteration" % \
+                  (manifest.name, manifest.vers)
+        RuntimeError.__init__(self, msg)
+        self.manifest = manifest
+
+def _intern(value):
+    if type(value) is str:
+        return intern(value)
+    return value
+
+class ManifestRecord(object):
+    """
+    the data from one record in a manifest.  A record behaves like the 
+    list of its column values (in the order they appear in the file):  it 
+    can be indexed (including with negative indices and slices), assigned 
+    to by index, iterated over, and compared with lists.  To save memory 
+    when many manifests are loaded, the values are held in slots rather 
+    than a list, and the strings are interned so that the values repeated 
+    across manifests (flavors, paths, and install IDs of common 
+    dependencies) are stored only once.  A record that belongs to a 
+    manifest counts each assignment to its values in the manifest's 
+    modcount.
+
+    A comment is stored as a record whose name is "#" and whose last value
+    is the comment text.  
+    """
+    __slots__ = ("name", "flavor", "version", "tablefile", "installdir", 
+                 "installid", "_owner")
+    _fields = __slots__[:-1]
+
+    def __init__(self, name, flavor, version, tablefile, installdir, 
+                 installid):
+        self.name = _intern(name)
+        self.flavor = _intern(flavor)
+        self.version = _intern(version)
+        self.tablefile = _intern(tablefile)
+        self.installdir = _intern(installdir)
+        self.installid = _intern(installid)
+        self._owner = None
+
+    def copy(self):
+        """return a copy of this record"""
+        return ManifestRecord(self.name, self.flavor, self.version, 
+                              self.tablefile, self.installdir, self.installid)
+
+    def _astuple(self):
+        return (self.name, self.flavor, self.version, 
+                self.tablefile, self.installdir, self.installid)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __iter__(self):
+        return iter(self._astuple())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return list(self._astuple()[i])
+        return getattr(self, self._fields[i])
+
+    def __setitem__(self, i, value):
+        setattr(self, self._fields[i], _intern(value))
+        if self._owner is not None:
+            self._owner.modcount += 1
+
+    def __eq__(self, other):
+        if isinstance(other, ManifestRecord):
+            return self._astuple() == other._astuple()
+        if isinstance(other, (list, tuple)):
+            return list(self._astuple()) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        out = self.__eq__(other)
+        if out is NotImplemented:
+            return out
+        return not out
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (ManifestRecord, self._astuple())
+
+    def __repr__(self):
+        return "ManifestRecord(%s)" % ", ".join(map(repr, self._astuple()))
+
+class _SharedRecord(ManifestRecord):
+    # a record of a manifest held by a ManifestCache.  It is shared by all 
+    # of the manifests the cache hands out for the file, so it may not be 
+    # changed; its copy() is an ordinary ManifestRecord.
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise TypeError("record of a cached manifest is read-only; "
+                        "use the manifest's getDeps() or getProduct() "
+                        "to change it")
+
 class Dependency(object):
     """
     a light weight container of the data from one record in a manifest
     """
+    __slots__ = ("data",)
     NAME       = 0
     FLAVOR     = 1
     VERSION    = 2
@@ -365,6 +830,9 @@ class Dependency(object):
         """
         self.data = data
 
+    def __reduce__(self):
+        return (Dependency, (self.data,))
+
     def getName(self):
         return self.data[self.NAME]
 
@@ -393,31 +861,176 @@ def manifestFilename(prodname, version, flavor=None):
         out = os.path.join(flavor, out)
     return out
 
+class ManifestCache(object):
+    """
+    a bounded, least-recently-used cache of parsed manifest files.  Each 
+    cached Manifest is validated against the modification time, size, and 
+    inode of its file before it is reused, so a file that is replaced or 
+    edited is re-read.  Manifests are cached per file and set of parse 
+    arguments.  
+
+    Each caller is handed its own Manifest that shares the cached records,
+    so a cache hit that is only read costs no copying.  Copies are made as
+    the manifest is changed:  adding records or comments gives it its own 
+    lists of records, and a record is copied when it is asked for to be 
+    changed in place (via getSelf(), getRecord(), or getProduct()) or when
+    the data of a Dependency from getDeps() is changed.  
+
+    Unlike with an uncached Manifest, the records reached by iterating 
+    over a manifest from the cache are read-only unless they have been 
+    copied this way:  assigning to one raises TypeError.  To change a 
+    record found by iterating, get it via getDeps() or getProduct().
+    """
+
+    def __init__(self, maxsize=defaultCacheSize):
+        """
+        create an empty cache
+        @param maxsize   the maximum number of parsed manifests to hold
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, filename, flavor="generic", product=None, version=None):
+        """
+        return the contents of a manifest file as a Manifest instance,
+        parsing the file only if it is not already cached or it has
+        changed since it was cached.  The arguments are the same as those
+        for Manifest.fromFile().
+        @throws OSError  if the file cannot be accessed
+        """
+        st = os.stat(filename)
+        stamp = (st.st_mtime, st.st_size, st.st_ino)
+
+        key = (filename, flavor, product, version)
+        entry = self._entries.pop(key, None)
+        if entry and entry[0] == stamp:
+            self.hits += 1
+        else:
+            self.misses += 1
+            man = Manifest.fromFile(filename, flavor, product, version)
+            for rec in man.recs.itervalues():
+                rec._owner = None
+                rec.__class__ = _SharedRecord
+            entry = (stamp, man)
+        self._entries[key] = entry
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+        return entry[1]._share()
+
+    def clear(self):
+        """empty the cache and reset the hit and miss counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename):
+        # true if the file is cached for any set of parse arguments
+        return filename in map(lambda k: k[0], self._entries)
+
 class DeployedManifests(object):
     """
     the set of deployed manifests represented by the manifests directory
     and the manifest files it contains.  
     """
 
-    def __init__(self, mandir, versionCompare=None):
+    scanners = ("grep", "python")
+
+    def __init__(self, mandir, versionCompare=None, indexfile=None, 
+                 cacheSize=defaultCacheSize, scanner="grep", processes=None,
+                 catalog=None, storage=None):
         """
         initialize to a given manifests directory
         @param mandir          the directory containing the manifests
         @param versionCompare  the comparator functor that can be used 
                                   for sorting versions.  If not provided,
                                   a default will be used.
-        """
+        @param indexfile       the path to a reverse-dependency index file
+                                  (see lsstdistrib.depindex).  If provided,
+                                  dependsOn() will consult the index rather
+                                  than scanning the manifest files.  
+        @param cacheSize       the maximum number of parsed manifests to 
+                                  hold in memory for reuse by getManifest().
+                                  If 0, manifests will not be cached.
+        @param scanner         the method used by dependsOn() and 
+                                  dependsOnAny() to scan the manifest files
+                                  when there is no index:  "grep" runs 
+                                  grep over the files; "python" parses them 
+                                  in-process, spreading them over a pool of 
+                                  worker processes when there are many.  
+        @param processes       the number of worker processes for the 
+                                  "python" scanner.  If None, the number of 
+                                  CPUs is used; if 1, no pool is used.
+        @param catalog         a Catalog for the server (see 
+                                  lsstdistrib.catalog).  If provided, it 
+                                  will be used to list the manifests and to
+                                  find dependents whenever it is current.
+        @param storage         the storage backend holding the manifests
+                                  (see lsstdistrib.storage).  If None, the 
+                                  local filesystem is used.  With a backend
+                                  that is not local, the "python" scanner is
+                                  always used and manifests are not cached.
+        """
+        if scanner not in self.scanners:
+            raise ValueError("Unknown manifest scanner: " + str(scanner))
         self.dir = mandir
+        self.storage = storage or defaultStorage
+        if not self.storage.isLocal():
+            scanner = "python"
+            cacheSize = 0
         if versionCompare is None:
             versionCompare = onvers.VersionCompare()
         self.vcmp = versionCompare
         self.extension = extension
+        self.cache = None
+        if cacheSize:
+            self.cache = ManifestCache(cacheSize)
+        self.index = None
+        if indexfile:
+            self.index = DependencyIndex(indexfile, self)
+        self.scanner = scanner
+        self.processes = processes
+        self.catalog = catalog
+        self.generation = GenerationMarker(mandir, self.storage)
+        self._graph = None
+        self._graphVersions = None
+
+    def _useCatalog(self):
+        return self.catalog is not None and self.catalog.isCurrent()
+
+    def _dependentsFromCatalog(self, prodnames, version=None, flavor=None):
+        # return the latest dependents of each product from the catalog
+        latest = dict(self.latestProducts())
+        out = {}
+        for prodname in prodnames:
+            out[prodname] = []
+        for prodname, dep, depver in \
+                self.catalog.dependents(prodnames, version, flavor):
+            if latest.get(dep) == depver:
+                out[prodname].append((dep, depver))
+        for prodname in out.keys():
+            out[prodname].sort()
+        return out
 
     def dependsOn(self, prodname, version=None, flavor=None):
         """
         return a list of product-version pairs of products that depends
         the given product.
         """
+        if self.index:
+            return self.index.dependsOn(prodname, version, flavor)
+        if self._useCatalog():
+            return self._dependentsFromCatalog([prodname], version, 
+                                               flavor)[prodname]
+        if self.scanner == "python":
+            return map(lambda f: self.productFromFilename(f), 
+                       self.scanFiles([prodname], version, flavor)[prodname])
+
         # this implementation uses grep for maximum performance search 
         # through many files.  
         mprod = "^\s*%s\s"
@@ -443,29 +1056,212 @@ class DeployedManifests(object):
             raise RuntimeError(msg)
 
         return map(lambda f: self.productFromFilename(f), matchedFiles)
+
+    def dependsOnAny(self, prodnames):
+        """
+        return the dependents of each of a set of products.  Unlike calling
+        dependsOn() for each product, the latest manifests are listed and
+        scanned only once.
+        @param prodnames   the names of the products of interest
+        @return dict   the lists of product-version pairs (as returned by 
+                          dependsOn()) for the latest products whose 
+                          manifests include each product, keyed by product 
+                          name.  
+        """
+        out = {}
+        for prodname in prodnames:
+            out[prodname] = []
+        if not out:
+            return out
+
+        if self.index:
+            for prodname in out.keys():
+                out[prodname] = self.index.dependsOn(prodname)
+            return out
+        if self._useCatalog():
+            return self._dependentsFromCatalog(out.keys())
+        if self.scanner == "python":
+            found = self.scanFiles(out.keys())
+            for prodname in out.keys():
+                out[prodname] = sorted(map(self.productFromFilename, 
+                                           found[prodname]))
+            return out
+
+        # a single grep prints the matched product name for every matching 
+        # record in every file.
+        pattern = r"^\s*(?:%s)(?=\s)" % "|".join(map(re.escape, out.keys()))
+        cmd = "grep -HoP".split()
+        cmd.append(pattern)
+        cmd += self.latestManifestFiles()
+
+        srch = Popen(cmd, executable="/bin/grep", stdout=PIPE, stderr=PIPE, 
+                     cwd=self.dir)
+        (cmdout, cmderr) = srch.communicate()
+        if srch.returncode > 1:
+            msg = "Problem scanning manifest files:\n" + cmderr
+            raise RuntimeError(msg)
+
+        seen = set()
+        for line in cmdout.splitlines():
+            (fname, prodname) = line.split(':', 1)
+            prodname = prodname.strip()
+            if (fname, prodname) in seen:
+                continue
+            seen.add((fname, prodname))
+            out[prodname].append(self.productFromFilename(fname))
+
+        for prodname in out.keys():
+            out[prodname].sort()
+        return out
         
-        
-    def _paircmp(self, pair1, pair2):
-        cmpson = cmp(pair1[0], pair2[0])
-        if cmpson != 0:
-            return cmpson
-        if pair1[1] == pair2[1]:
-            return 0
-        if pair1[1] is None:
-            return -1
-        if pair2[1] is None:
-            return  1
-        return self.vcmp(pair1[1], pair2[1])
+    def scanFiles(self, prodnames, version=None, flavor=None, files=None):
+        """
+        scan manifest files in-process for records of the given products.
+        Only the first three columns of each record are examined.  When 
+        there are many files, they are split into chunks that are scanned
+        by a pool of worker processes.  
+        @param prodnames   the names of the products to look for
+        @param version     if not None, match only records for this version
+        @param flavor      if not None, match only records for this flavor
+        @param files       the names of the files (relative to the manifests 
+                              directory) to scan.  If None, the files 
+                              returned by latestManifestFiles() are scanned.
+        @return dict   the names of the files containing a matching record,
+                          in scanned order, keyed by product name
+        """
+        if files is None:
+            files = self.latestManifestFiles()
+        out = {}
+        for prodname in prodnames:
+            out[prodname] = []
+
+        processes = self.processes or multiprocessing.cpu_count()
+        chunksize = max(scanChunkSize, 
+                        (len(files) + processes - 1) // processes)
+        chunks = map(lambda i: (self.dir, files[i:i+chunksize], 
+                                out.keys(), version, flavor),
+                     xrange(0, len(files), chunksize))
+
+        if not self.storage.isLocal():
+            results = map(lambda c: _scanManifestFiles(c, self.storage), 
+                          chunks)
+        elif processes > 1 and len(chunks) > 1:
+            pool = multiprocessing.Pool(min(processes, len(chunks)))
+            try:
+                results = pool.map(_scanManifestFiles, chunks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(_scanManifestFiles, chunks)
+
+        for result in results:
+            for fname, matched in result:
+                for prodname in matched:
+                    out[prodname].append(fname)
+        return out
+
+    def getDependencyGraph(self, refresh=False):
+        """
+        return a DependencyGraph of the latest deployed products, in which
+        each product depends on the other products listed in its manifest.
+        The graph is built the first time it is requested and reused 
+        thereafter, so that any number of closure queries (see 
+        getAllDependents() and getAllDependencies()) can be answered from 
+        a single load of the manifests.  
+        @param refresh   if True, rebuild the graph to pick up manifests 
+                           deployed since it was built.
+        """
+        if self._graph is None or refresh:
+            latest = filter(lambda p: p[1] is not None, self.latestProducts())
+            graph = DependencyGraph()
+            for prod, man in zip(latest, self.getManifests(latest)):
+                graph.addManifest(man, prod[0])
+            self._graphVersions = dict(latest)
+            self._graph = graph
+        return self._graph
+
+    def _withVersions(self, prodnames):
+        return map(lambda p: (p, self._graphVersions.get(p)), prodnames)
+
+    # Note that the manifests on a server normally list a product's full
+    # closure of dependencies, in which case getAllDependents() and 
+    # dependsOn() agree; the graph also covers hand-made manifests that 
+    # list only direct dependencies.
+
+    def getAllDependents(self, prodname):
+        """
+        return the latest deployed products that depend on the given 
+        product, directly or indirectly, as product-version pairs sorted
+        by name.  Unlike dependsOn(), this includes products whose 
+        manifests do not list the product themselves, and excludes the 
+        product itself.
+        """
+        graph = self.getDependencyGraph()
+        if prodname not in graph:
+            return []
+        return self._withVersions(sorted(graph.getAllDependents(prodname)))
+
+    def getAllDependencies(self, prodname):
+        """
+        return the products that the latest deployed version of the given
+        product depends on, directly or indirectly, as product-version 
+        pairs sorted by name.  The version is that of the latest deployed manifest of each
+        dependency (or None if it has none).
+        """
+        graph = self.getDependencyGraph()
+        if prodname not in graph:
+            raise DeployedProductNotFound(prodname)
+        return self._withVersions(sorted(graph.getAllDependencies(prodname)))
+
+    def getAffected(self, prodnames):
+        """
+        return the latest deployed products that would need to be rebuilt 
+        if any of the given products changed, as product-version pairs in 
+        dependency order (see DependencyGraph.getAffected()).
+        """
+        graph = self.getDependencyGraph()
+        return self._withVersions(
+            graph.getAffected(filter(lambda p: p in graph, prodnames)))
 
     def listAll(self):
         """
         return a list of all products (as product-version tuple-pairs)
         deployed as determined by manifests files in the manifests 
-        directory
-        """
+        directory.  If a batch of manifests is being published (see 
+        Release.releaseAll()), the listing will wait for it to finish so 
+        that it reflects either none or all of the batch.
+        """
+        if self._useCatalog():
+            return self.catalog.listDeployed()
+        files = self.generation.consistent(
+                                    lambda: self.storage.listdir(self.dir))
         return map(lambda m: self.productFromFilename(os.path.join(self.dir,m)),
-                  filter(lambda f: f.endswith(self.extension), 
-                         os.listdir(self.dir)))
+                  filter(lambda f: f.endswith(self.extension), files))
+
+    def listAllInOrder(self):
+        """
+        return the list returned by listAll(), sorted by product name and
+        then by version.  This is intended for listings of the whole 
+        server; the versions are sorted in bulk (see 
+        lsstdistrib.version.sortOrder()) when the default version 
+        comparator is in use.
+        """
+        prods = self.listAll()
+        unversioned = filter(lambda p: p[1] is None, prods)
+        prods = filter(lambda p: p[1] is not None, prods)
+
+        if isinstance(self.vcmp, onvers.VersionCompare):
+            order = onvers.sortOrder(map(lambda p: p[1], prods))
+            prods = map(lambda i: prods[i], order)
+        else:
+            keyfunc = onvers.keyFunction(self.vcmp)
+            prods.sort(key=lambda p: keyfunc(p[1]))
+
+        # a stable sort by name keeps each product's versions in order
+        prods = unversioned + prods
+        prods.sort(key=lambda p: p[0])
+        return prods
 
     def getVersions(self, prodname):
         """
@@ -474,7 +1270,7 @@ class DeployedManifests(object):
         """
         out = map(lambda p: p[1], 
                   filter(lambda m: m[0] == prodname, self.listAll()))
-        out.sort(self.vcmp)
+        out.sort(key=onvers.keyFunction(self.vcmp))
         return out
 
     def getLatestVersion(self, prodname):
@@ -495,22 +1291,21 @@ class DeployedManifests(object):
                             directory that this class was instantiated against
                             will be searched.
         """
-        # list the manifest files and parse each into a product and version
-        mfs =self.listAll()
-        if len(mfs) == 0:
-            return []
-
-        # collect products together and sort by version order
-        mfs.sort(self._paircmp)  
-
-        out = []
-        while len(mfs) > 0:
-            # the last of a product with a given name is the latest
-            if len(mfs) == 1 or mfs[0][0] != mfs[1][0]:
-                out.append(mfs[0])
-            mfs.pop(0)
-
-        return out
+        # list the manifest files and parse each into a product and version;
+        # keep the one with the greatest version for each product.  
+        keyfunc = onvers.keyFunction(self.vcmp)
+        latest = {}
+        for prod in self.listAll():
+            if prod[1] is None:
+                if prod[0] not in latest:
+                    latest[prod[0]] = (None, prod)
+                continue
+            key = keyfunc(prod[1])
+            last = latest.get(prod[0])
+            if last is None or last[0] is None or key > last[0]:
+                latest[prod[0]] = (key, prod)
+
+        return map(lambda name: latest[name][1], sorted(latest.keys()))
 
     def latestManifestFiles(self, fullpath=False):
         """
@@ -531,19 +1326,18 @@ class DeployedManifests(object):
                              a build number, it will be ignored.  
         """
         version = onvers.baseVersion(version)
-        buildRe = re.compile("\+(\d+)$")
         versions = self.getVersions(prodname)
         if not versions:
             raise DeployedProductNotFound(prodname, version)
 
-        versions = filter(lambda b: buildRe.search(b), 
-                          filter(lambda v: v.startswith(version+"+"), 
-                                 versions))
-        if len(versions) == 0:
+        builds = map(lambda v: v.build,
+                     filter(lambda v: v.qualifier == '+' and 
+                                      v.release == version,
+                            map(onvers.Version, versions)))
+        if len(builds) == 0:
             raise DeployedProductNotFound(prodname, version)
             
-        versions.sort(self.vcmp)
-        return int(buildRe.search(versions[-1]).group(1))
+        return max(builds)
 
     def manifestFilename(self, prodname, version, flavor=None):
         """
@@ -581,16 +1375,92 @@ class DeployedManifests(object):
     def getManifest(self, prodname, version, flavor=None):
         """
         open the manifest file for a given product and return its contents
-        as a Manifest instance
+        as a Manifest instance.  Unless caching was disabled at construction,
+        a previously parsed copy of the file will be reused if the file has
+        not changed; see ManifestCache for how its records may be changed.
         """
         filename = os.path.join(self.dir, 
                                 self.manifestFilename(prodname, version, flavor))
-        if not os.path.exists(filename):
+        if self.cache is not None:
+            try:
+                return self.cache.get(filename, flavor or "generic", 
+                                      prodname, version)
+            except OSError:
+                raise DeployedProductNotFound(prodname, version, flavor)
+
+        if not self.storage.exists(filename):
             raise DeployedProductNotFound(prodname, version, flavor)
         if not flavor:  
             flavor = "generic"
-        return Manifest.fromFile(filename, flavor, prodname, version)
+        return Manifest.fromFile(filename, flavor, prodname, version, 
+                                 self.storage)
 
+    def getLazyManifest(self, prodname, version, flavor=None):
+        """
+        return a LazyManifest for the manifest file for a given product.  
+        This is cheaper than getManifest() when only the manifest's header 
+        or self record is needed.
+        """
+        filename = os.path.join(self.dir, 
+                                self.manifestFilename(prodname, version, flavor))
+        if not self.storage.isLocal():
+            return self.getManifest(prodname, version, flavor)
+        if not os.path.exists(filename):
+            raise DeployedProductNotFound(prodname, version, flavor)
+        return LazyManifest(filename, flavor or "generic", prodname, version)
+
+    def getManifests(self, prodvers, processes=None):
+        """
+        return the contents of the manifest files for many products as 
+        Manifest instances.  The files are read in bulk (see 
+        Manifest.fromFiles()) without use of the cache.  
+        @param prodvers    a list of product-version pairs
+        @param processes   if greater than 1, the number of worker 
+                              processes to spread the parsing over
+        @return list   the Manifest instances, in the order of prodvers
+        @throws DeployedProductNotFound  if any of the manifests do not exist
+        """
+        if not self.storage.isLocal():
+            return map(lambda p: self.getManifest(*p), prodvers)
+        filenames = []
+        for prodname, version in prodvers:
+            filename = os.path.join(self.dir, 
+                                    self.manifestFilename(prodname, version))
+            if not os.path.exists(filename):
+                raise DeployedProductNotFound(prodname, version)
+            filenames.append(filename)
+        return Manifest.fromFiles(filenames, processes=processes, 
+                                  prodvers=prodvers)
+
+
+def _loadManifestFile(args):
+    # the worker for Manifest.fromFiles(); it must be a module function so 
+    # that it can be handed to a process pool.
+    return Manifest.fromFile(*args)
+
+def _scanManifestFiles(args, storage=None):
+    # the worker for DeployedManifests.scanFiles(); it must be a module 
+    # function so that it can be handed to a process pool.  
+    (dir, files, prodnames, version, flavor) = args
+    prodnames = set(prodnames)
+    opener = (storage and storage.open) or open
+    out = []
+    for fname in files:
+        matched = set()
+        with opener(os.path.join(dir, fname)) as fd:
+            fd.readline()
+            for line in fd:
+                parts = line.split(None, 3)
+                if len(parts) < 2 or parts[0] not in prodnames:
+                    continue
+                if flavor and parts[1] != flavor:
+                    continue
+                if version and (len(parts) < 3 or parts[2] != version):
+                    continue
+                matched.add(parts[0])
+        if matched:
+            out.append( (fname, matched) )
+    return out
 
 class DeployedProductNotFound(Exception):
     """
@@ -676,8 +1546,8 @@ class BuildDependencies(object):
                        filter(lambda d: d[1].matches(prodname),
                               enumerate(deps)))
             if mine:
-                dep = deps[mine[0]]
-                deps[mine[0]] = self._subVersion(dep, version)
+                # this updates the record in place
+                self._subVersion(deps[mine[0]], version)
             self.mergeDependencies(deps)
             
         else:
@@ -725,7 +1595,7 @@ class BuildDependencies(object):
         """
         return True if this product is currently represented in the list
         """
-        return prodname in self._mem.keys()
+        return prodname in self._mem
 
     def getDepForProduct(self, prodname):
         if not self.hasProduct(prodname):
@@ -769,7 +1639,7 @@ class SortProducts(object):
                               be one of the model/types accepted addProduct.
         """
         self.serverdir = serverdir
-        self.prods = {}
+        self.prods = OrderedDict()
         self.tag = None
         self.prodfunc = productInfoFunc
         if products:
@@ -824,7 +1694,7 @@ class SortProducts(object):
         if not productInfoFunc:
             productInfoFunc = self.defaultProductInfoFunction
 
-        prodinfo = productInfoFunc(product)
+        prodinfo = list(productInfoFunc(product))
         if len(prodinfo) < 2:
             raise RuntimeError("product info function returns too few elements: %s" % prodinfo)
         if len(prodinfo) < 3:
@@ -837,7 +1707,7 @@ class SortProducts(object):
         (name, vers, filen) = prodinfo[:3]
         self._addProductInfo(product, name, vers, filen)
 
-    @classmethod
+    @staticmethod
     def defaultProductInfoFunction(product):
         if isinstance(product, str):
             product = map(lambda p: p.strip(), product.split('/', 1))
@@ -856,27 +1726,41 @@ class SortProducts(object):
 
     def sort(self):
         """
-        sort the products into dependency order.
-        @return a list of product-version two-tuples in order
+        sort the products into dependency order.  Products that do not 
+        depend on each other are kept in the order they were added.
+        @return a list of the product representations in order
+        @throws DependencyCycleError  if some of the products depend on 
+                                         each other
         """
-        bdeps = BuildDependencies(self.serverdir)
-        # set the preferred tag
-        for prod, (prodrep, version, manfile) in self.prods.items():
-            if manfile:
-                bdeps.mergeFromManifestFile(manfile)
-            else:
-                bdeps.mergeProduct(prod, version)
-        deps = bdeps.getDeps()
+        graph = self.getDependencyGraph()
+        return map(lambda p: self.prods[p][0], graph.sort())
 
-        out = []
-        for dep in deps:
-            if dep.getName() in self.prods.keys():
-                out.append( self.prods[dep.getName()][0] )
-        for prod in self.prods.keys():
-            # catch any pseudo packages
-            if self.prods[prod][0] not in out:
-                out.append( self.prods[prod][0] ) 
-        return out
+    def getDependencyGraph(self):
+        """
+        return a DependencyGraph of the products to be sorted.  Each 
+        product's dependencies are taken from its manifest; only 
+        dependencies on other products in the list are included.
+        """
+        deployed = DeployedManifests(os.path.join(self.serverdir, "manifests"))
+        manfiles = []
+        for prod, (prodrep, version, manfile) in self.prods.items():
+            if not manfile:
+                # fall back to the latest deployed version if the requested
+                # one is not deployed (as BuildDependencies.mergeProduct() 
+                # does).
+                if version:
+                    manfile = os.path.join(deployed.dir,
+                                        deployed.manifestFilename(prod, version))
+                if not version or not os.path.exists(manfile):
+                    version = deployed.getLatestVersion(prod)
+                    manfile = os.path.join(deployed.dir,
+                                        deployed.manifestFilename(prod, version))
+            manfiles.append(manfile)
+
+        graph = DependencyGraph()
+        for prod, man in zip(self.prods.keys(), Manifest.fromFiles(manfiles)):
+            graph.addManifest(man, prod, self.prods)
+        return graph
 
 def sortInDependencyOrder(productList, productInfoFunc=None, serverdir=None):
     """
@@ -0,0 +1,277 @@
+"""
+a module for planning up-revs without writing anything.  The state of a
+distribution server (the deployed manifests, the build numbers in use, the
+dependency graph, and the reference tags) is loaded once, after which the
+up-rev that would follow any set of (possibly hypothetical) releases can
+be computed entirely in memory.  The main functionality is provided via
+the UprevPlanner class.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, time
+
+from .manifest import DeployedManifests, Manifest, LazyManifest, Dependency
+from .manifest import DeployedProductNotFound
+from .server   import Repository, BuildNumberIndex
+from .release  import UpdateDependents
+from .tagstore import getTagStore
+from . import version as onvers
+
+class UprevPlan(object):
+    """
+    the up-rev that would follow a set of releases:  the dependents that
+    would be rebuilt, their new build numbers, the manifest records and
+    manifests that would be created for them, and the files those
+    manifests would be written to.  Each dictionary is keyed by product
+    name.  The time taken by each step of the planning is recorded in
+    timings as a list of (step, seconds) pairs.
+    """
+
+    def __init__(self, releases):
+        """
+        @param releases   the releases the plan follows, as product-version
+                            pairs
+        """
+        self.releases = list(releases)
+        self.dependents = {}
+        self.builds = {}
+        self.records = {}
+        self.manifests = {}
+        self.files = {}
+        self.order = []
+        self.timings = []
+
+    def getProducts(self):
+        """
+        return the manifests that would be created, in dependency order,
+        as the four-tuples returned by UpdateDependents.createManifests():
+        the product, base version, build, and manifest file.
+        """
+        return map(lambda p: (p, onvers.baseVersion(self.dependents[p]),
+                              self.builds[p], self.files[p]), self.order)
+
+    def getTotalTime(self):
+        """return the total time in seconds taken to compute the plan"""
+        return sum(map(lambda t: t[1], self.timings))
+
+    def write(self, strm, verbose=False, rootdir=None):
+        """
+        write a summary of the plan
+        @param strm      the file stream to write to
+        @param verbose   if True, also write the new record for each
+                           up-reved product and the time taken by each step
+        @param rootdir   if given, manifest files are listed relative to
+                           this directory
+        """
+        for prod in self.getProducts():
+            filename = prod[3]
+            if rootdir and filename.startswith(rootdir + '/'):
+                filename = filename[len(rootdir)+1:]
+            print >> strm, "%-20s %-16s %s" % \
+                (prod[0], "%s+%s" % (prod[1], prod[2]), filename)
+            if verbose and prod[0] in self.records:
+                print >> strm, "    " + " ".join(self.records[prod[0]])
+        if verbose:
+            for step, secs in self.timings:
+                print >> strm, "%-28s %8.4fs" % (step, secs)
+
+class _PlannedUpdate(UpdateDependents):
+    # an UpdateDependents that shares the planner's loaded state and takes
+    # dependents from its dependency graph rather than scanning manifests.
+
+    def __init__(self, planner, prodvers):
+        UpdateDependents.__init__(self, prodvers, planner.repos.root,
+                                  planner.vcmp, planner.log,
+                                  planner.repos.storage, planner.deployed,
+                                  planner.builds)
+        self.server = planner.repos
+        self.tagged = planner.tagged
+        self.planner = planner
+
+    def findDependents(self, prodnames):
+        return self.planner.findDependents(prodnames)
+
+class UprevPlanner(object):
+    """
+    a calculator of up-rev plans for a distribution server.  The server's
+    state is loaded once (by load(), which is called implicitly on the
+    first call to plan()); each plan is then computed in memory, and
+    nothing is written to the server.  As the state is not reloaded,
+    manifests written after loading are not reflected until load() is
+    called again.
+    """
+
+    def __init__(self, rootdir, reftags=None, vercmp=None, log=None,
+                 storage=None):
+        """
+        @param rootdir   the root directory of the distribution server
+        @param reftags   the tags (in order of preference) used as a guide
+                           for choosing dependency versions, as with
+                           UpdateDependents.updateFromTag().  If None,
+                           ["current"] is used.
+        @param vercmp    the version compare function to use.  If None, a
+                           default will be used.
+        @param log       a file stream to report messages to.  If None,
+                           messages will not be written.
+        @param storage   the storage backend holding the server's files (see
+                           lsstdistrib.storage).  If None, the local
+                           filesystem is used.
+        """
+        self.repos = Repository(rootdir, storage)
+        if reftags is None:
+            reftags = ["current"]
+        self.reftags = list(reftags)
+        self.vcmp = vercmp
+        if self.vcmp is None:
+            self.vcmp = onvers.defaultVersionCompare
+        self.log = log
+        self.deployed = None
+        self.builds = None
+        self.graph = None
+        self.latest = None
+        self.tagged = None
+        self.timings = []
+
+    def isLoaded(self):
+        """return True if the server state has been loaded"""
+        return self.graph is not None
+
+    def load(self):
+        """
+        (re-)load the state of the server.  The time taken by each step is
+        recorded in the timings attribute.
+        """
+        self.timings = []
+        start = time.time()
+        onvers.Version.clearCache()
+        self.deployed = DeployedManifests(self.repos.getManifestDir(), 
+                                          self.vcmp, 
+                                          storage=self.repos.storage)
+        self.latest = dict(filter(lambda p: p[1] is not None,
+                                  self.deployed.latestProducts()))
+        start = _stamp(self.timings, "listManifests", start)
+
+        self.graph = self.deployed.getDependencyGraph()
+        start = _stamp(self.timings, "loadDependencyGraph", start)
+
+        self.builds = BuildNumberIndex(self.repos, self.deployed)
+        self.builds.build()
+        start = _stamp(self.timings, "indexBuildNumbers", start)
+
+        self.tagged = None
+        if self.reftags:
+            self.tagged = getTagStore(self.repos.storage).getStack(
+                               map(self.repos.getTagListFile, self.reftags))
+        _stamp(self.timings, "loadTags", start)
+
+    def findDependents(self, prodnames):
+        """
+        return the latest deployed dependents of each of the given products
+        from the dependency graph, in the form returned by
+        DeployedManifests.dependsOnAny().
+        """
+        out = {}
+        for prodname in prodnames:
+            deps = []
+            if prodname in self.graph:
+                deps = map(lambda p: (p, self.latest.get(p)),
+                           self.graph.getDependents(prodname))
+            out[prodname] = sorted(filter(lambda p: p[1] is not None, deps))
+        return out
+
+    def plan(self, releases, include=None, exclude=None):
+        """
+        compute the up-rev that would follow the given releases.
+        @param releases   the released products, as product-version pairs
+                             or as (product, version, manifest file)
+                             triples.  A release need not be deployed; if
+                             it is not, its manifest record is taken from
+                             the given manifest file or, failing that,
+                             derived from the record of the product's
+                             latest deployed version.
+        @param include    if not None, the names of the only dependents to
+                             up-rev
+        @param exclude    if not None, the names of dependents not to up-rev
+        @return UprevPlan
+        """
+        if not self.isLoaded():
+            self.load()
+        out = UprevPlan(map(lambda r: tuple(r[:2]), releases))
+        start = time.time()
+
+        upd = _PlannedUpdate(self, out.releases)
+        deps = upd.getDependents()
+        if include is not None or exclude:
+            deps = dict(filter(lambda d: (include is None or d[0] in include)
+                                         and d[0] not in (exclude or ()),
+                               deps.items()))
+            upd.setDependents(deps)
+        out.dependents = dict(deps)
+        start = _stamp(out.timings, "getDependents", start)
+
+        out.builds = dict(upd.setUpgradedBuildNumbers())
+        start = _stamp(out.timings, "setUpgradedBuildNumbers", start)
+
+        # a release without a record (e.g. a pseudo product) is mapped to
+        # None so that its (possibly undeployed) manifest is not looked up
+        targets = {}
+        for rel in releases:
+            targets[rel[0]] = self.getReleaseRecord(*rel)
+        out.records = upd.setUpgradedManifestRecords(targets)
+        start = _stamp(out.timings, "setUpgradedManifestRecords", start)
+
+        for prodname in deps:
+            out.manifests[prodname] = \
+                upd.createUpgradedManifest(prodname, out.records)
+            out.files[prodname] = \
+                upd.getUpgradedManifestPath(prodname, deps[prodname],
+                                            out.builds[prodname])
+        start = _stamp(out.timings, "createUpgradedManifests", start)
+
+        out.order = self.graph.sort(filter(lambda p: p in self.graph, deps))
+        out.order += sorted(filter(lambda p: p not in self.graph, deps))
+        _stamp(out.timings, "sort", start)
+
+        return out
+
+    def getReleaseRecord(self, prodname, version, manfile=None):
+        """
+        return the manifest record that dependents would use for a release,
+        or None if one cannot be determined (e.g. for a pseudo product).
+        @param prodname   the name of the released product
+        @param version    the released version, including a build number
+        @param manfile    the path to the release's manifest file.  If None,
+                            the release is assumed to be either deployed or
+                            an up-rev of the latest deployed version.
+        """
+        if manfile and self.repos.storage.isLocal():
+            return LazyManifest(manfile, "generic", prodname, version).getSelf()
+        if manfile:
+            return Manifest.fromFile(manfile, "generic", prodname, version,
+                                     self.repos.storage).getSelf()
+        if self.repos.storage.exists(self.repos.getManifestFile(prodname,
+                                                                version)):
+            return self.deployed.getLazyManifest(prodname, version).getSelf()
+
+        # derive the record from that of the latest deployed version
+        last = self.latest.get(prodname)
+        if not last:
+            raise DeployedProductNotFound(prodname, version)
+        rec = self.deployed.getLazyManifest(prodname, last).getSelf()
+        if not rec:
+            return None
+        rec = Dependency(rec)
+        oldversion = rec.data[rec.VERSION]
+        oldbase = "/%s/" % onvers.baseVersion(oldversion)
+        newbase = "/%s/" % onvers.baseVersion(version)
+        for col in xrange(len(rec.data)):
+            rec.data[col] = rec.data[col].replace(oldversion, version)
+            rec.data[col] = rec.data[col].replace(oldbase, newbase)
+        return rec.data
+
+def _stamp(timings, step, start):
+    # record the time taken by a step and return the time it ended
+    now = time.time()
+    timings.append( (step, now - start) )
+    return now
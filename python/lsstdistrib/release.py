@@ -4,12 +4,19 @@ functions related to releasing new versions of products.
 from __future__ import with_statement
 from __future__ import absolute_import
 
-import sys, os, re, shutil
+import sys, os, re, shutil, tempfile
 from .manifest import DeployedManifests, Manifest, Dependency, DeployedProductNotFound
-from .server   import Repository
-from .tags     import TagDef
+from .server   import Repository, BuildNumberIndex
+from .tagstore import TagStack, getTagStore
+from .deploy   import DeployEngine, defaultThreads
+from .journal  import UPREV, RELEASE
 from . import version as onvers
 
+# the file creation mask of the process (which can only be read by setting
+# it), applied to the temporary files written by _writeAtomically()
+_umask = os.umask(022)
+os.umask(_umask)
+
 class UprevProduct(object):
     """
     An operations class that will create an up-reved manifest using
@@ -174,7 +181,8 @@ class UpdateDependents(object):
        createManifests() to apply the customizations.  
     """
 
-    def __init__(self, prodvers, rootdir, vercmp=None, log=None):
+    def __init__(self, prodvers, rootdir, vercmp=None, log=None, 
+                 storage=None, deployed=None, builds=None, journal=None):
         """
         create an instance
         @param prodvers   the list of product-version tuple-pairs that represent
@@ -186,6 +194,22 @@ class UpdateDependents(object):
                              will be used.
         @param log        a file stream to report messages to.  If None (default)
                              messages will not be written.
+        @param storage    the storage backend holding the server's files (see
+                             lsstdistrib.storage).  If None, the local 
+                             filesystem is used.
+        @param deployed   the DeployedManifests instance to use for the 
+                             server's manifests directory.  If None, one 
+                             will be created.  
+        @param builds     the BuildNumberIndex instance to use for the 
+                             server.  If None, one will be created.  These 
+                             last two allow already loaded server state to
+                             be shared between instances (see 
+                             lsstdistrib.planner).
+        @param journal    the ReleaseJournal to record the manifests written 
+                             by createManifests() in (see 
+                             lsstdistrib.journal).  If it already holds a 
+                             plan, createManifests() resumes it.  If None, 
+                             no journal is kept.  
         """
         self.prods = prodvers
         self.deps = None
@@ -195,19 +219,39 @@ class UpdateDependents(object):
         self.tagged = None
         if self.vcmp == None:
             self.vcmp = onvers.defaultVersionCompare
-        self.server = Repository(rootdir)
-        self.deployed = DeployedManifests(self.server.getManifestDir(), 
-                                          self.vcmp)
+        self.server = Repository(rootdir, storage)
+        self.deployed = deployed
+        if not self.deployed:
+            indexfile = self.server.getDependencyIndexFile()
+            if not self.server.storage.isLocal() or \
+               not os.path.exists(indexfile):
+                indexfile = None
+            self.deployed = DeployedManifests(self.server.getManifestDir(), 
+                                          self.vcmp, indexfile, 
+                                          catalog=self.server.openCatalog(),
+                                          storage=self.server.storage)
+        self.builds = builds
+        if not self.builds:
+            self.builds = BuildNumberIndex(self.server, self.deployed)
         self.log = log
+        self.journal = journal
         self.creator = None
         self.submitter = None
 
     def updateFromTag(self, tag):
-        tagfile = self.server.getTagListFile(tag)
+        """
+        use the versions assigned the given tag to choose the versions of 
+        dependents to up-rev and of their dependencies.  A tag given in a 
+        later call takes precedence over those given earlier.  The parsed
+        tag files are shared via the process-wide TagStore (see 
+        lsstdistrib.tagstore).
+        """
+        tagged = getTagStore(self.server.storage).get(
+                                             self.server.getTagListFile(tag))
         if self.tagged:
-            self.tagged.merge(tagfile)
+            self.tagged = self.tagged.push(tagged)
         else:
-            self.tagged = TagDef(tagfile)
+            self.tagged = TagStack([tagged])
 
     def getDependents(self):
         """
@@ -217,30 +261,46 @@ class UpdateDependents(object):
         """
         if self.deps is None:
 
-            # loop on the products in target set...
+            # find the dependents of all products in target set at once
             out = {}
+            vkey = onvers.keyFunction(self.vcmp)
+            hasdir = {}
+            depsfor = self.findDependents(map(lambda p: p[0], self.prods))
             for prod in self.prods:
 
                 # merge list of dependents into full list
-                deps = self.deployed.dependsOn(prod[0])
-                for dep in deps:
+                for dep in depsfor[prod[0]]:
                     if dep[0] == prod[0]:
                         continue
-                    try:
-                        self.server.getProductDir(dep[0], dep[1])
-                    except DeployedProductNotFound:
-                        print >> self.log, \
-                          "Note: No product directory for %s %s; skipping." % \
-                          (dep[0], dep[1])
+                    if dep not in hasdir:
+                        try:
+                            self.server.getProductDir(dep[0], dep[1])
+                            hasdir[dep] = True
+                        except DeployedProductNotFound:
+                            print >> self.log, \
+                              "Note: No product directory for %s %s; skipping." % \
+                              (dep[0], dep[1])
+                            hasdir[dep] = False
+                    if not hasdir[dep]:
                         continue
                     if not out.has_key(dep[0]) or \
-                       self.vcmp(dep[1], out[dep[0]]) > 0:
+                       vkey(dep[1]) > vkey(out[dep[0]]):
                         out[dep[0]] = dep[1]
 
             self.deps = out
 
         return self.deps
 
+    def findDependents(self, prodnames):
+        """
+        return the deployed dependents of each of the given products as a
+        dictionary mapping each name to a list of product-version pairs (as
+        with DeployedManifests.dependsOnAny()).  This is used by 
+        getDependents() and may be overridden to take dependents from 
+        another source.
+        """
+        return self.deployed.dependsOnAny(prodnames)
+
     def setDependents(self, lookup):
         """
         set the product-version pairs that should be update and rebuilt
@@ -295,12 +355,7 @@ class UpdateDependents(object):
         @param version      the version.  If this includes a build number,
                                 it will be dropped and ignored.
         """
-        try:
-            deplbuild = self.deployed.getLatestBuildNumber(prodname, version)
-            undeplbuild = self.server.getLatestUndeployedBuildNumber(prodname, version)
-            return max(deplbuild, undeplbuild) + 1
-        except DeployedProductNotFound, ex:
-            return 1
+        return self.builds.recommendNextBuildNumber(prodname, version)
              
     def createManifests(self):
         """
@@ -309,26 +364,72 @@ class UpdateDependents(object):
         directory.  Each file is written via with writeUpgradedManifest() 
         using a filename of the form "b*.manifest" where * is the new 
         build number.  
+
+        If a journal is kept, the full set of manifests is recorded in it
+        before any is written, and each is recorded as it is written.  If 
+        the journal already holds such a plan (from an interrupted run), 
+        the plan is resumed as is:  the dependents are not looked up 
+        again, and only the manifests not yet written are written.
         @return list of four-tuples containing the product, base version, build, 
                           and updated manifest file created
         """
+        if self.journal and self.journal.getPlan(UPREV) is not None:
+            return self._resumeManifests()
+
         if not self.upgrecs:
             self.setUpgradedManifestRecords()
 
         out = []
+        plan = []
         for prod in self.upgblds:
             man = self.createUpgradedManifest(prod, self.upgrecs)
             man.creator = self.creator
             man.submitter = self.submitter
+            if self.journal:
+                plan.append({"prod": prod, 
+                             "version": onvers.baseVersion(self.deps[prod]),
+                             "build": str(self.upgblds[prod]), 
+                             "file": self.getUpgradedManifestPath(prod, 
+                                         self.deps[prod], self.upgblds[prod]),
+                             "text": repr(man)})
+                continue
             fname = self.writeUpgradedManifest(man, prod, self.deps[prod], 
                                                self.upgblds[prod])
 
             out.append( (prod, onvers.baseVersion(self.deps[prod]), 
                          self.upgblds[prod], fname) )
 
+        if self.journal:
+            self.journal.plan(UPREV, plan)
+            return self._resumeManifests()
+
         # report the new products 
         return out
 
+    def _resumeManifests(self):
+        # write the journaled manifests not yet written
+        storage = self.server.storage
+        for item in self.journal.getPending(UPREV):
+            if not self.journal.isCarriedOut(UPREV, item, storage):
+                if storage.exists(item["file"]):
+                    raise RuntimeError("Manifest file already exists; won't overwrite: " + item["file"])
+                _writeAtomically(item["file"], item["text"], storage)
+            self._noteWritten(item["prod"], item["version"], item["build"], 
+                              item["file"], True)
+
+        return map(lambda i: (i["prod"], i["version"], i["build"], i["file"]),
+                   self.journal.getPlan(UPREV))
+
+    def getUpgradedManifestPath(self, prodname, version, build, filename=None):
+        """
+        return the full path that writeUpgradedManifest() will write a 
+        manifest to.  The arguments are as for writeUpgradedManifest().
+        """
+        if not filename:
+            filename = "b%s.manifest" % str(build)
+        pdir = self.server.getProductDir(prodname, onvers.baseVersion(version))
+        return os.path.join(pdir, filename)
+
     def writeUpgradedManifest(self, manifest, prodname, version, build, 
                               filename=None):
         """
@@ -345,20 +446,34 @@ class UpdateDependents(object):
                             default "b*.manifest" will be used.
         @return str   the full path to the written manifest
         """
-        if not filename:
-            filename = "b%s.manifest" % str(build)
         version = onvers.baseVersion(version)
-
-        pdir = self.server.getProductDir(prodname, version)
-        out = os.path.join(pdir, filename)
-        if os.path.exists(out):
+        out = self.getUpgradedManifestPath(prodname, version, build, filename)
+        storage = self.server.storage
+        if storage.exists(out):
             raise RuntimeError("Manifest file already exists; won't overwrite: " + out)
 
-        with open(out, 'w') as fout:
-            manifest.write(fout)
+        if self.journal:
+            # a journaled manifest is never seen half-written
+            _writeAtomically(out, repr(manifest), storage)
+        elif storage.isLocal():
+            manifest.writeFile(out)
+        else:
+            with storage.open(out, 'w') as fd:
+                manifest.write(fd)
+        self._noteWritten(prodname, version, build, out)
 
         return out
 
+    def _noteWritten(self, prodname, version, build, filename, resuming=False):
+        # when resuming a journaled plan, the build number index is not
+        # loaded just to note the write, as that would rescan the server.
+        if not resuming or self.builds.isLoaded():
+            self.builds.noteUndeployed(prodname, version, build)
+        if self.server.catalog:
+            self.server.catalog.noteUndeployed(prodname, version, build)
+        if self.journal:
+            self.journal.noteDone(UPREV, [filename])
+
     def createUpgradedManifest(self, prodname, upgradedRecords=None):
         """
         return an updated manifest for a given dependent (as a Manifest 
@@ -398,7 +513,7 @@ class UpdateDependents(object):
                 elif self.tagged:
                     pname = rec.getName()
                     dver = self.tagged.getVersion(pname)
-                    dman = self.deployed.getManifest(pname, dver)
+                    dman = self.deployed.getLazyManifest(pname, dver)
                     if dman:
                         rec = dman.getSelf()
                         if not rec:
@@ -429,7 +544,10 @@ class UpdateDependents(object):
                              manifest records.  Records are represented as an array
                              of manifest file column data (in order of product,
                              flavor, version, table path, install path, and 
-                             install ID).
+                             install ID).  A product mapped to None has no 
+                             record (e.g. a pseudo product):  its manifest 
+                             is not looked up, and it is left out of the 
+                             result.
         @param uselatest  if True, ensure that the latest deployed build of the 
                              dependent product will be used to create an updated 
                              manifest record.  If False, the build specified in 
@@ -450,7 +568,7 @@ class UpdateDependents(object):
 
             vers = self.deps[prod]
             if uselatest:
-                lastbuild = self.deployed.getLatestBuildNumber(prod, vers)
+                lastbuild = self.builds.getLatestDeployedBuildNumber(prod, vers)
                 vers = onvers.substituteBuild(vers, lastbuild)
 
             rec = self.getUpdatedRecordFor(prod, vers, self.upgblds[prod])
@@ -464,13 +582,15 @@ class UpdateDependents(object):
             if upgrecs.has_key(prod[0]):
                 continue
             # open up the manifest for that product:
-            man = self.deployed.getManifest(prod[0], prod[1])
+            man = self.deployed.getLazyManifest(prod[0], prod[1])
             rec = man.getSelf()
             if not rec:
                 # this may be a pseudo product
                 continue
             upgrecs[prod[0]] = rec
 
+        for prod in filter(lambda p: upgrecs[p] is None, upgrecs.keys()):
+            del upgrecs[prod]
         self.upgrecs = upgrecs
         return upgrecs
 
@@ -491,7 +611,7 @@ class UpdateDependents(object):
         @return list   manifest column data for the requested product
         """
         # open up the specified version of this dependency
-        man = self.deployed.getManifest(prodname, oldversion)
+        man = self.deployed.getLazyManifest(prodname, oldversion)
         rec = man.getSelf()
         if not rec:
             return None
@@ -524,7 +644,8 @@ class Release(object):
     download.  
     """
 
-    def __init__(self, manifests, rootdir, log=None):
+    def __init__(self, manifests, rootdir, log=None, storage=None,
+                 threads=defaultThreads, methods=None, journal=None):
         """
         instantiate the class
         @param manifests   a list of manifests identified by a 3- or 4-tuple.  The 
@@ -535,10 +656,26 @@ class Release(object):
                              will be determined by examinging the server.  
         @param rootdir     the root directory of the distribution server
         @param log         a file stream for sending messages.
+        @param storage     the storage backend holding the server's files (see
+                             lsstdistrib.storage).  If None, the local 
+                             filesystem is used.
+        @param threads     the maximum number of threads used to check and
+                             deploy the manifest files
+        @param methods     the ways to deploy a file to try, in order (see 
+                             lsstdistrib.deploy.DeployEngine).  If None, a
+                             hard link is tried first, then a reflink, then
+                             a copy.
+        @param journal     the ReleaseJournal to record the deployed files in 
+                             (see lsstdistrib.journal).  If it already holds 
+                             a plan, releaseAll() resumes it, and manifests
+                             is ignored.  If None, no journal is kept.
         """
-        self.repos = Repository(rootdir)
+        self.repos = Repository(rootdir, storage)
         self.manifests = manifests
         self.log = log
+        self.journal = journal
+        self.engine = DeployEngine(self.repos.storage, threads, methods)
+        self.timings = []
 
     def parseProductManifestPath(mpath):
         fields = mpath.split('/')
@@ -562,6 +699,132 @@ class Release(object):
     def makeDestPath(self, mandata):
         return self.repos.getManifestFile(mandata[0], mandata[1])
 
+    def openDependencyIndex(self):
+        """
+        return the server's reverse-dependency index, brought up to date 
+        with the manifests directory, or None if the server does not 
+        maintain one (or is not held on the local filesystem).
+        """
+        indexfile = self.repos.getDependencyIndexFile()
+        if not self.repos.storage.isLocal() or not os.path.exists(indexfile):
+            return None
+        deployed = DeployedManifests(self.repos.getManifestDir(), 
+                                     indexfile=indexfile)
+        deployed.index.ensureCurrent(False)
+        return deployed.index
+
+    def _locate(self, man):
+        # return the source and destination paths for a manifest and 
+        # whether the destination exists
+        src = man[2]
+        storage = self.repos.storage
+        if not storage.exists(src):
+            cat = (len(man) > 3 and man[3]) or None
+            src = os.path.join(
+                self.repos.getProductDir(man[0], man[1], category=cat),
+                os.path.basename(man[2]))
+
+        dest = self.makeDestPath(man)
+        return (src, dest, storage.exists(dest))
+
+    def publishStaged(self, pairs, overwrite=False):
+        """
+        deploy a batch of files into the manifests directory as a unit.
+        The files are first deployed into a staging directory on the same 
+        filesystem; if that fails, the staging directory is removed and 
+        the manifests directory is left untouched.  The staged files are 
+        then moved into place, one rename (or, if overwrite is False, one 
+        hard link) per file, between an increment of the manifests 
+        directory's generation marker to an odd value and one to an even 
+        value (see lsstdistrib.generation), so that readers
+        that honor the marker (like DeployedManifests) see either none or 
+        all of the batch.  If a file cannot be moved into place (including 
+        because, without overwrite, its destination has since been created),
+        those already moved are undone before the error is raised.
+        @param pairs      the (source, destination) path pairs to deploy
+        @param overwrite  if True, replace destinations that already exist
+        """
+        if not pairs:
+            return
+        stage = self.repos.makeStagingDir()
+        try:
+            staged = map(lambda p: os.path.join(stage, os.path.basename(p[1])),
+                         pairs)
+            results = self.engine.deployAll(zip(map(lambda p: p[0], pairs),
+                                                staged))
+            for (src, dest), (method, secs, ex) in zip(pairs, results):
+                if ex is not None:
+                    raise ex
+                self.timings.append( (dest, method, secs) )
+
+            # keep links to the files being replaced so that they can be
+            # restored if the publication fails
+            saved = {}
+            if overwrite:
+                olddir = os.path.join(stage, "replaced")
+                os.mkdir(olddir)
+                for src, dest in pairs:
+                    if os.path.exists(dest):
+                        saved[dest] = os.path.join(olddir, 
+                                                   os.path.basename(dest))
+                        os.link(dest, saved[dest])
+
+            marker = self.repos.getGenerationMarker()
+            marker.begin()
+            published = []
+            try:
+                for path, (src, dest) in zip(staged, pairs):
+                    if overwrite:
+                        os.rename(path, dest)
+                    else:
+                        # unlike rename, link fails (with EEXIST) if the 
+                        # destination appeared since it was checked
+                        os.link(path, dest)
+                        os.remove(path)
+                    published.append(dest)
+            except EnvironmentError:
+                for dest in published:
+                    if dest in saved:
+                        os.rename(saved[dest], dest)
+                    else:
+                        os.remove(dest)
+                raise
+            finally:
+                marker.end()
+        finally:
+            shutil.rmtree(stage, True)
+
+    def _planRelease(self, overwrite):
+        # return the manifests to deploy as (manifest, (src, dest, exists)) 
+        # pairs, taking them from (or recording them in) the journal
+        if not self.journal or self.journal.getPlan(RELEASE) is None:
+            out = zip(self.manifests, 
+                      self.engine.map(self._locate, self.manifests))
+            if self.journal:
+                # files that exist and won't be overwritten are not part 
+                # of the run
+                plan = []
+                for man, (src, dest, exists) in out:
+                    if overwrite or not exists:
+                        plan.append({"prod": man[0], "version": man[1], 
+                                     "src": src, "file": dest, 
+                                     "exists": exists})
+                self.journal.plan(RELEASE, plan)
+            return out
+
+        storage = self.repos.storage
+        out = []
+        for item in self.journal.getPending(RELEASE):
+            if self.journal.isCarriedOut(RELEASE, item, storage):
+                # deployed before the previous run could record it
+                self.journal.noteDone(RELEASE, [item["file"]], 
+                                      (item["exists"] and [item["file"]]) or None)
+                continue
+            out.append( ((item["prod"], item["version"], item["src"]), 
+                         (item["src"], item["file"], 
+                          storage.exists(item["file"]))) )
+        return out
+
     def releaseAll(self, overwrite=False, atomic=False):
         """
         release all configured manifest files.  
@@ -569,22 +832,38 @@ class Release(object):
                             already exists.  Otherwise, overwrite the destination
                             file if it exists.
         @param atomic     if False, try to copy as many files as possible; 
-                            otherwise, attempt an atomic operation, rolling back
-                            the copies if any errors are encountered.
+                            otherwise, attempt an atomic operation:  all of the
+                            files are deployed or none are.  
+
+        The files are located and then deployed on a pool of threads (see 
+        lsstdistrib.deploy.DeployEngine); messages are still reported in the
+        order the manifests were given.  The method used for and the time 
+        taken by each deployment are recorded in the timings attribute as a
+        list of (destination, method, seconds) tuples.
+
+        An atomic release on the local filesystem is staged (see 
+        publishStaged()):  readers of the manifests directory see either 
+        the old set of manifests or the new set, and a failure while 
+        staging leaves the manifests directory untouched.  
+
+        If a journal is kept, the files to deploy are recorded in it before
+        any is deployed, and each is recorded once it is deployed.  If the
+        journal already holds such a plan (from an interrupted run), the 
+        manifests are not located again; only the files not yet deployed
+        are deployed.
         """
         failed = []
         copied = []
+        released = []
+        storage = self.repos.storage
+        index = self.openDependencyIndex()
+        catalog = self.repos.openCatalog()
+        wasCurrent = catalog and catalog.isCurrent()
+        self.timings = []
         try:
-            for man in self.manifests:
-                src = man[2]
-                if not os.path.exists(src):
-                    cat = (len(man) > 3 and man[3]) or None
-                    src = os.path.join(
-                        self.repos.getProductDir(man[0], man[1], category=cat),
-                        os.path.basename(man[2]))
-
-                dest = self.makeDestPath(man)
-                if not overwrite and os.path.exists(dest):
+            todo = []
+            for man, (src, dest, exists) in self._planRelease(overwrite):
+                if not overwrite and exists:
                     failed.append( (src, dest, 
                                     "deployed manifest already exists") )
                     if atomic:  
@@ -592,24 +871,77 @@ class Release(object):
                     elif self.log:
                         print >> self.log, "Destination file already exists: %s" % dest
                     continue
-
-                try:
-                    shutil.copyfile(src, dest)
+                todo.append( (man, src, dest, exists) )
+
+            if atomic and storage.isLocal():
+                replaced = filter(lambda t: t[3], todo)
+                self.publishStaged(map(lambda t: t[1:3], todo), overwrite)
+                released.extend(map(lambda t: (t[0][0], t[0][1]), todo))
+                if self.journal:
+                    self.journal.noteDone(RELEASE, 
+                                          map(lambda t: t[2], todo),
+                                          map(lambda t: t[2], replaced))
+                if self.log and todo:
+                    print >> self.log, "Deployed %d manifests" % len(todo)
+                return
+
+            results = self.engine.deployAll(map(lambda t: t[1:3], todo), 
+                                            overwrite)
+            errors = []
+            replaced = []
+            for (man, src, dest, exists), (method, secs, ex) in \
+                    zip(todo, results):
+                if ex is None:
                     copied.append(dest)
+                    if exists:
+                        replaced.append(dest)
+                    released.append( (man[0], man[1]) )
+                    self.timings.append( (dest, method, secs) )
                     if not atomic and self.log:
                         print >> self.log, "Deployed", os.path.basename(dest)
-                except OSError, ex:
+                else:
                     failed.append( (src, dest, str(ex)) )
-                    if atomic:  raise
-                    elif self.log:
+                    errors.append(ex)
+                    if not atomic and self.log:
                         print >> self.log, "Trouble copying file: %s: %s" % \
                             (str(ex), man[2])
+            if atomic and errors:
+                raise errors[0]
+            if self.journal:
+                self.journal.noteDone(RELEASE, copied, replaced)
 
         finally:
             if atomic and failed:
                 for filepath in copied:
                     try:
-                        os.remove(filepath)
+                        storage.remove(filepath)
                     except Exception:
                         pass
-
+            elif released:
+                if index:
+                    index.update(released)
+                    index.save()
+                if catalog:
+                    catalog.addDeployed(released, wasCurrent)
+
+def _writeAtomically(filename, text, storage):
+    # write a file in full before renaming it into place.  The temporary 
+    # file is uniquely named (so that threads writing the same file do not
+    # collide) and is given the permissions a plain open() would give.
+    # Storage other than the local filesystem cannot rename, so the file 
+    # is written in place; a backend's files are not atomic unless it 
+    # makes them so (a MemoryStorage file appears only when it is closed).
+    if storage.isLocal():
+        (fd, tmpfile) = tempfile.mkstemp(prefix=os.path.basename(filename) +
+                                         ".tmp", dir=os.path.dirname(filename))
+        try:
+            with os.fdopen(fd, 'w') as out:
+                out.write(text)
+            os.chmod(tmpfile, 0666 & ~_umask)
+            os.rename(tmpfile, filename)
+        except:
+            os.remove(tmpfile)
+            raise
+    else:
+        with storage.open(filename, 'w') as fd:
+            fd.write(text)
@@ -3,9 +3,12 @@ functions related to the storage of products artifacts on the server
 """
 from __future__ import absolute_import
 
-import sys, os, re
+import sys, os, re, tempfile
 from . import version as onvers
 from . import manifest 
+from .catalog import Catalog
+from .storage import defaultStorage
+from .generation import GenerationMarker
 
 
 class Repository(object):
@@ -16,10 +19,21 @@ class Repository(object):
     pseudoDirName = "pseudo"
     manifestDirName = "manifests"
     externalDirName = "external"
+    dependencyIndexFileName = "dependents.index"
+    catalogFileName = "catalog.sqlite"
+    stagingDirPrefix = ".release-"
     undeployedManifestFileRe = re.compile(r'^b(\d+)' + manifest.extension + '$')
 
-    def __init__(self, rootdir):
+    def __init__(self, rootdir, storage=None):
+        """
+        @param rootdir   the root directory of the server
+        @param storage   the storage backend holding the server's files (see
+                            lsstdistrib.storage).  If None, the local 
+                            filesystem is used.
+        """
         self.root = rootdir
+        self.storage = storage or defaultStorage
+        self.catalog = None
 
     def getPseudoProductRoot(self):
         return os.path.join(self.root, self.pseudoDirName)        
@@ -37,6 +51,41 @@ class Repository(object):
     def getTagListFile(self, tagname):
         return os.path.join(self.root, "%s.list" % tagname)
 
+    def getDependencyIndexFile(self):
+        return os.path.join(self.root, self.dependencyIndexFileName)
+
+    def getGenerationMarker(self):
+        """
+        return the GenerationMarker for the manifests directory (see 
+        lsstdistrib.generation)
+        """
+        return GenerationMarker(self.getManifestDir(), self.storage)
+
+    def makeStagingDir(self):
+        """
+        create and return a new, uniquely named directory for staging files
+        to be moved into the server.  It is created under the root 
+        directory (so that files can be renamed from it into the manifests
+        directory) with a name beginning with a period (so that it is not 
+        mistaken for a product).  The caller should remove it when done.
+        """
+        return tempfile.mkdtemp(prefix=self.stagingDirPrefix, dir=self.root)
+
+    def getCatalogFile(self):
+        return os.path.join(self.root, self.catalogFileName)
+
+    def openCatalog(self):
+        """
+        return the server's catalog (see lsstdistrib.catalog), or None if 
+        the server does not maintain one (or is not held on the local 
+        filesystem).  Once opened, the catalog is consulted by 
+        getProductDir() whenever it is current.
+        """
+        if self.catalog is None and self.storage.isLocal() and \
+           os.path.exists(self.getCatalogFile()):
+            self.catalog = Catalog(self.getCatalogFile(), self)
+        return self.catalog
+
     def getProductDir(self, prodname, version=None, flavor=None, category=None):
         """
         return the directory that contains the product artifacts
@@ -53,17 +102,20 @@ class Repository(object):
             pdir = os.path.join(self.root, prodname)
         elif category:
             pdir = os.path.join(self.root, category, prodname)
+        elif self.catalog and self.catalog.isCurrent() and \
+             self.catalog.getProductDir(prodname):
+            pdir = self.catalog.getProductDir(prodname)
         else:
             lpdir = os.path.join(self.root, prodname)
             epdir = os.path.join(self.getExternalProductRoot(), prodname)
             ppdir = os.path.join(self.getPseudoProductRoot(), prodname)
 
             # try to figure it out
-            if os.path.exists(lpdir):
+            if self.storage.exists(lpdir):
                 pdir = lpdir
-            elif os.path.exists(epdir):
+            elif self.storage.exists(epdir):
                 pdir = epdir
-            elif os.path.exists(ppdir):
+            elif self.storage.exists(ppdir):
                 pdir = ppdir
             else:
                 msg = "No product directory found for " + prodname
@@ -82,7 +134,7 @@ class Repository(object):
         pdir = self.getProductDir(prodname, version, flavor)
 
         files = []
-        for filenm in os.listdir(pdir):
+        for filenm in self.storage.listdir(pdir):
             mat = self.undeployedManifestFileRe.match(filenm)
             if mat:
                 files.append((filenm, int(mat.group(1))))
@@ -124,3 +176,171 @@ class Repository(object):
         n = self.getLatestUndeployedBuildNumber(prodname, version, flavor) + 1
         return self.manifestTemplate % n
 
+class BuildNumberIndex(object):
+    """
+    an in-memory index of the highest build numbers in use for each tagged
+    version of each product, both deployed (i.e. in the manifests directory)
+    and undeployed (i.e. as bN.manifest files in the product directories).
+    The index is built in one pass over the manifests directory and the 
+    product directories the first time it is queried, so that a single 
+    instance can answer all the build number queries of a whole up-rev 
+    run.  It can be told about new manifests as they are written (via 
+    noteUndeployed() and noteDeployed()) to remain consistent.
+    """
+
+    def __init__(self, repos, deployed=None):
+        """
+        @param repos      the Repository to index
+        @param deployed   the DeployedManifests instance for the repository's
+                            manifests directory.  If None, one will be 
+                            created.
+        """
+        self.repos = repos
+        self.deployed = deployed
+        if not self.deployed:
+            self.deployed = manifest.DeployedManifests(repos.getManifestDir(),
+                                                       storage=repos.storage)
+        self.products = None
+        self.deployedBuilds = None
+        self.productDirs = None
+        self.undeployedBuilds = None
+
+    def isLoaded(self):
+        """return True if the index has been built"""
+        return self.products is not None
+
+    def build(self):
+        """
+        (re-)build the index from the manifests and product directories.
+        """
+        self.products = set()
+        self.deployedBuilds = {}
+        for prodname, version in self.deployed.listAll():
+            self.products.add(prodname)
+            if version is not None:
+                self.noteDeployed(prodname, version)
+
+        self.productDirs = {}
+        self.undeployedBuilds = {}
+        skip = set([self.repos.manifestDirName, self.repos.externalDirName,
+                    self.repos.pseudoDirName])
+
+        # product directories are looked for in the same order as 
+        # Repository.getProductDir() does.
+        storage = self.repos.storage
+        for catroot in [self.repos.root, self.repos.getExternalProductRoot(),
+                        self.repos.getPseudoProductRoot()]:
+            if not storage.isdir(catroot):
+                continue
+            for prodname in storage.listdir(catroot):
+                if prodname in self.productDirs or prodname.startswith('.') \
+                   or (catroot == self.repos.root and prodname in skip):
+                    continue
+                pdir = os.path.join(catroot, prodname)
+                if not storage.isdir(pdir):
+                    continue
+                self.productDirs[prodname] = pdir
+                self._indexProductDir(prodname, pdir)
+
+    def _indexProductDir(self, prodname, pdir):
+        storage = self.repos.storage
+        for version in storage.listdir(pdir):
+            vdir = os.path.join(pdir, version)
+            if not storage.isdir(vdir):
+                continue
+            build = 0
+            for filenm in storage.listdir(vdir):
+                mat = self.repos.undeployedManifestFileRe.match(filenm)
+                if mat:
+                    build = max(build, int(mat.group(1)))
+            self.undeployedBuilds[(prodname, version)] = build
+
+    def _ensureLoaded(self):
+        if not self.isLoaded():
+            self.build()
+
+    def noteDeployed(self, prodname, version):
+        """
+        record that a manifest for the given product version has been 
+        deployed.
+        @param prodname   the name of the product
+        @param version    the full version, including the build number
+        """
+        self._ensureLoaded()
+        self.products.add(prodname)
+        v = onvers.Version(version)
+        if v.qualifier == '+' and v.build is not None:
+            key = (prodname, v.release)
+            self.deployedBuilds[key] = max(v.build, 
+                                           self.deployedBuilds.get(key, 0))
+
+    def noteUndeployed(self, prodname, version, build):
+        """
+        record that an undeployed manifest for the given build has been 
+        written into its product directory.
+        @param prodname   the name of the product
+        @param version    the version of the product.  If this includes a
+                            build number, it will be dropped and ignored.
+        @param build      the build number of the manifest
+        """
+        self._ensureLoaded()
+        key = (prodname, onvers.baseVersion(version))
+        self.undeployedBuilds[key] = max(int(build), 
+                                         self.undeployedBuilds.get(key, 0))
+        if prodname not in self.productDirs:
+            self.productDirs[prodname] = self.repos.getProductDir(prodname)
+
+    def getLatestDeployedBuildNumber(self, prodname, version):
+        """
+        return the largest build number that has been deployed for the 
+        given version of a product (see 
+        DeployedManifests.getLatestBuildNumber()).
+        @param prodname    the name of the product
+        @param version     the version of the product.  If the value 
+                             includes a build number, it will be ignored.
+        @throws DeployedProductNotFound  if no build of the version has been
+                             deployed
+        """
+        self._ensureLoaded()
+        version = onvers.baseVersion(version)
+        build = self.deployedBuilds.get((prodname, version))
+        if build is None:
+            raise manifest.DeployedProductNotFound(prodname, version)
+        return build
+
+    def getLatestUndeployedBuildNumber(self, prodname, version):
+        """
+        return the largest build number of the undeployed manifests in the
+        given product version's directory, or 0 if there are none (see
+        Repository.getLatestUndeployedBuildNumber()).
+        @param prodname    the name of the product
+        @param version     the version of the product.  If the value 
+                             includes a build number, it will be ignored.
+        @throws DeployedProductNotFound  if the product has no product 
+                             directory
+        """
+        self._ensureLoaded()
+        if prodname not in self.productDirs:
+            msg = "No product directory found for " + prodname
+            raise manifest.DeployedProductNotFound(prodname, msg=msg)
+        return self.undeployedBuilds.get((prodname, 
+                                          onvers.baseVersion(version)), 0)
+
+    def recommendNextBuildNumber(self, prodname, version):
+        """
+        return one plus the highest build number in use, deployed or 
+        undeployed, for the given product version, or 1 if no build of 
+        the version exists in either form.
+        @param prodname     the name of the product
+        @param version      the version.  If this includes a build number,
+                                it will be dropped and ignored.
+        """
+        try:
+            deployed = self.getLatestDeployedBuildNumber(prodname, version)
+        except manifest.DeployedProductNotFound:
+            deployed = 0
+        try:
+            undeployed = self.getLatestUndeployedBuildNumber(prodname, version)
+        except manifest.DeployedProductNotFound:
+            undeployed = 0
+        return max(deployed, undeployed) + 1
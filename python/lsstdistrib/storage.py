@@ -0,0 +1,222 @@
+"""
+storage backends for the files that make up a distribution server.  The
+classes that read and write the server (DeployedManifests, Repository,
+TagDef, UpdateDependents, and Release) do their file access through a
+Storage instance, so that the server can be held in memory for
+simulations, benchmarks, and dry runs.  Two backends are provided:
+FileStorage, which accesses the local filesystem (the default), and
+MemoryStorage, which holds files in memory, optionally as an overlay on
+top of another backend.
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, errno, shutil, StringIO
+
+class Storage(object):
+    """
+    the interface for a storage backend.  Paths are given in the same
+    form as for the filesystem.
+    """
+
+    def isLocal(self):
+        """
+        return True if the paths refer to files on the local filesystem,
+        so that they may be handed to external tools (like grep) and
+        other processes.
+        """
+        return False
+
+    def exists(self, path):
+        """return True if the file or directory exists"""
+        raise NotImplementedError("exists")
+
+    def isdir(self, path):
+        """return True if the path is an existing directory"""
+        raise NotImplementedError("isdir")
+
+    def listdir(self, path):
+        """return the names of the entries in a directory"""
+        raise NotImplementedError("listdir")
+
+    def open(self, path, mode='r'):
+        """
+        return a file-like object for reading (mode 'r') or writing
+        (mode 'w') a file.  The object can be used as a context manager.
+        """
+        raise NotImplementedError("open")
+
+    def read(self, path):
+        """return the contents of a file"""
+        with self.open(path) as fd:
+            return fd.read()
+
+    def copy(self, src, dest):
+        """copy a file, replacing the destination if it exists"""
+        raise NotImplementedError("copy")
+
+    def remove(self, path):
+        """remove a file"""
+        raise NotImplementedError("remove")
+
+    def makedirs(self, path):
+        """create a directory along with any missing parent directories"""
+        raise NotImplementedError("makedirs")
+
+class FileStorage(Storage):
+    """
+    a storage backend for the local filesystem
+    """
+
+    def isLocal(self):
+        return True
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def open(self, path, mode='r'):
+        return open(path, mode)
+
+    def copy(self, src, dest):
+        shutil.copyfile(src, dest)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def makedirs(self, path):
+        os.makedirs(path)
+
+class _MemoryFile(StringIO.StringIO):
+    # a file open for writing in a MemoryStorage; its contents are saved
+    # when it is closed.
+    def __init__(self, storage, path):
+        StringIO.StringIO.__init__(self)
+        self._storage = storage
+        self._path = path
+
+    def close(self):
+        if not self.closed:
+            self._storage._save(self._path, self.getvalue())
+        StringIO.StringIO.close(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class _MemoryReader(StringIO.StringIO):
+    # a file open for reading in a MemoryStorage
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class MemoryStorage(Storage):
+    """
+    a storage backend that holds files in memory.  If it is given a base
+    backend, it acts as an overlay:  files not written to memory are read
+    from the base, while all changes (writes, copies, and removals) are
+    made in memory only, leaving the base untouched.  This allows an
+    operation to be run for real against an existing server without
+    changing it.
+    """
+
+    def __init__(self, base=None):
+        """
+        @param base   the backend to overlay, or None for an empty storage
+        """
+        self.base = base
+        self.files = {}
+        self.dirs = set()
+        self.removed = set()
+        self._entries = {}
+
+    def _norm(self, path):
+        return os.path.normpath(path)
+
+    def _baseHas(self, path, check):
+        # apply the named check (e.g. "exists") to the base backend
+        return self.base is not None and path not in self.removed and \
+               getattr(self.base, check)(path)
+
+    def exists(self, path):
+        path = self._norm(path)
+        return path in self.files or path in self.dirs or \
+               self._baseHas(path, "exists")
+
+    def isdir(self, path):
+        path = self._norm(path)
+        return path in self.dirs or \
+               (path not in self.files and
+                self._baseHas(path, "isdir"))
+
+    def listdir(self, path):
+        path = self._norm(path)
+        names = set(self._entries.get(path, ()))
+        if self._baseHas(path, "isdir"):
+            for name in self.base.listdir(path):
+                if os.path.join(path, name) not in self.removed:
+                    names.add(name)
+        elif path not in self.dirs:
+            raise OSError(errno.ENOENT, "No such directory", path)
+        return list(names)
+
+    def open(self, path, mode='r'):
+        path = self._norm(path)
+        if 'w' in mode:
+            parent = os.path.dirname(path)
+            if parent and not self.isdir(parent):
+                raise IOError(errno.ENOENT, "No such directory", parent)
+            return _MemoryFile(self, path)
+        if path in self.files:
+            return _MemoryReader(self.files[path])
+        if self._baseHas(path, "exists"):
+            return _MemoryReader(self.base.read(path))
+        raise IOError(errno.ENOENT, "No such file", path)
+
+    def _save(self, path, data):
+        self.files[path] = data
+        self.removed.discard(path)
+        self._addEntry(path)
+
+    def _addEntry(self, path):
+        parent, name = os.path.split(path)
+        while name:
+            self._entries.setdefault(parent, set()).add(name)
+            if parent in self.dirs:
+                break
+            self.dirs.add(parent)
+            parent, name = os.path.split(parent)
+
+    def copy(self, src, dest):
+        with self.open(dest, 'w') as fd:
+            fd.write(self.read(src))
+
+    def remove(self, path):
+        path = self._norm(path)
+        if path in self.files:
+            del self.files[path]
+            parent, name = os.path.split(path)
+            self._entries.get(parent, set()).discard(name)
+        elif not self._baseHas(path, "exists"):
+            raise OSError(errno.ENOENT, "No such file", path)
+        if self.base is not None:
+            self.removed.add(path)
+
+    def makedirs(self, path):
+        path = self._norm(path)
+        if self.exists(path):
+            raise OSError(errno.EEXIST, "File exists", path)
+        self.removed.discard(path)
+        self._addEntry(path)
+        self.dirs.add(path)
+
+defaultStorage = FileStorage()
@@ -5,30 +5,42 @@ which products/versions are a assigned a particular tag by the project.
 from __future__ import absolute_import
 from __future__ import with_statement
 
-import sys, os, re, cStringIO
+import sys, os, re, shutil, cStringIO
+from .storage import defaultStorage
 
 class TagDef(object):
 
-    def __init__(self, tagfile):
+    def __init__(self, tagfile, storage=None):
+        """
+        @param tagfile   the tag file to load
+        @param storage   the storage backend to read tag files from (see 
+                            lsstdistrib.storage).  If None, the local 
+                            filesystem is used.
+        """
         self.file = tagfile
+        self.storage = storage or defaultStorage
         self.prod = {}
         self._load(tagfile)
 
     def _load(self, tagfile):
-        with open(tagfile) as cf:
-            parts = []
-            for line in cf:
-                line = line.strip()
-                if line.startswith('#'):
-                    continue
-
-                parts = re.findall(r"\S+", line)
-                if len(parts) > 2:
-                    if len(parts) < 4:
-                        parts.append('')
-                self.prod[parts[0]] = parts
+        self._parse(self.storage.read(tagfile))
+
+    def _parse(self, data):
+        for line in data.splitlines():
+            parts = line.split()
+            if not parts or parts[0].startswith('#'):
+                continue
+            if len(parts) > 2:
+                if len(parts) < 4:
+                    parts.append('')
+            self.prod[parts[0]] = parts
 
     def merge(self, tagfile):
+        """
+        load another tag file on top of this one.  Note that TagDef 
+        instances shared via a TagStore (see lsstdistrib.tagstore) must 
+        not be merged into; layer them with a TagStack instead.
+        """
         self.file = '+' + tagfile
         self._load(tagfile)
 
@@ -60,3 +72,188 @@ class TagDef(object):
             return (data[2], path)
         return (None, None)
 
+
+class TagFileEditor(object):
+    """
+    an editor for a tag file.  The file is read once; any number of 
+    products can then be assigned versions (via setVersion() or apply()),
+    and the edited file is written out in a single pass by write().  A 
+    product that is already listed has its record updated in place 
+    (whichever section it is in); a new product is inserted into its 
+    section (e.g. "external", "lsst", or "pseudo") in alphabetical order.  
+    All other lines are written as they were.
+    """
+
+    # a comment holding just a section name, either in brackets (e.g. 
+    # "# [external]") or bare (e.g. "# external").  A bare name is only a 
+    # section header when framed by comment lines holding just "#" (the 
+    # way the files are laid out and new sections are written), so that a 
+    # one-word comment such as "# obsolete" is not taken for one.
+    sectionRe = re.compile(r"^\s*#\s*(?:\[(\w+)\]|(\w+))\s*$")
+
+    def __init__(self, tagfile, storage=None):
+        """
+        @param tagfile   the tag file to edit
+        @param storage   the storage backend holding the tag file (see 
+                            lsstdistrib.storage).  If None, the local 
+                            filesystem is used.
+        """
+        self.file = tagfile
+        self.storage = storage or defaultStorage
+        self._load(self.storage.read(tagfile))
+
+    def _load(self, data):
+        self.lines = data.splitlines()
+        self.records = {}     # product name -> indices of its record lines
+        self.updates = {}     # product name -> new version
+        self.inserts = {}     # section -> product name -> new record
+        widths = []
+        for i in xrange(len(self.lines)):
+            line = self.lines[i]
+            if line.startswith("#---"):
+                widths = map(len, line.split())
+            elif self._isRecord(i):
+                self.records.setdefault(line.split()[0], []).append(i)
+        widths = widths[:5] + [10] * (5 - len(widths[:5]))
+        self.fmt = "  ".join(map(lambda w: "%%-%ds" % w, widths))
+
+    def _sectionAt(self, i):
+        # return the name of the section that line i is the header of, or 
+        # None if it is not a section header
+        mat = (i > 0 and self.sectionRe.match(self.lines[i])) or None
+        if not mat:
+            return None
+        if mat.group(1):
+            return mat.group(1)
+        if self.lines[i-1].strip() == '#' and i+1 < len(self.lines) and \
+           self.lines[i+1].strip() == '#':
+            return mat.group(2)
+        return None
+
+    def _isRecord(self, i):
+        # the first line is the file's header
+        line = self.lines[i].strip()
+        return i > 0 and line and not line.startswith('#')
+
+    def getVersion(self, prodname):
+        """
+        return the version assigned to a product, including any edits not
+        yet written, or None if the product is not listed.
+        """
+        if prodname in self.updates:
+            return self.updates[prodname]
+        for section in self.inserts.values():
+            if prodname in section:
+                return section[prodname][2]
+        if prodname in self.records:
+            return self.lines[self.records[prodname][-1]].split()[2]
+        return None
+
+    def setVersion(self, prodname, version, section="lsst"):
+        """
+        assign a version to a product.  
+        @param prodname   the name of the product
+        @param version    the version to assign
+        @param section    the section to add the product to if it is not 
+                            already listed.  Its name is also recorded as
+                            the product's extra directory unless it is 
+                            "lsst".
+        """
+        if prodname in self.records:
+            self.updates[prodname] = version
+            return
+        for recs in self.inserts.values():
+            recs.pop(prodname, None)
+        extradir = (section != "lsst" and section) or ''
+        self.inserts.setdefault(section, {})[prodname] = \
+            [prodname, "generic", version, extradir, '']
+
+    def apply(self, prodvers, section="lsst"):
+        """
+        assign versions to a batch of products.
+        @param prodvers   a list of (product name, version) pairs
+        @param section    the section to add products not already listed to
+        """
+        for prodname, version in prodvers:
+            self.setVersion(prodname, version, section)
+
+    def isChanged(self):
+        """return True if there are edits that have not been written"""
+        return bool(self.updates or filter(None, self.inserts.values()))
+
+    def _format(self, cols):
+        cols = list(cols) + [''] * (5 - len(cols))
+        return " ".join([self.fmt % tuple(cols[:5])] + cols[5:]).rstrip()
+
+    def _lines(self):
+        # generate the edited lines of the file.  Comment lines holding 
+        # just "#" are held back so that records added at the end of a 
+        # section precede the blank comments that open the next one.
+        pending = sorted(self.inserts.get(None, {}).items())
+        sections = set([None])
+        held = []
+        for i in xrange(len(self.lines)):
+            line = self.lines[i]
+            if i > 0 and line.strip() == '#':
+                held.append(line)
+                continue
+
+            section = self._sectionAt(i)
+            if section:
+                for name, cols in pending:
+                    yield self._format(cols)
+                sections.add(section)
+                pending = sorted(self.inserts.get(section, {}).items())
+            for saved in held:
+                yield saved
+            held = []
+
+            if self._isRecord(i):
+                cols = line.split()
+                while pending and pending[0][0] < cols[0]:
+                    yield self._format(pending.pop(0)[1])
+                if cols[0] in self.updates:
+                    cols[2:3] = [self.updates[cols[0]]]
+                    line = self._format(cols)
+            yield line
+
+        for name, cols in pending:
+            yield self._format(cols)
+        for saved in held:
+            yield saved
+
+        # sections the file does not have yet
+        for section in sorted(filter(lambda s: s not in sections, 
+                                     self.inserts.keys())):
+            if not self.inserts[section]:
+                continue
+            for line in ["#", "# " + section, "#"]:
+                yield line
+            for name, cols in sorted(self.inserts[section].items()):
+                yield self._format(cols)
+
+    def write(self, filename=None):
+        """
+        write out the edited tag file.  The file is written in full before 
+        it is renamed into place, so that readers see either the old file
+        or the new one.  
+        @param filename   the path to write to.  If None, the file being 
+                            edited is replaced.
+        """
+        if not filename:
+            filename = self.file
+        data = "".join(map(lambda l: l + "\n", self._lines()))
+
+        if self.storage.isLocal():
+            tmpfile = "%s.tmp%d" % (filename, os.getpid())
+            with open(tmpfile, 'w') as fd:
+                fd.write(data)
+            if os.path.exists(self.file):
+                shutil.copymode(self.file, tmpfile)
+            os.rename(tmpfile, filename)
+        else:
+            with self.storage.open(filename, 'w') as fd:
+                fd.write(data)
+
+        if filename == self.file:
+            self._load(data)
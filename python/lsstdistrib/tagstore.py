@@ -0,0 +1,128 @@
+"""
+a module for sharing parsed tag files within a process.  A TagStore holds
+the TagDef for each tag file it has loaded, keyed by the file's path and
+checked against the file's modification time, size, and inode each time it
+is requested, so that a tag file is read and parsed once until it changes.
+Several tags can be consulted together via a TagStack, a read-only view of
+a list of TagDefs in which the first tag that lists a product provides its
+version.  Most tools should use the process-wide store, defaultTagStore
+(see getTagStore()).
+"""
+from __future__ import absolute_import
+from __future__ import with_statement
+
+import sys, os, threading
+
+from .storage import defaultStorage
+from .tags    import TagDef
+
+class TagStore(object):
+    """
+    a cache of parsed tag files.  The TagDefs it returns are shared and
+    should be treated as read-only.  Only tag files on the local filesystem
+    are cached (as only they can be checked for changes); others are
+    loaded anew for each request.
+    """
+
+    def __init__(self, storage=None):
+        """
+        @param storage   the storage backend to read tag files from (see
+                            lsstdistrib.storage).  If None, the local
+                            filesystem is used.
+        """
+        self.storage = storage or defaultStorage
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def _stamp(self, tagfile):
+        st = os.stat(tagfile)
+        return (st.st_mtime, st.st_size, st.st_ino)
+
+    def get(self, tagfile):
+        """
+        return the TagDef for the given tag file, loading it if it has not
+        been loaded before or has changed since.
+        @throws EnvironmentError  if the file cannot be read
+        """
+        if not self.storage.isLocal():
+            self.loads += 1
+            return TagDef(tagfile, self.storage)
+
+        # stat before reading: if the file changes in between, the cached
+        # copy is simply reloaded on the next request.
+        stamp = self._stamp(tagfile)
+        with self._lock:
+            cached = self._cache.get(tagfile)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        tagged = TagDef(tagfile, self.storage)
+        with self._lock:
+            self._cache[tagfile] = (stamp, tagged)
+            self.loads += 1
+        return tagged
+
+    def getStack(self, tagfiles):
+        """
+        return a TagStack for a list of tag files given in order of
+        precedence (highest first).
+        """
+        return TagStack(map(self.get, tagfiles))
+
+    def clear(self):
+        """forget all cached tag files"""
+        with self._lock:
+            self._cache = {}
+
+defaultTagStore = TagStore()
+
+def getTagStore(storage=None):
+    """
+    return the TagStore to use for the given storage backend:  the 
+    process-wide defaultTagStore for the local filesystem (including when
+    storage is None), or else a new, non-caching store.
+    """
+    if storage is None or storage.isLocal():
+        return defaultTagStore
+    return TagStore(storage)
+
+class TagStack(TagDef):
+    """
+    a read-only view of several tags as one.  A product's tag data is taken
+    from the first of the layers that lists it.  The layers are combined
+    when the stack is created, so lookups take constant time.
+    """
+
+    def __init__(self, layers):
+        """
+        @param layers   the TagDefs to combine, in order of precedence
+                          (highest first)
+        """
+        self.layers = list(layers)
+        self.file = "+".join(map(lambda t: t.file, self.layers))
+        self.storage = (self.layers and self.layers[0].storage) or \
+                       defaultStorage
+        self.prod = {}
+        for layer in reversed(self.layers):
+            self.prod.update(layer.prod)
+
+    def push(self, tagged):
+        """
+        return a new stack with the given TagDef as the layer of highest
+        precedence on top of this stack's layers
+        """
+        return TagStack([tagged] + self.layers)
+
+    def getLayer(self, prodname):
+        """
+        return the layer that provides the tag data for the given product
+        or None if no layer lists it.
+        """
+        for layer in self.layers:
+            if prodname in layer.prod:
+                return layer
+        return None
+
+    def merge(self, tagfile):
+        raise TypeError("TagStack is read-only; use push() to add a layer")
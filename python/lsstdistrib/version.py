@@ -2,6 +2,12 @@
 functions related to manipulating versions
 """
 import sys, os, re
+from functools import cmp_to_key
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class VersionCompare(object):
     """
@@ -79,9 +85,262 @@ class VersionCompare(object):
             pass
         return cmp(f1, f2)
 
+    def sortKey(self, version):
+        """
+        return a key for the given version string that can be used to sort 
+        versions (e.g. via list.sort(key=...)) into the same order as 
+        compare():  the key is the version's Version instance, which 
+        compares as compare() does.  Versions are parsed only once.
+        """
+        return Version(version)
+
     def __call__(self, v1, v2):
         return self.compare(v1, v2)
 
+class Version(object):
+    """
+    a version string parsed into its components.  Version instances are 
+    immutable and interned:  constructing a Version from a string that 
+    has been seen before returns the same instance without reparsing it.  
+    Versions are ordered as VersionCompare.compare() orders their strings,
+    including its treatment of a release that is a prefix of another (like
+    "1.0" and "1.0.1"); where a field is an integer in one version and not
+    in the other, the integer one is ordered first (which compare() does 
+    only when the integer is its first argument).  Versions may be ordered
+    directly against version strings.  A Version is equal only to a 
+    Version with the same string or to that string itself (and hashes as 
+    the string does); it never equals anything else (such as None).  At 
+    most maxInterned versions are held at once:  when the table is full it
+    is emptied and begins again (see also clearCache()).  The components 
+    are available as attributes:
+       string     the original version string
+       release    the tagged version (i.e. the base version without the 
+                    build qualifier and number)
+       fields     a tuple of the release fields, with integer fields 
+                    converted to ints
+       qualifier  the build qualifier (e.g. '+') or None
+       build      the build number as an int or None
+       key        the tuple of the components compared:  the release 
+                    field keys, the qualifier rank, and the build number
+    """
+    __slots__ = ("string", "release", "fields", "qualifier", "build", "key")
+    _interned = {}
+    maxInterned = 100000
+
+    def __new__(cls, version):
+        if isinstance(version, Version):
+            return version
+        out = cls._interned.get(version)
+        if out is None:
+            out = object.__new__(cls)
+            out._parse(version)
+            if len(cls._interned) >= cls.maxInterned:
+                cls._interned.clear()
+            cls._interned[version] = out
+        return out
+
+    def _parse(self, version):
+        (rel, q, b) = splitToReleaseBuild(version)
+        self.string = version
+        self.release = rel
+        fkeys = tuple(map(_fieldKey, VersionCompare.fieldDelimRe.split(rel)))
+        self.fields = tuple(map(lambda k: k[1], fkeys))
+        self.qualifier = q
+        self.build = None
+        if b:
+            self.build = int(b)
+
+        # + builds sort after - builds, which sort after any other 
+        # qualifier, all after an unqualified version.
+        if not q:
+            qual = (0, '')
+        elif q == '+':
+            qual = (3, '')
+        elif q == '-':
+            qual = (2, '')
+        else:
+            qual = (1, q)
+        build = self.build
+        if build is None:
+            build = -1
+        self.key = (fkeys, qual, build)
+
+    def clearCache(cls):
+        """
+        forget all interned versions.  Long-running tools that reload the 
+        server's state (like UprevPlanner.load()) call this to release the
+        versions they no longer need.
+        """
+        cls._interned.clear()
+    clearCache = classmethod(clearCache)
+
+    def _other(self, other):
+        # return the other operand as a Version, or None if it is not one
+        if isinstance(other, Version):
+            return other
+        if isinstance(other, basestring):
+            return Version(other)
+        return None
+
+    def _compare(self, other):
+        # compare as VersionCompare.compare() does:  the release fields are
+        # compared only as far as the shorter release has them.
+        fk1, fk2 = self.key[0], other.key[0]
+        n = min(len(fk1), len(fk2))
+        comp = cmp(fk1[:n], fk2[:n])
+        if comp != 0:
+            return comp
+        return cmp(self.key[1:], other.key[1:])
+
+    def __eq__(self, other):
+        if isinstance(other, Version):
+            return self.string == other.string
+        if isinstance(other, basestring):
+            return self.string == other
+        return NotImplemented
+    def __ne__(self, other):
+        out = self.__eq__(other)
+        if out is NotImplemented:
+            return out
+        return not out
+    def __lt__(self, other):
+        other = self._other(other)
+        if other is None:
+            return NotImplemented
+        return self._compare(other) < 0
+    def __le__(self, other):
+        other = self._other(other)
+        if other is None:
+            return NotImplemented
+        return self._compare(other) <= 0
+    def __gt__(self, other):
+        other = self._other(other)
+        if other is None:
+            return NotImplemented
+        return self._compare(other) > 0
+    def __ge__(self, other):
+        other = self._other(other)
+        if other is None:
+            return NotImplemented
+        return self._compare(other) >= 0
+
+    def __hash__(self):
+        return hash(self.string)
+
+    def __str__(self):
+        return self.string
+
+    def __repr__(self):
+        return "Version(%r)" % self.string
+
+def _fieldKey(f):
+    # integer fields sort numerically and before non-integer ones, which
+    # sort lexically (see VersionCompare._fldCompare())
+    try:
+        return (0, int(f))
+    except ValueError:
+        return (1, f)
+
+def keyFunction(vcmp):
+    """
+    return a function that returns a sort key for a version string that is
+    consistent with the given comparator.  The comparator's sortKey() 
+    method is used if it has one; otherwise, keys will call the comparator
+    itself.
+    """
+    keyfunc = getattr(vcmp, 'sortKey', None)
+    if keyfunc is None:
+        keyfunc = cmp_to_key(vcmp)
+    return keyfunc
+
+def sortOrder(versions, usenumpy=None):
+    """
+    return the list of indices that would sort the given version strings 
+    into the order defined by Version (and VersionCompare).  The sort is 
+    stable.  When NumPy is available, the versions are encoded into 
+    fixed-width integer arrays--two columns per release field (a field 
+    type and a value), the qualifier's rank, and the build number--and 
+    sorted in one call to numpy.lexsort(); otherwise, the list is sorted 
+    by Version keys.  If the release of one version is a prefix of 
+    another's (e.g. "1.0" and "1.0.1"), which the keys do not order as 
+    compare() does, the Versions themselves are compared instead.  
+    @param versions   a list of version strings (or Version instances)
+    @param usenumpy   if False, do not use NumPy; if True, require it.  If
+                        None (default), use it if it is available.
+    """
+    if usenumpy is None:
+        usenumpy = numpy is not None
+    elif usenumpy and numpy is None:
+        raise RuntimeError("NumPy is not available")
+
+    parsed = map(Version, versions)
+    if _hasPrefixRelease(parsed):
+        # the keys alone do not order these as compare() does
+        return sorted(xrange(len(parsed)), key=lambda i: parsed[i])
+    if usenumpy and parsed:
+        order = _lexsortOrder(parsed)
+        if order is not None:
+            return order
+    return sorted(xrange(len(parsed)), key=lambda i: parsed[i].key)
+
+def _hasPrefixRelease(parsed):
+    # return True if the release of one of the versions is a proper prefix
+    # (by fields) of another's.  Otherwise, comparing the versions' keys 
+    # gives the same order as comparing the versions.
+    releases = set(map(lambda v: v.key[0], parsed))
+    for fkeys in releases:
+        for n in xrange(1, len(fkeys)):
+            if fkeys[:n] in releases:
+                return True
+    return False
+
+_maxEncodable = 2**62
+
+def _lexsortOrder(parsed):
+    # encode each key component as an integer column.  Non-integer values
+    # are replaced by their rank among the distinct values in their column.
+    # Return None if a value cannot be encoded in 64 bits.
+    nfields = max(map(lambda v: len(v.fields), parsed))
+
+    def ranks(values):
+        lookup = dict(map(lambda p: (p[1], p[0]), 
+                          enumerate(sorted(set(values)))))
+        return map(lambda x: lookup[x], values)
+
+    cols = []
+    for j in xrange(nfields):
+        fkeys = map(lambda v: (j < len(v.key[0]) and v.key[0][j]) or (-1, 0), 
+                    parsed)
+        kinds = map(lambda k: k[0], fkeys)
+        vals = map(lambda k: k[1], fkeys)
+        strs = filter(lambda i: kinds[i] == 1, xrange(len(vals)))
+        if strs:
+            strrank = ranks(map(lambda i: vals[i], strs))
+            for i, r in zip(strs, strrank):
+                vals[i] = r
+        if vals and max(map(abs, vals)) >= _maxEncodable:
+            return None
+        cols.append(kinds)
+        cols.append(vals)
+
+    cols.append(map(lambda v: v.key[1][0], parsed))
+    cols.append(ranks(map(lambda v: v.key[1][1], parsed)))
+    builds = map(lambda v: v.key[2], parsed)
+    if max(builds) >= _maxEncodable:
+        return None
+    cols.append(builds)
+
+    # lexsort() treats the last key as the primary one
+    keys = numpy.array(list(reversed(cols)), dtype=numpy.int64)
+    return numpy.lexsort(keys).tolist()
+
+def sortVersions(versions, usenumpy=None):
+    """
+    return a sorted copy of the given list of version strings.  See 
+    sortOrder() for details.
+    """
+    return map(lambda i: versions[i], sortOrder(versions, usenumpy))
+
 buildExtRe = re.compile(r'([^\d\.]+)(\d+)$')
 
 def incrementBuild(v1, forcePlus=False):
@@ -51,6 +51,8 @@ class AutouprevTestCase(unittest.TestCase):
         self.assertEquals(2, len(updatedFiles))
         self.assert_("external/pyfits/2.4.0/b2.manifest" in updatedFiles)
         self.assert_("external/matplotlib/1.0.1/b2.manifest" in updatedFiles)
+        self.assert_(not os.path.exists(os.path.join(self.serverroot,
+                     "external/pyfits/2.4.0/b2.manifest")))
 
 
 
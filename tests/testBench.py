@@ -0,0 +1,129 @@
+"""
+test the bench package
+"""
+
+import os, sys, re, unittest, pdb, shutil, json
+from cStringIO import StringIO
+
+from lsstdistrib.bench.synth import SyntheticServer
+from lsstdistrib.bench.suite import BenchmarkSuite
+from lsstdistrib.manifest import DeployedManifests, Manifest
+from lsstdistrib.server import Repository
+from lsstdistrib.catalog import Catalog
+from lsstdistrib.tags import TagDef
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class SyntheticServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "bench-tmp")
+        self.tearDown()
+        self.synth = SyntheticServer(self.serverroot, products=30, versions=2,
+                                     builds=2, depth=3, stackSize=15, 
+                                     externalFraction=0.2, pseudoFraction=0.1)
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testGraph(self):
+        self.synth.makeGraph()
+        self.assertEquals(30, len(self.synth.products))
+        self.assertEquals(6, self.synth.categories.count("external"))
+        self.assertEquals(4, self.synth.categories.count("pseudo"))
+        for id in xrange(30):
+            for dep in self.synth.deps[id]:
+                self.assert_(dep < id)
+                self.assertEquals(id // 15, dep // 15)
+
+        other = SyntheticServer(self.serverroot, products=30, depth=3, 
+                                stackSize=15, externalFraction=0.2, 
+                                pseudoFraction=0.1)
+        other.makeGraph()
+        self.assertEquals(self.synth.deps, other.deps)
+
+    def testGenerate(self):
+        counts = self.synth.generate()
+        self.assertEquals(120, counts["manifests"])
+        self.assertRaises(RuntimeError, self.synth.generate)
+
+        deployed = DeployedManifests(os.path.join(self.serverroot,"manifests"))
+        latest = deployed.latestProducts()
+        self.assertEquals(30, len(latest))
+
+        repos = Repository(self.serverroot)
+        closures = self.synth.getClosures()
+        for id in xrange(30):
+            prodname = self.synth.products[id]
+            version = self.synth.getLatestVersion(id)
+            self.assert_((prodname, version) in latest)
+            pdir = repos.getProductDir(prodname, version)
+            self.assert_(os.path.exists(os.path.join(pdir, "b2.manifest")))
+
+            man = deployed.getManifest(prodname, version)
+            names = map(lambda r: r[0], man)
+            self.assertEquals(map(lambda d: self.synth.products[d], 
+                                  closures[id]) + [prodname], names)
+
+        tag = TagDef(repos.getTagListFile("stable"))
+        self.assertEquals("%s+2" % self.synth.getVersions(0)[0],
+                          tag.getVersion(self.synth.products[0]))
+
+class BenchmarkSuiteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "bench-tmp")
+        self.tearDown()
+        SyntheticServer(self.serverroot, products=20, stackSize=10, 
+                        depth=3).generate()
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def listFiles(self):
+        out = []
+        for dir, subdirs, files in os.walk(self.serverroot):
+            out += map(lambda f: os.path.join(dir, f), files)
+        return sorted(out)
+
+    def readFiles(self):
+        out = {}
+        for filename in self.listFiles():
+            with open(filename, 'rb') as fd:
+                out[filename] = fd.read()
+        return out
+
+    def testRun(self):
+        # releasing also updates the dependency index and the catalog
+        repos = Repository(self.serverroot)
+        deployed = DeployedManifests(repos.getManifestDir(), 
+                                     indexfile=repos.getDependencyIndexFile())
+        deployed.index.ensureCurrent()
+        Catalog(repos.getCatalogFile(), repos).rebuild()
+        before = self.readFiles()
+        suite = BenchmarkSuite(self.serverroot, repeat=2, targets=2, 
+                               sortCount=5)
+        self.assertEquals(suite.chooseTargets(), suite.chooseTargets())
+        results = suite.run()
+
+        self.assertEquals(20, results["products"])
+        self.assertEquals(80, results["manifests"])
+        self.assertEquals(BenchmarkSuite.benchmarks, 
+                          map(lambda r: r["name"], results["results"]))
+        for res in results["results"]:
+            self.assertEquals(2, len(res["times"]))
+            self.assert_(res["min"] <= res["mean"])
+        self.assertEquals(sorted(before), self.listFiles())
+        self.assertEquals(before, self.readFiles())
+
+        strm = StringIO()
+        suite.writeJSON(results, strm)
+        self.assertEquals(results["results"][0]["name"],
+                          json.loads(strm.getvalue())["results"][0]["name"])
+
+        self.assertRaises(ValueError, suite.run, ["goob"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+test the catalog module
+"""
+
+import os, sys, re, unittest, pdb, shutil, time
+
+from lsstdistrib.catalog import Catalog
+from lsstdistrib.manifest import DeployedManifests
+from lsstdistrib.server import Repository
+from lsstdistrib.release import Release, UpdateDependents
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class CatalogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        origroot = os.path.join(testdir, "server")
+        self.serverroot = os.path.join(testdir, "server-tmp")
+
+        self.tearDown()
+        shutil.copytree(origroot, self.serverroot, True)
+        self.mandir = os.path.join(self.serverroot, "manifests")
+        self.repos = Repository(self.serverroot)
+        self.catalog = Catalog(self.repos.getCatalogFile(), self.repos)
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testRebuild(self):
+        self.assert_(not self.catalog.isCurrent())
+        self.catalog.rebuild()
+        self.assert_(self.catalog.isCurrent())
+
+        plain = DeployedManifests(self.mandir)
+        self.assertEquals(sorted(plain.listAll()), 
+                          sorted(self.catalog.listDeployed()))
+        self.assertEquals(os.path.join(self.serverroot, "external", "numpy"),
+                          self.catalog.getProductDir("numpy"))
+        self.assert_(self.catalog.getProductDir("goob") is None)
+
+        # a manifest rewritten in place makes the catalog stale
+        path = os.path.join(self.mandir, "pyfits-2.4.0+1.manifest")
+        mtime = os.stat(self.mandir).st_mtime
+        with open(path, 'a') as fd:
+            fd.write("goob  generic  1.0+1  goob/1.0/goob.table  goob/1.0+1  goob\n")
+        os.utime(self.mandir, (mtime, mtime))
+        self.assert_(self.catalog.isCurrent())
+        catalog = Catalog(self.repos.getCatalogFile(), self.repos)
+        self.assert_(not catalog.isCurrent())
+        self.assertEquals([("pyfits", "2.4.0+1")], 
+                          DeployedManifests(self.mandir, catalog=catalog)
+                          .dependsOn("goob"))
+
+    def testQueries(self):
+        self.catalog.rebuild()
+        plain = DeployedManifests(self.mandir)
+        deployed = DeployedManifests(self.mandir, catalog=self.catalog)
+        self.assertEquals(sorted(plain.listAll()), sorted(deployed.listAll()))
+        for args in [("numpy", "1.6.1+1"), ("tcltk", "8.5.9+1"),
+                     ("tcltk", None, "generic"), ("matplotlib",)]:
+            self.assertEquals(plain.dependsOn(*args), deployed.dependsOn(*args))
+        prods = ["numpy", "tcltk", "goob"]
+        self.assertEquals(plain.dependsOnAny(prods), 
+                          deployed.dependsOnAny(prods))
+
+        self.assert_(self.repos.openCatalog() is not None)
+        self.assertEquals(os.path.join(self.serverroot, "external", "numpy",
+                                       "1.6.1"),
+                          self.repos.getProductDir("numpy", "1.6.1+1"))
+
+        # a manifest copied in by hand makes the catalog stale
+        time.sleep(0.01)
+        shutil.copyfile(os.path.join(self.mandir, "pyfits-2.4.0+1.manifest"),
+                        os.path.join(self.mandir, "pyfits-2.4.0+2.manifest"))
+        self.assert_(not self.catalog.isCurrent())
+        self.assert_(("pyfits", "2.4.0+2") in deployed.listAll())
+
+    def testUpdates(self):
+        self.catalog.rebuild()
+        self.catalog.close()
+
+        upd = UpdateDependents([("numpy", "1.6.1+1")], self.serverroot)
+        created = upd.createManifests()
+        self.assertEquals(2, len(created))
+        catalog = Catalog(self.repos.getCatalogFile(), self.repos)
+        self.assert_(catalog.isCurrent())
+
+        rel = Release(map(lambda c: (c[0], "%s+%s" % c[1:3], c[3]), created),
+                      self.serverroot)
+        rel.releaseAll()
+        self.assert_(catalog.isCurrent())
+        self.assert_(("pyfits", "2.4.0+2") in catalog.listDeployed())
+        deployed = DeployedManifests(self.mandir, catalog=catalog)
+        self.assertEquals([("pyfits", "2.4.0+2")], 
+                          deployed.dependsOn("pyfits"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+test the depgraph module
+"""
+
+import os, sys, re, unittest, pdb
+
+from lsstdistrib.depgraph import DependencyGraph, DependencyCycleError
+from lsstdistrib.manifest import SortProducts, sortInDependencyOrder
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class DependencyGraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.graph = DependencyGraph()
+        self.graph.addProduct("afw")
+        self.graph.addDependency("afw", "daf_base")
+        self.graph.addDependency("afw", "utils")
+        self.graph.addDependency("daf_base", "utils")
+        self.graph.addDependency("daf_base", "python")
+        self.graph.addProduct("eups")
+
+    def testGraph(self):
+        self.assertEquals(5, len(self.graph))
+        self.assert_("utils" in self.graph)
+        self.assert_(not self.graph.hasProduct("goob"))
+        self.assertEquals(["daf_base", "utils"], 
+                          self.graph.getDependencies("afw"))
+        self.assertEquals(["afw", "daf_base"], 
+                          self.graph.getDependents("utils"))
+
+    def testSort(self):
+        self.assertEquals(["utils", "python", "daf_base", "afw", "eups"],
+                          self.graph.sort())
+        self.assertEquals(["utils", "afw", "eups"],
+                          self.graph.sort(["afw", "eups", "utils"]))
+
+    def testCycle(self):
+        self.graph.addDependency("python", "afw")
+        try:
+            self.graph.sort()
+            self.fail("failed to detect cycle")
+        except DependencyCycleError, ex:
+            self.assertEquals(["afw", "daf_base", "python"], ex.products)
+        self.assertEquals(["utils", "eups"], 
+                          self.graph.sort(["utils", "eups"]))
+
+    def testClosure(self):
+        self.graph.addDependency("meas", "afw")
+        self.assertEquals(["afw", "daf_base", "meas"],
+                          self.graph.getAllDependents("utils"))
+        self.assertEquals(["afw", "daf_base", "utils", "python"],
+                          self.graph.getAllDependencies("meas"))
+        self.assertEquals([], self.graph.getAllDependencies("eups"))
+        self.assert_(self.graph.dependsOn("meas", "python"))
+        self.assert_(not self.graph.dependsOn("python", "meas"))
+        self.assertEquals(["daf_base", "afw", "meas"],
+                          self.graph.getAffected(["python", "utils"]))
+
+        # changing the graph drops the memoized closures
+        self.graph.addDependency("eups", "python")
+        self.assertEquals(["daf_base", "afw", "eups", "meas"],
+                          self.graph.getAffected(["python"]))
+
+    def testClosureCycle(self):
+        self.graph.addDependency("python", "afw")
+        for prodname in ("afw", "daf_base", "python"):
+            self.assert_(prodname not in 
+                         self.graph.getAllDependencies(prodname))
+        self.assertEquals(["afw", "daf_base", "python"],
+                          self.graph.getAllDependents("utils"))
+        self.assertEquals(["daf_base", "utils", "python"],
+                          self.graph.getAllDependencies("afw"))
+
+class SortProductsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "server")
+
+    def testSort(self):
+        prods = ["pyfits/2.4.0+1", "matplotlib", "tcltk/8.5.9+1", 
+                 "numpy/1.6.1+1", "eups", "python/2.7.2+3"]
+        out = sortInDependencyOrder(prods, serverdir=self.serverroot)
+        self.assertEquals(["tcltk/8.5.9+1", "python/2.7.2+3", "numpy/1.6.1+1",
+                           "pyfits/2.4.0+1", "matplotlib", "eups"], out)
+
+    def testSortTuples(self):
+        manfile = os.path.join(self.serverroot, "external/numpy/1.6.1/b1.manifest")
+        sorter = SortProducts(self.serverroot, [("python", "2.7.2+2")])
+        sorter.addProduct(("numpy", "1.6.1+2"), manifestFile=manfile)
+        sorter.addProduct(("tcltk", "8.5.9+1"))
+        out = sorter.sort()
+        self.assertEquals([("tcltk", "8.5.9+1"), ("python", "2.7.2+2"), 
+                           ("numpy", "1.6.1+2")], out)
+
+if __name__ == "__main__":
+    unittest.main()
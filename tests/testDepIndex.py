@@ -0,0 +1,113 @@
+"""
+test the depindex module
+"""
+
+import os, sys, re, unittest, pdb, shutil, time
+
+from lsstdistrib.depindex import DependencyIndex
+from lsstdistrib.manifest import DeployedManifests
+from lsstdistrib.release import Release
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class DependencyIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        origroot = os.path.join(testdir, "server")
+        self.serverroot = os.path.join(testdir, "server-tmp")
+
+        self.tearDown()
+        shutil.copytree(origroot, self.serverroot, True)
+        self.mandir = os.path.join(self.serverroot, "manifests")
+        self.indexfile = os.path.join(self.serverroot, "dependents.index")
+        self.deployed = DeployedManifests(self.mandir)
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testMatchesGrep(self):
+        index = DependencyIndex(self.indexfile, self.deployed)
+        for args in [("numpy", "1.6.1+1"), ("tcltk", "8.5.9+1"),
+                     ("tcltk", None, "generic"), ("matplotlib",),
+                     ("python", "2.7.2+2")]:
+            self.assertEquals(self.deployed.dependsOn(*args),
+                              index.dependsOn(*args))
+        self.assertEquals([], index.dependsOn("goob"))
+
+    def testSaveLoad(self):
+        self.assert_(not os.path.exists(self.indexfile))
+        index = DependencyIndex(self.indexfile, self.deployed)
+        index.dependsOn("numpy")
+        self.assert_(os.path.exists(self.indexfile))
+
+        index = DependencyIndex(self.indexfile, self.deployed)
+        self.assert_(index.load())
+        self.assertEquals(17, len(index.latest))
+        deps = index.dependsOn("numpy", "1.6.1+1")
+        self.assertEquals(3, len(deps))
+        self.assert_(("pyfits", "2.4.0+1") in deps)
+
+        # a manifest copied in by hand makes the index stale
+        time.sleep(0.01)
+        shutil.copyfile(os.path.join(self.mandir, "pyfits-2.4.0+1.manifest"),
+                        os.path.join(self.mandir, "pyfits-2.4.0+2.manifest"))
+        self.assert_(index.isStale())
+        deps = index.dependsOn("numpy", "1.6.1+1")
+        self.assert_(("pyfits", "2.4.0+2") in deps)
+
+    def testRewriteInPlace(self):
+        index = DependencyIndex(self.indexfile, self.deployed)
+        self.assert_(("pyfits", "2.4.0+1") in index.dependsOn("numpy"))
+        mtime = os.stat(self.mandir).st_mtime
+
+        # rewrite a manifest without changing the directory
+        path = os.path.join(self.mandir, "pyfits-2.4.0+1.manifest")
+        with open(path) as fd:
+            lines = filter(lambda l: not l.startswith("numpy "), fd)
+        with open(path, 'w') as fd:
+            fd.writelines(lines)
+        os.utime(self.mandir, (mtime, mtime))
+
+        index = DependencyIndex(self.indexfile, self.deployed)
+        self.assert_(not index.load())
+        self.assert_(("pyfits", "2.4.0+1") not in index.dependsOn("numpy"))
+        self.assert_(index.load())
+
+        # the manifests are checked once, not on every query
+        signature = index._signature
+        calls = []
+        def counted(prodvers):
+            calls.append(prodvers)
+            return signature(prodvers)
+        index._signature = counted
+        for prodname in ("numpy", "tcltk", "python"):
+            index.dependsOn(prodname)
+        self.deployed.index = index
+        self.deployed.dependsOnAny(["numpy", "tcltk"])
+        self.assertEquals(0, len(calls))
+        index.load()
+        index.dependsOn("numpy")
+        index.dependsOn("tcltk")
+        self.assertEquals(1, len(calls))
+
+    def testReleaseUpdate(self):
+        index = DependencyIndex(self.indexfile, self.deployed)
+        index.rebuild()
+        index.save()
+
+        pdir = os.path.join(self.serverroot, "external/pyfits/2.4.0")
+        shutil.copyfile(os.path.join(pdir, "b1.manifest"),
+                        os.path.join(pdir, "b2.manifest"))
+        rel = Release([("pyfits", "2.4.0+2",
+                        os.path.join(pdir, "b2.manifest"))], self.serverroot)
+        rel.releaseAll()
+
+        index = DependencyIndex(self.indexfile, self.deployed)
+        self.assert_(index.load())
+        self.assertEquals("2.4.0+2", index.latest["pyfits"])
+        self.assertEquals([("pyfits", "2.4.0+2")],
+                          index.dependsOn("pyfits"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+"""
+test the deploy module
+"""
+
+import os, sys, re, unittest, pdb, shutil, errno
+from cStringIO import StringIO
+
+from lsstdistrib.deploy import DeployEngine
+from lsstdistrib.release import Release
+from lsstdistrib.catalog import Catalog
+from lsstdistrib.server import Repository
+from lsstdistrib.storage import MemoryStorage, FileStorage
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class DeployEngineTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.join(testdir, "deploy-tmp")
+        self.tearDown()
+        os.makedirs(self.dir)
+        self.src = os.path.join(self.dir, "b1.manifest")
+        with open(self.src, 'w') as fd:
+            fd.write("EUPS distribution manifest for goob (1.0+1). Version 1.0\n")
+
+    def tearDown(self):
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+
+    def dest(self, i=0):
+        return os.path.join(self.dir, "goob-1.0+%d.manifest" % i)
+
+    def testMethods(self):
+        self.assertRaises(ValueError, DeployEngine, methods=["goob"])
+        for method in DeployEngine.methods:
+            dest = self.dest(DeployEngine.methods.index(method))
+            engine = DeployEngine(methods=[method, "copy"])
+            used = engine.deploy(self.src, dest)
+            self.assert_(used in (method, "copy"))
+            self.assertEquals(open(self.src).read(), open(dest).read())
+        self.assertEquals(os.stat(self.src).st_ino, os.stat(self.dest()).st_ino)
+        self.assertNotEqual(os.stat(self.src).st_ino,
+                            os.stat(self.dest(2)).st_ino)
+
+    def testOverwrite(self):
+        engine = DeployEngine(methods=["copy"])
+        with open(self.dest(), 'w') as fd:
+            fd.write("old\n")
+        try:
+            engine.deploy(self.src, self.dest())
+            self.fail("overwrote existing file")
+        except OSError, ex:
+            self.assertEquals(errno.EEXIST, ex.errno)
+        self.assertEquals("old\n", open(self.dest()).read())
+
+        engine.deploy(self.src, self.dest(), True)
+        self.assertEquals(open(self.src).read(), open(self.dest()).read())
+        self.assertEquals(["b1.manifest", "goob-1.0+0.manifest"],
+                          sorted(os.listdir(self.dir)))
+
+    def testDeployAll(self):
+        engine = DeployEngine(threads=4)
+        pairs = map(lambda i: (self.src, self.dest(i)), xrange(10))
+        pairs.append( (os.path.join(self.dir, "goob"), self.dest(10)) )
+        results = engine.deployAll(pairs)
+        self.assertEquals(11, len(results))
+        for method, secs, ex in results[:10]:
+            self.assert_(ex is None)
+            self.assertEquals("link", method)
+        self.assert_(results[10][2] is not None)
+        self.assertEquals([True, False],
+                          engine.exists([self.dest(9), self.dest(10)]))
+
+class ReleaseDeployTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "server-tmp")
+        self.tearDown()
+        shutil.copytree(os.path.join(testdir, "server"), self.serverroot, True)
+        self.mandir = os.path.join(self.serverroot, "manifests")
+        self.manifests = []
+        for prod, ver in [("numpy", "1.6.1"), ("pyfits", "2.4.0"),
+                          ("matplotlib", "1.0.1")]:
+            pdir = os.path.join(self.serverroot, "external", prod, ver)
+            shutil.copyfile(os.path.join(pdir, "b1.manifest"),
+                            os.path.join(pdir, "b2.manifest"))
+            self.manifests.append( (prod, ver + "+2",
+                                    os.path.join(pdir, "b2.manifest")) )
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testRelease(self):
+        log = StringIO()
+        rel = Release(self.manifests, self.serverroot, log, threads=3)
+        rel.releaseAll()
+        for man in self.manifests:
+            dest = os.path.join(self.mandir, "%s-%s.manifest" % man[:2])
+            self.assertEquals(os.stat(man[2]).st_ino, os.stat(dest).st_ino)
+        self.assertEquals(3, len(rel.timings))
+        self.assertEquals(["Deployed numpy-1.6.1+2.manifest",
+                           "Deployed pyfits-2.4.0+2.manifest",
+                           "Deployed matplotlib-1.0.1+2.manifest"],
+                          log.getvalue().strip().split("\n"))
+
+    def testAtomic(self):
+        dest = os.path.join(self.mandir, "pyfits-2.4.0+2.manifest")
+        shutil.copyfile(self.manifests[1][2], dest)
+        rel = Release(self.manifests, self.serverroot)
+        self.assertRaises(RuntimeError, rel.releaseAll, False, True)
+        self.assert_(not os.path.exists(os.path.join(self.mandir,
+                                                 "numpy-1.6.1+2.manifest")))
+
+        # a missing source fails the whole release
+        os.remove(dest)
+        os.remove(self.manifests[2][2])
+        self.assertRaises(EnvironmentError, rel.releaseAll, False, True)
+        self.assertEquals(set(os.listdir(self.mandir)),
+                          set(os.listdir(os.path.join(testdir, "server",
+                                                      "manifests"))))
+
+        # without atomic, the rest are deployed
+        rel.releaseAll()
+        self.assert_(os.path.exists(dest))
+        self.assertEquals(2, len(rel.timings))
+
+    def testNoClobber(self):
+        # a destination created after it was checked is not replaced
+        dest = os.path.join(self.mandir, "pyfits-2.4.0+2.manifest")
+        with open(dest, 'w') as fd:
+            fd.write("goob\n")
+        rel = Release(self.manifests, self.serverroot)
+        pairs = map(lambda m: (m[2], os.path.join(self.mandir,
+                                           "%s-%s.manifest" % m[:2])),
+                    self.manifests)
+        try:
+            rel.publishStaged(pairs)
+            self.fail("existing manifest replaced")
+        except OSError, ex:
+            self.assertEquals(errno.EEXIST, ex.errno)
+        self.assertEquals("goob\n", open(dest).read())
+        self.assert_(not os.path.exists(pairs[0][1]))
+
+        rel.publishStaged(pairs, True)
+        self.assertEquals(os.stat(self.manifests[1][2]).st_ino,
+                          os.stat(dest).st_ino)
+
+    def testWithCatalog(self):
+        # the manifests are given without their product directories, so
+        # they are located (via the catalog) on the engine's threads
+        repos = Repository(self.serverroot)
+        Catalog(repos.getCatalogFile(), repos).rebuild()
+        manifests = map(lambda m: Release.parseProductManifestPath(
+                                  "%s/%s/b2.manifest" % (m[0], m[1][:-2])),
+                        self.manifests)
+        self.assert_(not os.path.exists(manifests[0][2]))
+        rel = Release(manifests, self.serverroot, threads=3)
+        rel.releaseAll()
+        self.assertEquals(3, len(rel.timings))
+        for man in self.manifests:
+            dest = os.path.join(self.mandir, "%s-%s.manifest" % man[:2])
+            self.assertEquals(os.stat(man[2]).st_ino, os.stat(dest).st_ino)
+        self.assert_(("pyfits", "2.4.0+2") in rel.repos.catalog.listDeployed())
+        rel.repos.catalog.close()
+
+    def testInMemory(self):
+        storage = MemoryStorage(FileStorage())
+        rel = Release(self.manifests, self.serverroot, storage=storage)
+        rel.releaseAll()
+        self.assertEquals(["copy"] * 3, map(lambda t: t[1], rel.timings))
+        dest = os.path.join(self.mandir, "numpy-1.6.1+2.manifest")
+        self.assert_(storage.exists(dest))
+        self.assert_(not os.path.exists(dest))
+
+if __name__ == "__main__":
+    unittest.main()
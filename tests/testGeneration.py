@@ -0,0 +1,97 @@
+"""
+test the generation module and staged releases
+"""
+
+import os, sys, re, unittest, pdb, shutil, threading, time
+
+from lsstdistrib.generation import GenerationMarker
+from lsstdistrib.manifest import DeployedManifests
+from lsstdistrib.release import Release
+from lsstdistrib.server import Repository, BuildNumberIndex
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class GenerationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "server-tmp")
+        self.tearDown()
+        shutil.copytree(os.path.join(testdir, "server"), self.serverroot, True)
+        self.mandir = os.path.join(self.serverroot, "manifests")
+        self.marker = GenerationMarker(self.mandir)
+
+        self.manifests = []
+        for prod, ver in [("numpy", "1.6.1"), ("pyfits", "2.4.0")]:
+            pdir = os.path.join(self.serverroot, "external", prod, ver)
+            shutil.copyfile(os.path.join(pdir, "b1.manifest"),
+                            os.path.join(pdir, "b2.manifest"))
+            self.manifests.append( (prod, ver + "+2",
+                                    os.path.join(pdir, "b2.manifest")) )
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testMarker(self):
+        self.assertEquals(0, self.marker.read())
+        self.assertEquals(1, self.marker.begin())
+        self.assert_(not self.marker.isStable(self.marker.read()))
+        self.assertEquals(2, self.marker.end())
+        self.assertEquals(2, GenerationMarker(self.mandir).read())
+
+        # an unfinished change is superseded
+        self.marker.begin()
+        self.assertEquals(5, self.marker.begin())
+
+    def testConsistent(self):
+        self.marker.begin()
+        def finish():
+            time.sleep(0.05)
+            self.marker.end()
+        thread = threading.Thread(target=finish)
+        thread.start()
+        try:
+            self.assertEquals(2, self.marker.consistent(self.marker.read))
+        finally:
+            thread.join()
+
+        # a change never finished does not block forever
+        self.marker.begin()
+        self.assertEquals(3, self.marker.consistent(self.marker.read, 0.02))
+
+    def testStagedRelease(self):
+        deployed = DeployedManifests(self.mandir)
+        before = len(deployed.listAll())
+        rel = Release(self.manifests, self.serverroot)
+        rel.releaseAll(atomic=True)
+        self.assertEquals(before + 2, len(deployed.listAll()))
+        self.assertEquals(2, self.marker.read())
+        self.assertEquals(2, len(rel.timings))
+        self.assertEquals([], filter(lambda f: f.startswith("."),
+                                     os.listdir(self.serverroot)))
+
+        # overwriting is staged as well
+        rel.releaseAll(True, True)
+        self.assertEquals(4, self.marker.read())
+        self.assertRaises(RuntimeError, rel.releaseAll, False, True)
+        self.assertEquals(4, self.marker.read())
+
+    def testStagingFailure(self):
+        os.remove(self.manifests[1][2])
+        rel = Release(self.manifests, self.serverroot)
+        before = sorted(os.listdir(self.mandir))
+        self.assertRaises(EnvironmentError, rel.releaseAll, False, True)
+        self.assertEquals(before, sorted(os.listdir(self.mandir)))
+        self.assertEquals(0, self.marker.read())
+
+    def testStagingDirIgnored(self):
+        repos = Repository(self.serverroot)
+        stage = repos.makeStagingDir()
+        self.assert_(os.path.basename(stage).startswith("."))
+        os.mkdir(os.path.join(stage, "1.0"))
+        index = BuildNumberIndex(repos)
+        index.build()
+        self.assert_(os.path.basename(stage) not in index.productDirs)
+
+if __name__ == "__main__":
+    unittest.main()
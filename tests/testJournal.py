@@ -0,0 +1,194 @@
+"""
+test the journal module and resumable up-revs and releases
+"""
+
+import os, sys, re, unittest, pdb, shutil, threading
+from subprocess import Popen, PIPE
+
+from lsstdistrib.journal import ReleaseJournal, UPREV, RELEASE
+from lsstdistrib.release import UpdateDependents, Release, _writeAtomically
+from lsstdistrib.storage import FileStorage
+from lsstdistrib.generation import GenerationMarker
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class ReleaseJournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "server-tmp")
+        self.tearDown()
+        shutil.copytree(os.path.join(testdir, "server"), self.serverroot, True)
+        self.mandir = os.path.join(self.serverroot, "manifests")
+        self.jfile = os.path.join(self.serverroot, "uprev.journal")
+        self.releases = [("numpy", "1.6.1+1")]
+        self.written = map(lambda p: os.path.join(self.serverroot, "external",
+                                                  p, "b2.manifest"),
+                           ["matplotlib/1.0.1", "pyfits/2.4.0"])
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testJournal(self):
+        journal = ReleaseJournal(self.jfile)
+        self.assert_(not journal.exists())
+        self.assert_(journal.getPlan(UPREV) is None)
+        journal.plan(UPREV, [{"file": "a", "text": "A"},
+                             {"file": "b", "text": "B"}])
+        self.assertRaises(RuntimeError, journal.plan, UPREV, [])
+        journal.noteDone(UPREV, ["a"])
+
+        # a partially written last entry is ignored
+        with open(self.jfile, 'a') as fd:
+            fd.write('{"op": "done", "step": "uprev", "fi')
+        journal = ReleaseJournal(self.jfile)
+        self.assertEquals(["a", "b"],
+                          map(lambda i: i["file"], journal.getPlan(UPREV)))
+        self.assert_(isinstance(journal.getPlan(UPREV)[0]["text"], str))
+        self.assert_(journal.isDone(UPREV, "a"))
+        self.assertEquals(["b"],
+                          map(lambda i: i["file"], journal.getPending(UPREV)))
+        self.assert_(not journal.isComplete(UPREV))
+        self.assert_(not journal.isComplete(RELEASE))
+
+        journal.remove()
+        self.assert_(not journal.exists())
+
+    def testResumeUprev(self):
+        journal = ReleaseJournal(self.jfile)
+        uprev = UpdateDependents(self.releases, self.serverroot,
+                                 journal=journal)
+        uprev.updateFromTag("current")
+        created = uprev.createManifests()
+        self.assertEquals(self.written, sorted(map(lambda c: c[3], created)))
+        self.assert_(journal.isComplete(UPREV))
+
+        # interrupt the run after its first manifest was written
+        lines = open(self.jfile).readlines()
+        with open(self.jfile, 'w') as fd:
+            fd.writelines(lines[:1])
+        os.remove(journal.getPlan(UPREV)[1]["file"])
+
+        journal = ReleaseJournal(self.jfile)
+        uprev = UpdateDependents(self.releases, self.serverroot,
+                                 journal=journal)
+
+        # resuming does not scan the server, but does update the catalog
+        def scan():
+            self.fail("server scanned while resuming")
+        uprev.deployed.listAll = scan
+        uprev.builds.build = scan
+        noted = []
+        class Catalog(object):
+            def noteUndeployed(self, *args):
+                noted.append(args)
+        uprev.server.catalog = Catalog()
+        resumed = uprev.createManifests()
+        self.assertEquals([("matplotlib", "1.0.1", "2"), ("pyfits", "2.4.0", "2")],
+                          sorted(noted))
+        self.assert_(uprev.deps is None)
+        self.assert_(not uprev.builds.isLoaded())
+        self.assertEquals(sorted(created), sorted(resumed))
+        self.assert_(journal.isComplete(UPREV))
+        for item in journal.getPlan(UPREV):
+            self.assertEquals(item["text"], open(item["file"]).read())
+
+        # a conflicting manifest is not overwritten
+        os.remove(self.written[0])
+        with open(self.written[0], 'w') as fd:
+            fd.write("goob\n")
+        with open(self.jfile, 'w') as fd:
+            fd.writelines(lines[:1])
+        uprev = UpdateDependents(self.releases, self.serverroot,
+                                 journal=ReleaseJournal(self.jfile))
+        self.assertRaises(RuntimeError, uprev.createManifests)
+
+    def testResumeRelease(self):
+        journal = ReleaseJournal(self.jfile)
+        uprev = UpdateDependents(self.releases, self.serverroot,
+                                 journal=journal)
+        uprev.updateFromTag("current")
+        mans = map(lambda c: (c[0], "%s+%s" % (c[1], c[2]), c[3]),
+                   uprev.createManifests())
+        rel = Release(mans, self.serverroot, journal=journal)
+        rel.releaseAll()
+        self.assert_(journal.isComplete(RELEASE))
+        deployed = map(lambda i: i["file"], journal.getPlan(RELEASE))
+        self.assertEquals(2, len(deployed))
+
+        # resuming a finished run does nothing, even given nothing to do
+        rel = Release([], self.serverroot, journal=ReleaseJournal(self.jfile))
+        rel.releaseAll()
+        self.assertEquals([], rel.timings)
+
+        # a file deployed before the run could record it is not redone
+        os.remove(deployed[1])
+        journal = ReleaseJournal(self.jfile)
+        journal.done[RELEASE] = []
+        rel = Release([], self.serverroot, journal=journal)
+        rel.releaseAll()
+        self.assertEquals([deployed[1]], map(lambda t: t[0], rel.timings))
+        self.assertEquals(os.stat(mans[1][2]).st_ino,
+                          os.stat(deployed[1]).st_ino)
+
+        # undo it all
+        marker = GenerationMarker(self.mandir)
+        generation = marker.read()
+        removed = ReleaseJournal(self.jfile).undo()
+        self.assertEquals(4, len(removed))
+        for path in deployed + self.written:
+            self.assert_(not os.path.exists(path))
+        self.assertEquals(generation + 2, marker.read())
+        self.assertEquals([], ReleaseJournal(self.jfile).undo())
+
+    def testWriteAtomically(self):
+        # threads writing the same file do not collide
+        target = os.path.join(self.serverroot, "goob.manifest")
+        texts = map(lambda i: "goob %d\n" % i * 1000, xrange(4))
+        errors = []
+        def write(text):
+            try:
+                for i in xrange(20):
+                    _writeAtomically(target, text, FileStorage())
+            except Exception, ex:
+                errors.append(ex)
+        threads = map(lambda t: threading.Thread(target=write, args=(t,)), 
+                      texts)
+        map(lambda t: t.start(), threads)
+        map(lambda t: t.join(), threads)
+        self.assertEquals([], errors)
+        self.assert_(open(target).read() in texts)
+        self.assertEquals([], filter(lambda f: f.startswith("goob.manifest."),
+                                     os.listdir(self.serverroot)))
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEquals(0666 & ~umask, os.stat(target).st_mode & 0777)
+
+    def testScripts(self):
+        exe = "bin/autouprev.py"
+        cmd = [exe, "-d", self.serverroot, "-J", self.jfile, "-r",
+               "external/numpy/1.6.1+1"]
+        do = Popen(cmd, executable=exe, stdout=PIPE, stderr=PIPE)
+        (cmdout, cmderr) = do.communicate()
+        self.assert_(not do.returncode, cmderr)
+        self.assertEquals(2, len(cmdout.strip().split("\n")))
+        deployed = os.path.join(self.mandir, "pyfits-2.4.0+2.manifest")
+        self.assert_(os.path.exists(deployed))
+
+        # rerunning the finished run changes nothing
+        do = Popen(cmd, executable=exe, stdout=PIPE, stderr=PIPE)
+        (cmdout, cmderr) = do.communicate()
+        self.assert_(not do.returncode, cmderr)
+        self.assert_(not os.path.exists(os.path.join(self.serverroot,
+                                 "external/pyfits/2.4.0/b3.manifest")))
+
+        cmd = [exe, "-d", self.serverroot, "-J", self.jfile, "--undo"]
+        do = Popen(cmd, executable=exe, stdout=PIPE, stderr=PIPE)
+        (cmdout, cmderr) = do.communicate()
+        self.assert_(not do.returncode, cmderr)
+        self.assert_(not os.path.exists(deployed))
+        for path in self.written:
+            self.assert_(not os.path.exists(path))
+
+if __name__ == "__main__":
+    unittest.main()
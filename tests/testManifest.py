@@ -2,11 +2,14 @@
 test the manifest module
 """
 
-import os, sys, re, unittest, pdb
+import os, sys, re, unittest, pdb, shutil, time, pickle
 from cStringIO import StringIO
 
 from lsstdistrib.manifest import Dependency, Manifest, DeployedManifests
-from lsstdistrib.manifest import DeployedProductNotFound
+from lsstdistrib.manifest import DeployedProductNotFound, ManifestCache
+from lsstdistrib.manifest import ManifestRecord, LazyManifest
+from lsstdistrib.manifest import ManifestModifiedError
+import lsstdistrib.manifest as manifest
 
 testdir = os.path.join(os.getcwd(), "tests")
 
@@ -41,6 +44,40 @@ class DependencyTestCase(unittest.TestCase):
         self.assert_(not dep.matches("python", "2.7.2+3", "generic"))
         self.assert_(not dep.matches("swig", "2.7.2+5", "generic"))
 
+class ManifestRecordTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.data = "python generic 2.7.2+5 external/python/2.7.2/python.table external/python/2.7.2+5 lsstbuild:external/python/2.7.2/python.bld".split()
+        self.rec = ManifestRecord(*self.data)
+
+    def testAccess(self):
+        self.assertEquals(6, len(self.rec))
+        self.assertEquals("python", self.rec[0])
+        self.assertEquals("python", self.rec.name)
+        self.assertEquals(self.data[-1], self.rec[-1])
+        self.assertEquals(self.data[:3], self.rec[:3])
+        self.assertEquals(self.data, list(self.rec))
+        self.assertEquals(self.data, self.rec)
+        self.assertRaises(IndexError, self.rec.__getitem__, 6)
+        self.assert_(self.rec[1] is ManifestRecord(*self.data)[1])
+
+        dep = Dependency(self.rec)
+        self.assertEquals("2.7.2+5", dep.data[dep.VERSION])
+
+    def testUpdate(self):
+        cp = self.rec.copy()
+        self.rec[2] = "2.7.2+6"
+        self.assertEquals("2.7.2+6", self.rec.version)
+        self.assertEquals("2.7.2+5", cp[2])
+        self.assert_(cp != self.rec)
+
+    def testPickle(self):
+        for proto in (0, pickle.HIGHEST_PROTOCOL):
+            self.assertEquals(self.rec, 
+                              pickle.loads(pickle.dumps(self.rec, proto)))
+            dep = pickle.loads(pickle.dumps(Dependency(self.rec), proto))
+            self.assertEquals(self.rec, dep.data)
+
 class ManifestTestCase(unittest.TestCase):
     def setUp(self):
         self.data = "python generic 2.7.2+5 external/python/2.7.2/python.table external/python/2.7.2+5 lsstbuild:external/python/2.7.2/python.bld".split()
@@ -226,6 +263,77 @@ class ManifestTestCase(unittest.TestCase):
         self.assertEquals("lsstbuild:external/python/2.7.2/python.bld", 
                           dep.data[dep.INSTALLID])
 
+    def testFromFiles(self):
+        mandir = os.path.join(self.server, "manifests")
+        paths = map(lambda f: os.path.join(mandir, f), 
+                    sorted(os.listdir(mandir)))
+        singles = map(Manifest.fromFile, paths)
+        for processes in (None, 2):
+            mans = Manifest.fromFiles(paths, processes=processes)
+            self.assertEquals(len(paths), len(mans))
+            for man, single in zip(mans, singles):
+                self.assertEquals(single.getNameVerFlav(), 
+                                  man.getNameVerFlav())
+                self.assertEquals(single.keys, man.keys)
+                self.assertEquals(list(single), list(man))
+
+        deployed = DeployedManifests(mandir)
+        mans = deployed.getManifests([("numpy", "1.6.1+1"), 
+                                      ("python", "2.7.2+1")])
+        self.assertEquals(["numpy", "python"], map(lambda m: m.name, mans))
+        self.assertRaises(DeployedProductNotFound, deployed.getManifests, 
+                          [("goob", "1.0")])
+
+    def testLazy(self):
+        path = os.path.join(self.server, "manifests", "numpy-1.6.1+1.manifest")
+        full = Manifest.fromFile(path)
+        man = LazyManifest(path)
+        self.assertEquals(full.getNameVerFlav(), man.getNameVerFlav())
+        self.assert_(man.creator is None)
+        self.assert_(not man.isLoaded())
+
+        self.assertEquals(full.getSelf(), man.getSelf())
+        self.assert_(not man.isLoaded())
+        self.assert_(man.hasProduct("python"))
+        self.assert_(man.isLoaded())
+        self.assertEquals(list(full), list(man))
+
+        tailsize = manifest.selfRecordTailSize
+        manifest.selfRecordTailSize = 40
+        try:
+            man = LazyManifest(path)
+            self.assertEquals(full.getSelf(), man.getSelf())
+        finally:
+            manifest.selfRecordTailSize = tailsize
+
+        deployed = DeployedManifests(os.path.join(self.server, "manifests"))
+        man = deployed.getLazyManifest("numpy", "1.6.1+1")
+        self.assertEquals("numpy", man.getSelf()[0])
+        self.assertRaises(DeployedProductNotFound, 
+                          deployed.getLazyManifest, "goob", "1.0")
+
+    def testLazyHeader(self):
+        path = os.path.join(self.server, "manifests", "numpy-1.6.1+1.manifest")
+        man = Manifest.fromFile(path)
+        man.creator = "rhl"
+        man.submitter = "ktl"
+        strm = StringIO()
+        man.write(strm)
+
+        tmpfile = os.path.join(testdir, "lazy-tmp.manifest")
+        try:
+            with open(tmpfile, 'w') as fd:
+                fd.write(strm.getvalue())
+            lazy = LazyManifest(tmpfile)
+            self.assertEquals("numpy", lazy.name)
+            self.assertEquals("rhl", lazy.creator)
+            self.assertEquals("ktl", lazy.submitter)
+            self.assert_(lazy.time)
+            self.assertEquals(man.getSelf(), lazy.getSelf())
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
     def testRoundTrip(self):
         path = os.path.join(self.server, "manifests", "numpy-1.6.1+1.manifest")
         filecontents = StringIO()
@@ -240,6 +348,95 @@ class ManifestTestCase(unittest.TestCase):
 
         self.assertEquals(filecontents.getvalue(), mancontents.getvalue())
 
+    def testColumnWidths(self):
+        path = os.path.join(self.server, "manifests", "numpy-1.6.1+1.manifest")
+        man = Manifest.fromFile(path)
+        widths = man._collen()
+        man.addComment("a much longer comment than any of the record values")
+        self.assertEquals(widths, man._collen())
+        man.addRecord("python", "generic", "2.7.2+15", "", "", "")
+        self.assertEquals(widths[2]+1, man._collen()[2])
+
+        out = StringIO()
+        man.write(out)
+        self.assertEquals(out.getvalue(), repr(man))
+        man.resetColumnWidths()
+        self.assertEquals(widths[2]+1, man._collen()[2])
+
+        tmpfile = os.path.join(testdir, "widths-tmp.manifest")
+        try:
+            man.writeFile(tmpfile)
+            with open(tmpfile) as fd:
+                self.assertEquals(out.getvalue(), fd.read())
+        finally:
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+
+    def testIterate(self):
+        path = os.path.join(self.server, "manifests", "numpy-1.6.1+1.manifest")
+        man = Manifest.fromFile(path)
+        recs = list(man)
+        self.assertEquals(3, len(recs))
+        self.assert_(recs[0] is man.recs[man.keys[0]])
+
+        deps = man.getDeps()
+        self.assertEquals(3, len(deps))
+        self.assertEquals("numpy", deps[-1].getName())
+        self.assertEquals(["tcltk", "python"], 
+                          map(lambda d: d.getName(), deps[:2]))
+        self.assertEquals(["tcltk", "python", "numpy"], 
+                          map(lambda d: d.getName(), deps))
+        modcount = man.modcount
+        deps[0].data[2] = "8.5.9+2"
+        self.assertEquals("8.5.9+2", man.getProduct("tcltk")[2])
+        self.assertEquals(modcount+1, man.modcount)
+        man.getSelf()[3] = "none"
+        self.assertEquals(modcount+2, man.modcount)
+
+        # changing records in place during iteration is allowed
+        for dep in man.getDeps():
+            dep.data[4] = dep.data[4] + "/"
+        self.assertEquals(modcount+5, man.modcount)
+        man = pickle.loads(pickle.dumps(man, pickle.HIGHEST_PROTOCOL))
+        modcount = man.modcount
+        man.getSelf()[3] = "numpy.table"
+        self.assertEquals(modcount+1, man.modcount)
+
+        try:
+            for rec in man:
+                man.addComment("oops")
+            self.fail("failed to detect change during iteration")
+        except ManifestModifiedError, ex:
+            self.assert_(ex.manifest is man)
+
+    def testGetProduct(self):
+        man = Manifest("numpy", "1.6.1+1")
+        self.assert_(man.getProduct("python") is None)
+        man.addRecord(*self.data)
+        man.addComment("a comment")
+        man.addRecord("python", "Linux64", "2.7.2+6", "", "", "")
+        self.assertEquals("2.7.2+6", man.getProduct("python")[2])
+        self.assert_(not man.hasProduct("pyth"))
+
+    def testMerge(self):
+        path = os.path.join(self.server, "manifests", "numpy-1.6.1+1.manifest")
+        man = Manifest("pyfits", "2.4.0+2")
+        man.addRecord("python", "generic", "2.7.2+5", "", "", "")
+        man.merge(Manifest.fromFile(path))
+        self.assertEquals(["python", "tcltk", "numpy"],
+                          map(lambda k: man.recs[k][0], man.keys))
+        self.assertEquals("2.7.2+5", man.getProduct("python")[2])
+
+        big = Manifest("big", "1.0")
+        other = Manifest("other", "1.0")
+        other.addComment("comments are not merged")
+        for i in xrange(2000):
+            other.addRecord("prod%d" % i, "generic", "1.0", "", "", "")
+        big.merge(other)
+        big.merge(other)
+        self.assertEquals(2000, len(big.keys))
+        self.assert_(big.hasProduct("prod1999"))
+
 class DeployedManifestsTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -274,6 +471,15 @@ class DeployedManifestsTestCase(unittest.TestCase):
         self.assert_("1.0.2+1" in versions)
         self.assert_("4.4.0.1+1" in versions)
 
+    def testListAllInOrder(self):
+        prods = self.deployed.listAllInOrder()
+        self.assertEquals(22, len(prods))
+        self.assertEquals(sorted(map(lambda p: p[0], prods)),
+                          map(lambda p: p[0], prods))
+        pythons = filter(lambda p: p[0] == "python", prods)
+        self.assertEquals(["2.7.1+1", "2.7.2+1", "2.7.2+2"], 
+                          map(lambda p: p[1], pythons))
+
     def testGetVersions(self):
         versions = self.deployed.getVersions("lsst")
         self.assert_(versions is not None)
@@ -342,5 +548,165 @@ class DeployedManifestsTestCase(unittest.TestCase):
         deps = self.deployed.dependsOn("matplotlib")
         self.assertEquals(1, len(deps))
 
+    def testDependsOnAny(self):
+        prods = ["numpy", "tcltk", "matplotlib", "goob"]
+        deps = self.deployed.dependsOnAny(prods)
+        self.assertEquals(sorted(prods), sorted(deps.keys()))
+        self.assertEquals([], deps["goob"])
+        for prod in prods[:-1]:
+            self.assertEquals(sorted(self.deployed.dependsOn(prod)), 
+                              deps[prod])
+
+    def testClosure(self):
+        # these manifests list the full closure of their dependencies
+        for prodname in ("tcltk", "python", "numpy"):
+            self.assertEquals(filter(lambda p: p[0] != prodname, 
+                                     self.deployed.dependsOn(prodname)),
+                              self.deployed.getAllDependents(prodname))
+        self.assertEquals([], self.deployed.getAllDependents("goob"))
+
+        self.assert_("tcltk" in 
+                  map(lambda p: p[0], self.deployed.getAllDependencies("pyfits")))
+        self.assertRaises(DeployedProductNotFound, 
+                          self.deployed.getAllDependencies, "goob")
+
+        affected = map(lambda p: p[0], self.deployed.getAffected(["python"]))
+        self.assert_(affected.index("numpy") < affected.index("pyfits"))
+        self.assert_("python" not in affected)
+
+    def testPythonScanner(self):
+        self.assertRaises(ValueError, DeployedManifests, self.mandir, 
+                          scanner="goob")
+        chunksize = manifest.scanChunkSize
+        manifest.scanChunkSize = 4
+        try:
+            for processes in (1, 2):
+                pyscan = DeployedManifests(self.mandir, scanner="python",
+                                           processes=processes)
+                for args in [("numpy", "1.6.1+1"), ("tcltk", "8.5.9+1"),
+                             ("tcltk", None, "generic"), ("matplotlib",)]:
+                    self.assertEquals(self.deployed.dependsOn(*args),
+                                      pyscan.dependsOn(*args))
+                prods = ["numpy", "tcltk", "goob"]
+                self.assertEquals(self.deployed.dependsOnAny(prods),
+                                  pyscan.dependsOnAny(prods))
+                self.assertEquals([], pyscan.dependsOn("goob"))
+        finally:
+            manifest.scanChunkSize = chunksize
+
+class ManifestCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        origroot = os.path.join(testdir, "server")
+        self.serverroot = os.path.join(testdir, "server-tmp")
+
+        self.tearDown()
+        shutil.copytree(origroot, self.serverroot, True)
+        self.mandir = os.path.join(self.serverroot, "manifests")
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testHitMiss(self):
+        deployed = DeployedManifests(self.mandir)
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        self.assertEquals(0, deployed.cache.hits)
+        self.assertEquals(1, deployed.cache.misses)
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        self.assertEquals(1, deployed.cache.hits)
+        self.assertEquals(1, deployed.cache.misses)
+        self.assert_(man.hasProduct("tcltk"))
+
+        self.assertRaises(DeployedProductNotFound, 
+                          deployed.getManifest, "goob", "1.0")
+
+        deployed = DeployedManifests(self.mandir, cacheSize=0)
+        self.assert_(deployed.cache is None)
+        self.assert_(deployed.getManifest("numpy", "1.6.1+1").hasProduct("tcltk"))
+
+    def testCopyOnWrite(self):
+        deployed = DeployedManifests(self.mandir)
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        man.getSelf()[2] = "9.9+9"
+        man.addComment("scribble")
+
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        self.assertEquals("1.6.1+1", man.getSelf()[2])
+        self.assertEquals(3, len(man.keys))
+
+        # a hit that is only read shares the cached records
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        other = deployed.getManifest("numpy", "1.6.1+1")
+        cached = deployed.getManifest("numpy", "1.6.1+1")
+        self.assert_(man.recs is other.recs)
+        self.assertEquals(3, len(list(man)))
+        self.assert_(man.hasProduct("tcltk"))
+        # iterated records are read-only until copied
+        self.assertRaises(TypeError, list(man)[0].__setitem__, 2, "9.9+9")
+        man.getProduct("tcltk")[2] = "9.9+9"
+        self.assertEquals("9.9+9", list(man)[0][2])
+        self.assertNotEquals("9.9+9", list(other)[0][2])
+        self.assert_(list(man)[1] is list(other)[1])
+        self.assertRaises(TypeError, list(man)[1].__setitem__, 2, "9.9+9")
+
+        # adding records does not affect the other manifests
+        man.addRecord("goob", "generic", "1.0+1", "none", "goob/1.0", "goob")
+        self.assert_(man.recs is not other.recs)
+        self.assertEquals(3, len(other.keys))
+        self.assert_(not other.hasProduct("goob"))
+        deps = other.getDeps()
+        self.assertEquals("tcltk", deps[0].getName())
+        self.assertEquals(3, len(list(deps)))
+        self.assert_(other.recs is cached.recs)
+        dep = deps[0]
+        dep.data[dep.VERSION] = "9.9+9"
+        self.assert_(other.recs is not cached.recs)
+        self.assertEquals("9.9+9", list(other)[0][2])
+        self.assert_(list(other)[2] is list(cached)[2])
+        self.assertEquals("9.9+9", dep.data[dep.VERSION])
+        self.assertEquals(1, other.modcount)
+        self.assertNotEquals("9.9+9", 
+                  list(deployed.getManifest("numpy", "1.6.1+1"))[0][2])
+
+    def testParseArgs(self):
+        # the same file parsed with different arguments is cached apart
+        cache = ManifestCache()
+        path = os.path.join(self.mandir, "numpy-1.6.1+1.manifest")
+        man = cache.get(path)
+        self.assertEquals("numpy", man.name)
+        man = cache.get(path, "generic", "goob", "1.0")
+        self.assertEquals(("goob", "1.0"), (man.name, man.vers))
+        self.assertEquals(2, cache.misses)
+        self.assertEquals(2, len(cache))
+        man = cache.get(path)
+        self.assertEquals(("numpy", "1.6.1+1"), (man.name, man.vers))
+        self.assertEquals(1, cache.hits)
+        self.assert_(path in cache)
+
+    def testBounded(self):
+        cache = ManifestCache(2)
+        for name in "numpy-1.6.1+1 pyfits-2.4.0+1 zlib-1.2.5+1".split():
+            cache.get(os.path.join(self.mandir, name+".manifest"))
+        self.assertEquals(2, len(cache))
+        self.assert_(os.path.join(self.mandir, "numpy-1.6.1+1.manifest")
+                     not in cache)
+
+    def testInvalidate(self):
+        deployed = DeployedManifests(self.mandir)
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        self.assert_(man.hasProduct("tcltk"))
+
+        time.sleep(0.01)
+        path = os.path.join(self.mandir, "numpy-1.6.1+1.manifest")
+        with open(path) as fd:
+            lines = filter(lambda l: not l.startswith("tcltk"), fd)
+        with open(path, 'w') as fd:
+            fd.writelines(lines)
+
+        man = deployed.getManifest("numpy", "1.6.1+1")
+        self.assertEquals(2, deployed.cache.misses)
+        self.assert_(not man.hasProduct("tcltk"))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,101 @@
+"""
+test the planner module
+"""
+
+import os, sys, re, unittest, pdb, shutil
+
+from lsstdistrib.planner import UprevPlanner
+from lsstdistrib.release import UpdateDependents
+from lsstdistrib.manifest import Manifest
+from lsstdistrib.storage import MemoryStorage, FileStorage
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class UprevPlannerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        origroot = os.path.join(testdir, "server")
+        self.serverroot = os.path.join(testdir, "server-tmp")
+
+        self.tearDown()
+        shutil.copytree(origroot, self.serverroot, True)
+        self.planner = UprevPlanner(self.serverroot)
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testMatchesUprev(self):
+        releases = [("numpy", "1.6.1+1")]
+        plan = self.planner.plan(releases)
+        self.assert_(self.planner.isLoaded())
+        self.assertEquals(["matplotlib", "pyfits"], sorted(plan.order))
+        pyfits = os.path.join(self.serverroot,
+                              "external/pyfits/2.4.0/b2.manifest")
+        self.assertEquals(pyfits, plan.files["pyfits"])
+        self.assert_(not os.path.exists(pyfits))
+
+        uprev = UpdateDependents(releases, self.serverroot)
+        uprev.updateFromTag("current")
+        created = uprev.createManifests()
+        self.assertEquals(sorted(created), sorted(plan.getProducts()))
+        written = Manifest.fromFile(pyfits)
+        self.assertEquals(map(list, written), map(list, plan.manifests["pyfits"]))
+
+        steps = map(lambda t: t[0], plan.timings)
+        self.assert_("getDependents" in steps)
+        self.assert_("setUpgradedManifestRecords" in steps)
+        self.assert_(plan.getTotalTime() >= 0.0)
+        self.assertEquals("listManifests", self.planner.timings[0][0])
+
+    def testHypothetical(self):
+        plan = self.planner.plan([("numpy", "1.6.2+1")])
+        self.assertEquals(["matplotlib", "pyfits"], sorted(plan.order))
+        rec = plan.records["numpy"]
+        self.assertEquals("1.6.2+1", rec[2])
+        self.assertEquals("external/numpy/1.6.2+1", rec[4])
+        recs = filter(lambda r: r[0] == "numpy", plan.manifests["pyfits"])
+        self.assertEquals(["1.6.2+1"], map(lambda r: r[2], recs))
+
+        # plans are independent of each other
+        plan = self.planner.plan([("numpy", "1.6.1+1")], exclude=["pyfits"])
+        self.assertEquals(["matplotlib"], plan.order)
+        self.assertEquals("1.6.1+1", plan.records["numpy"][2])
+        plan = self.planner.plan([("tcltk", "8.5.9+1")], include=["numpy"])
+        self.assertEquals(["numpy"], plan.order)
+
+    def testPseudoProduct(self):
+        # a pseudo product's manifest has no record for the product itself
+        mandir = os.path.join(self.serverroot, "manifests")
+        with open(os.path.join(mandir, "numpy-1.6.1+1.manifest")) as fd:
+            lines = filter(lambda l: not l.startswith("numpy "), fd)
+        lines[0] = lines[0].replace("numpy (1.6.1+1)", "goob (1.0+1)")
+        with open(os.path.join(mandir, "goob-1.0+1.manifest"), 'w') as fd:
+            fd.writelines(lines)
+
+        # an undeployed release of it has no record to up-rev with
+        plan = self.planner.plan([("goob", "1.0+2"), ("numpy", "1.6.2+1")])
+        self.assert_(self.planner.getReleaseRecord("goob", "1.0+2") is None)
+        self.assertEquals(["matplotlib", "pyfits"], sorted(plan.order))
+        self.assert_("goob" not in plan.records)
+        self.assertEquals("1.6.2+1", plan.records["numpy"][2])
+
+    def testInMemory(self):
+        storage = MemoryStorage(FileStorage())
+        planner = UprevPlanner(self.serverroot, storage=storage)
+        plan = planner.plan([("numpy", "1.6.1+1")])
+        self.assertEquals(sorted(self.planner.plan([("numpy", "1.6.1+1")])
+                                 .getProducts()),
+                          sorted(plan.getProducts()))
+        self.assertEquals({}, storage.files)
+
+        # an up-rev run against the overlay writes the planned files
+        uprev = UpdateDependents(plan.releases, self.serverroot, 
+                                 storage=storage)
+        uprev.updateFromTag("current")
+        uprev.createManifests()
+        self.assertEquals(sorted(plan.files.values()), sorted(storage.files))
+        self.assert_(not filter(os.path.exists, plan.files.values()))
+
+if __name__ == "__main__":
+    unittest.main()
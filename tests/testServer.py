@@ -2,10 +2,11 @@
 test the server module
 """
 
-import os, sys, re, unittest, pdb
+import os, sys, re, unittest, pdb, shutil
 from cStringIO import StringIO
 
-from lsstdistrib.server import Repository
+from lsstdistrib.server import Repository, BuildNumberIndex
+from lsstdistrib.manifest import DeployedProductNotFound
 
 testdir = os.path.join(os.getcwd(), "tests")
 
@@ -72,5 +73,65 @@ class RepositoryTestCase(unittest.TestCase):
         self.assertEquals("b2.manifest", 
                           self.repos.getNextUndeployedBuildFilename("numpy", "1.6.1+1"))
 
+class BuildNumberIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "server")
+        self.repos = Repository(self.serverroot)
+        self.index = BuildNumberIndex(self.repos)
+
+    def testDeployed(self):
+        self.assertEquals(2, self.index.getLatestDeployedBuildNumber("python", "2.7.2"))
+        self.assertEquals(1, self.index.getLatestDeployedBuildNumber("python", "2.7.1+3"))
+        self.assertEquals(1, self.index.getLatestDeployedBuildNumber("lsst", "4.4.0.1"))
+        self.assertRaises(DeployedProductNotFound, 
+                          self.index.getLatestDeployedBuildNumber, "goob", "1.0")
+        self.assertRaises(DeployedProductNotFound, 
+                          self.index.getLatestDeployedBuildNumber, "eups", "1.2.19")
+
+    def testUndeployed(self):
+        for prod in [("python", "2.7.2+1"), ("numpy", "1.6.1+1"), 
+                     ("lsst", "4.4.0.1"), ("sconsUtils", "3.4.5")]:
+            self.assertEquals(self.repos.getLatestUndeployedBuildNumber(*prod),
+                              self.index.getLatestUndeployedBuildNumber(*prod))
+        self.assertEquals(0, self.index.getLatestUndeployedBuildNumber("eups", "1.2.19"))
+        self.assertRaises(DeployedProductNotFound, 
+                          self.index.getLatestUndeployedBuildNumber, "goob", "1.0")
+
+    def testRecommend(self):
+        self.assertEquals(3, self.index.recommendNextBuildNumber("python", "2.7.2"))
+        self.assertEquals(2, self.index.recommendNextBuildNumber("numpy", "1.6.1+1"))
+        self.assertEquals(1, self.index.recommendNextBuildNumber("goob", "1.0"))
+
+        self.index.noteUndeployed("numpy", "1.6.1+1", 4)
+        self.assertEquals(5, self.index.recommendNextBuildNumber("numpy", "1.6.1"))
+        self.index.noteDeployed("numpy", "1.6.1+7")
+        self.assertEquals(8, self.index.recommendNextBuildNumber("numpy", "1.6.1"))
+
+        # a version that has only been noted as undeployed
+        self.index.noteUndeployed("numpy", "1.7.0", 2)
+        self.assertEquals(3, self.index.recommendNextBuildNumber("numpy", "1.7.0"))
+
+    def testRecommendUndeployedOnly(self):
+        serverroot = os.path.join(testdir, "server-tmp")
+        if os.path.exists(serverroot):
+            shutil.rmtree(serverroot)
+        shutil.copytree(self.serverroot, serverroot, True)
+        try:
+            proddir = os.path.join(serverroot, "external", "numpy", "1.7.0")
+            os.makedirs(proddir)
+            for build in (1, 2):
+                shutil.copy(os.path.join(serverroot, "external", "numpy", 
+                                         "1.6.1", "b1.manifest"),
+                            os.path.join(proddir, "b%d.manifest" % build))
+
+            index = BuildNumberIndex(Repository(serverroot))
+            self.assertRaises(DeployedProductNotFound, 
+                              index.getLatestDeployedBuildNumber, 
+                              "numpy", "1.7.0")
+            self.assertEquals(3, index.recommendNextBuildNumber("numpy", "1.7.0"))
+        finally:
+            shutil.rmtree(serverroot)
+
 if __name__ == "__main__":
     unittest.main()
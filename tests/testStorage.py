@@ -0,0 +1,134 @@
+"""
+test the storage module
+"""
+
+import os, sys, re, unittest, pdb, shutil
+
+from lsstdistrib.storage import FileStorage, MemoryStorage
+from lsstdistrib.manifest import DeployedManifests
+from lsstdistrib.release import UpdateDependents, Release
+from lsstdistrib.bench.synth import SyntheticServer
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+def listTree(rootdir):
+    out = []
+    for dirpath, dirnames, filenames in os.walk(rootdir):
+        out.extend(map(lambda f: os.path.join(dirpath, f), filenames))
+    out.sort()
+    return out
+
+class MemoryStorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+
+    def testReadWrite(self):
+        self.assert_(not self.storage.isLocal())
+        self.assertRaises(IOError, self.storage.open, "/a/b/file.txt", 'w')
+        self.storage.makedirs("/a/b")
+        self.assert_(self.storage.isdir("/a"))
+        self.assertRaises(OSError, self.storage.makedirs, "/a/b")
+
+        with self.storage.open("/a/b/file.txt", 'w') as fd:
+            fd.write("hello\n")
+        self.assert_(self.storage.exists("/a/b/file.txt"))
+        self.assert_(not self.storage.isdir("/a/b/file.txt"))
+        self.assertEquals("hello\n", self.storage.read("/a/b/file.txt"))
+        self.assertEquals(["b"], self.storage.listdir("/a"))
+
+        self.storage.copy("/a/b/file.txt", "/a/file.txt")
+        self.assertEquals(["b", "file.txt"], sorted(self.storage.listdir("/a")))
+        self.storage.remove("/a/b/file.txt")
+        self.assert_(not self.storage.exists("/a/b/file.txt"))
+        self.assertEquals([], self.storage.listdir("/a/b"))
+        self.assertRaises(IOError, self.storage.open, "/a/b/file.txt")
+        self.assertRaises(OSError, self.storage.listdir, "/c")
+
+    def testOverlay(self):
+        serverroot = os.path.join(testdir, "server")
+        before = listTree(serverroot)
+        storage = MemoryStorage(FileStorage())
+        mandir = os.path.join(serverroot, "manifests")
+        orig = os.path.join(mandir, "pyfits-2.4.0+1.manifest")
+        copy = os.path.join(mandir, "pyfits-2.4.0+2.manifest")
+
+        self.assert_(storage.exists(orig))
+        self.assert_(storage.isdir(mandir))
+        self.assertEquals(open(orig).read(), storage.read(orig))
+
+        storage.copy(orig, copy)
+        self.assert_(storage.exists(copy))
+        self.assert_("pyfits-2.4.0+2.manifest" in storage.listdir(mandir))
+        storage.remove(orig)
+        self.assert_(not storage.exists(orig))
+        self.assert_("pyfits-2.4.0+1.manifest" not in storage.listdir(mandir))
+        self.assertRaises(IOError, storage.open, orig)
+
+        deployed = DeployedManifests(mandir, storage=storage)
+        deps = deployed.dependsOn("numpy", "1.6.1+1")
+        self.assert_(("pyfits", "2.4.0+2") in deps)
+        self.assert_(("pyfits", "2.4.0+1") not in deps)
+        self.assertEquals("2.4.0+2",
+                          deployed.getManifest("pyfits", "2.4.0+2").vers)
+
+        self.assertEquals(before, listTree(serverroot))
+
+class InMemoryServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.serverroot = os.path.join(testdir, "server-tmp")
+        self.tearDown()
+        shutil.copytree(os.path.join(testdir, "server"), self.serverroot, True)
+
+    def tearDown(self):
+        if os.path.exists(self.serverroot):
+            shutil.rmtree(self.serverroot)
+
+    def testUprevAndRelease(self):
+        before = listTree(self.serverroot)
+        storage = MemoryStorage(FileStorage())
+
+        uprev = UpdateDependents([("numpy", "1.6.1+1")], self.serverroot,
+                                 storage=storage)
+        uprev.updateFromTag("current")
+        updated = uprev.createManifests()
+        self.assertEquals(["matplotlib", "pyfits"],
+                          sorted(map(lambda u: u[0], updated)))
+        for prod in updated:
+            self.assert_(storage.exists(prod[3]))
+
+        rel = Release(map(lambda u: (u[0], "%s+%s" % (u[1], u[2]), u[3]),
+                          updated), self.serverroot, storage=storage)
+        rel.releaseAll()
+        deployed = DeployedManifests(os.path.join(self.serverroot, "manifests"),
+                                     storage=storage)
+        self.assert_(("pyfits", "2.4.0+2") in deployed.latestProducts())
+
+        self.assertEquals(before, listTree(self.serverroot))
+
+    def testSyntheticServer(self):
+        rootdir = os.path.join(testdir, "bench-tmp")
+        storage = MemoryStorage()
+        synth = SyntheticServer(rootdir, products=20, versions=1, builds=1,
+                                depth=3, stackSize=10, storage=storage)
+        counts = synth.generate()
+        self.assert_(not os.path.exists(rootdir))
+
+        deployed = DeployedManifests(os.path.join(rootdir, "manifests"),
+                                     storage=storage)
+        self.assertEquals(counts["manifests"], len(deployed.listAll()))
+
+        target = (synth.products[0], synth.getLatestVersion(0))
+        uprev = UpdateDependents([target], rootdir, storage=storage)
+        updated = uprev.createManifests()
+        self.assert_(len(updated) > 0)
+        rel = Release(map(lambda u: (u[0], "%s+%s" % (u[1], u[2]), u[3]),
+                          updated), rootdir, storage=storage)
+        rel.releaseAll()
+        self.assertEquals(counts["manifests"] + len(updated),
+                          len(deployed.listAll()))
+        self.assert_(not os.path.exists(rootdir))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+test the tagstore module
+"""
+
+import os, sys, re, unittest, pdb, shutil, time
+
+from lsstdistrib.tagstore import TagStore, TagStack, getTagStore, defaultTagStore
+from lsstdistrib.tags import TagDef
+from lsstdistrib.release import UpdateDependents
+from lsstdistrib.storage import MemoryStorage, FileStorage
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class TagStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.join(testdir, "tags-tmp")
+        self.tearDown()
+        os.makedirs(self.dir)
+        self.current = os.path.join(self.dir, "current.list")
+        shutil.copyfile(os.path.join(testdir, "server", "current.list"),
+                        self.current)
+        self.stable = os.path.join(self.dir, "stable.list")
+        with open(self.stable, 'w') as fd:
+            fd.write("# pkg  flavor  version  extra_dir\n")
+            fd.write("\n")
+            fd.write("numpy  generic  1.6.0+3  external\n")
+            fd.write("goob   generic  1.0+1\n")
+        self.store = TagStore()
+
+    def tearDown(self):
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+
+    def testCache(self):
+        tagged = self.store.get(self.current)
+        self.assertEquals("1.6.1+1", tagged.getVersion("numpy"))
+        self.assert_(tagged is self.store.get(self.current))
+        self.assertEquals(1, self.store.loads)
+
+        # a changed file is reloaded
+        with open(self.current, 'a') as fd:
+            fd.write("goob   generic  2.0+1\n")
+        reloaded = self.store.get(self.current)
+        self.assert_(reloaded is not tagged)
+        self.assertEquals("2.0+1", reloaded.getVersion("goob"))
+        self.assertEquals(2, self.store.loads)
+
+        self.store.clear()
+        self.store.get(self.current)
+        self.assertEquals(3, self.store.loads)
+        self.assertRaises(EnvironmentError, self.store.get,
+                          os.path.join(self.dir, "goob.list"))
+
+    def testStack(self):
+        stack = self.store.getStack([self.stable, self.current])
+        self.assertEquals("1.6.0+3", stack.getVersion("numpy"))
+        self.assertEquals("2.4.0+1", stack.getVersion("pyfits"))
+        self.assertEquals("1.0+1", stack.getVersion("goob"))
+        self.assertEquals(["goob", "generic", "1.0+1", ""],
+                          stack.lookup("goob"))
+        self.assert_(stack.getVersion("gurn") is None)
+        self.assertEquals(self.stable, stack.getLayer("numpy").file)
+        self.assertEquals(self.current, stack.getLayer("pyfits").file)
+        self.assertRaises(TypeError, stack.merge, self.current)
+
+        # the layers are not changed by stacking
+        stack = TagStack([self.store.get(self.current)])
+        self.assertEquals("1.6.1+1", stack.getVersion("numpy"))
+        stack = stack.push(self.store.get(self.stable))
+        self.assertEquals("1.6.0+3", stack.getVersion("numpy"))
+        self.assertEquals("1.6.1+1",
+                          self.store.get(self.current).getVersion("numpy"))
+        self.assertEquals(2, self.store.loads)
+
+    def testParse(self):
+        # the stack agrees with merging the files in reverse order
+        merged = TagDef(self.current)
+        merged.merge(self.stable)
+        stack = self.store.getStack([self.stable, self.current])
+        self.assertEquals(merged.prod, stack.prod)
+
+    def testStorage(self):
+        self.assert_(getTagStore() is defaultTagStore)
+        self.assert_(getTagStore(FileStorage()) is defaultTagStore)
+        storage = MemoryStorage(FileStorage())
+        with storage.open(self.stable, 'w') as fd:
+            fd.write("numpy  generic  1.6.0+3  external\n")
+        store = getTagStore(storage)
+        self.assert_(store is not defaultTagStore)
+        self.assertEquals("1.6.0+3",
+                          store.get(self.stable).getVersion("numpy"))
+
+    def testUpdateFromTag(self):
+        serverroot = os.path.join(testdir, "server")
+        uprev = UpdateDependents([("numpy", "1.6.1+1")], serverroot)
+        uprev.updateFromTag("current")
+        tagged = uprev.tagged
+        uprev.updateFromTag("current")
+        self.assertEquals(tagged.layers[0], uprev.tagged.layers[1])
+        self.assert_(uprev.tagged.layers[0] is uprev.tagged.layers[1])
+        self.assertEquals("2.4.0+1", uprev.tagged.getVersion("pyfits"))
+
+if __name__ == "__main__":
+    unittest.main()
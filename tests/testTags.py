@@ -0,0 +1,129 @@
+"""
+test the tags module
+"""
+
+import os, sys, re, unittest, pdb, shutil
+from subprocess import Popen, PIPE
+
+from lsstdistrib.tags import TagDef, TagFileEditor
+from lsstdistrib.storage import MemoryStorage, FileStorage
+
+testdir = os.path.join(os.getcwd(), "tests")
+
+class TagFileEditorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = os.path.join(testdir, "tags-tmp")
+        self.tearDown()
+        os.makedirs(self.dir)
+        self.tagfile = os.path.join(self.dir, "current.list")
+        shutil.copyfile(os.path.join(testdir, "server", "current.list"),
+                        self.tagfile)
+        self.orig = open(self.tagfile).read().splitlines()
+
+    def tearDown(self):
+        if os.path.exists(self.dir):
+            shutil.rmtree(self.dir)
+
+    def lines(self):
+        return open(self.tagfile).read().splitlines()
+
+    def testBatch(self):
+        editor = TagFileEditor(self.tagfile)
+        self.assert_(not editor.isChanged())
+        editor.apply([("numpy", "1.6.2+1"), ("afw", "4.5.1+2"),
+                      ("zzz", "1.0+1"), ("base", "4.5.1+1")])
+        editor.setVersion("cfitsio", "3290+1", "external")
+        editor.setVersion("numpy", "1.6.2+2")
+        self.assert_(editor.isChanged())
+        self.assertEquals("1.6.2+2", editor.getVersion("numpy"))
+        self.assertEquals("4.5.1+2", editor.getVersion("afw"))
+        self.assertEquals("2.4.0+1", editor.getVersion("pyfits"))
+        self.assertEquals(self.orig, self.lines())
+        editor.write()
+        self.assert_(not editor.isChanged())
+
+        lines = self.lines()
+        self.assertEquals(len(self.orig) + 3, len(lines))
+        tagged = TagDef(self.tagfile)
+        self.assertEquals("1.6.2+2", tagged.getVersion("numpy"))
+        self.assertEquals("3290+1", tagged.getVersion("cfitsio"))
+        self.assertEquals(["afw", "generic", "4.5.1+2", ""],
+                          tagged.lookup("afw"))
+
+        # new products go in alphabetical order at the end of their section
+        lsst = lines.index("# lsst")
+        names = map(lambda l: l.split()[0], lines[lsst+2:lsst+8])
+        self.assertEquals(["afw", "base", "lsst", "lssteups", "sconsUtils",
+                           "zzz"], names)
+        self.assertEquals("#", lines[lsst+8])
+
+        # untouched lines are left as they were
+        changed = re.compile(r"(numpy|cfitsio|afw|base|zzz) ")
+        self.assertEquals(filter(lambda l: not changed.match(l), self.orig),
+                          filter(lambda l: not changed.match(l), lines))
+        i = map(lambda l: l.split()[0], self.orig).index("cfitsio")
+        self.assertEquals("cfitsio          generic    3290+1         external",
+                          lines[i])
+
+    def testNewSection(self):
+        storage = MemoryStorage(FileStorage())
+        editor = TagFileEditor(self.tagfile, storage)
+        editor.setVersion("goob", "1.0", "gurn")
+        editor.setVersion("numpy", "1.6.2+1")
+        editor.write()
+        self.assertEquals(self.orig, self.lines())
+        lines = storage.read(self.tagfile).splitlines()
+        self.assertEquals(["#", "# gurn", "#"], lines[-4:-1])
+        self.assertEquals(["goob", "generic", "1.0", "gurn"],
+                          lines[-1].split())
+        self.assertEquals("1.6.2+1", editor.getVersion("numpy"))
+
+    def testSectionHeaders(self):
+        # a one-word comment is not taken for a section header
+        lines = self.orig[:]
+        lsst = lines.index("# lsst")
+        lines.insert(lsst+2, "# obsolete")
+        lines.insert(lsst-2, "# [gurn]")
+        with open(self.tagfile, 'w') as fd:
+            fd.write("".join(map(lambda l: l + "\n", lines)))
+
+        editor = TagFileEditor(self.tagfile)
+        editor.setVersion("afw", "4.5.1+2")
+        editor.setVersion("aaa", "1.0", "gurn")
+        editor.setVersion("obsolete", "1.0", "obsolete")
+        editor.write()
+        out = self.lines()
+        lsst = out.index("# lsst")
+        self.assertEquals(["#", "# obsolete"], out[lsst+1:lsst+3])
+        self.assertEquals("afw", out[lsst+3].split()[0])
+        self.assertEquals("aaa", out[out.index("# [gurn]")+1].split()[0])
+        self.assertEquals(["#", "# obsolete", "#"], out[-4:-1])
+
+    def testScript(self):
+        exe = "bin/tagRelease.py"
+        shutil.copyfile(self.tagfile, os.path.join(self.dir, "stable.list"))
+        cmd = [exe, "-d", self.dir, "-T", "current,stable",
+               "numpy/1.6.2+1", "afw/4.5.1+2"]
+        do = Popen(cmd, executable=exe, stdout=PIPE, stderr=PIPE)
+        (cmdout, cmderr) = do.communicate()
+        self.assert_(not do.returncode, cmderr)
+        for tag in ("current", "stable"):
+            tagged = TagDef(os.path.join(self.dir, tag + ".list"))
+            self.assertEquals("1.6.2+1", tagged.getVersion("numpy"))
+            self.assertEquals("4.5.1+2", tagged.getVersion("afw"))
+
+        # the one-product form still works
+        outdir = os.path.join(self.dir, "out")
+        os.mkdir(outdir)
+        cmd = [exe, "-d", self.dir, "-D", outdir, "-t", "external",
+               "goob", "1.0+1", "current"]
+        do = Popen(cmd, executable=exe, stdout=PIPE, stderr=PIPE)
+        (cmdout, cmderr) = do.communicate()
+        self.assert_(not do.returncode, cmderr)
+        tagged = TagDef(os.path.join(outdir, "current.list"))
+        self.assertEquals("external", tagged.lookup("goob")[3])
+        self.assert_(TagDef(self.tagfile).lookup("goob") is None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,9 @@ test the version module
 import os, sys, re, unittest, pdb
 
 from lsstdistrib.version import VersionCompare, incrementBuild, substituteBuild, \
-                                splitToReleaseBuild, baseVersion
+                                splitToReleaseBuild, baseVersion, Version, \
+                                sortOrder, sortVersions
+from lsstdistrib import version as onvers
 
 class FunctionsTestCase(unittest.TestCase):
 
@@ -159,6 +161,128 @@ class VersionCompareTestCase(unittest.TestCase):
         self.assertEquals(+1, self.vcmp("1.0-36", "1.0-23"))
         self.assertEquals(+1, self.vcmp("1.0-23b3", "1.0-23b1"))
 
+    def testSortKey(self):
+        versions = "1 2 1.0+1 1.0+3 1.0+23 1.0-5 1.0-23b1 1.0-23b3 1.0svn5 " \
+                   "1.0.2+1 1.0.2-3 2.3.1 2.3.0svn4355 2.3.0.7+1 2.2.2.7 " \
+                   "2.2.2.7svn4355 1.0+rc".split()
+        versions += "1.0.1+1 1.0+2 1.0.1 1.0".split()
+        for v1 in versions:
+            for v2 in versions:
+                # compare() is not antisymmetric when a field is an integer
+                # in one version and not in the other (e.g. 1.0+rc and 
+                # 1.1.2+1); the key orders the integer first
+                if self.vcmp(v1, v2) != -self.vcmp(v2, v1):
+                    continue
+                k1 = self.vcmp.sortKey(v1)
+                k2 = self.vcmp.sortKey(v2)
+                self.assertEquals(self.vcmp(v1, v2), (k1 > k2) - (k1 < k2),
+                                  "%s <=> %s" % (v1, v2))
+
+        self.assertEquals(["1.0+1", "1.0+3", "1.0+23"],
+                          sorted(["1.0+23", "1.0+1", "1.0+3"], 
+                                 key=self.vcmp.sortKey))
+
+class VersionTestCase(unittest.TestCase):
+
+    def testParse(self):
+        v = Version("4.5.1.1+23")
+        self.assertEquals("4.5.1.1+23", v.string)
+        self.assertEquals("4.5.1.1+23", str(v))
+        self.assertEquals("4.5.1.1", v.release)
+        self.assertEquals((4, 5, 1, 1), v.fields)
+        self.assertEquals("+", v.qualifier)
+        self.assertEquals(23, v.build)
+
+        v = Version("1.2.44")
+        self.assertEquals("1.2.44", v.release)
+        self.assert_(v.qualifier is None)
+        self.assert_(v.build is None)
+
+        v = Version("1.0-23b1")
+        self.assertEquals((1, "0-23"), v.fields)
+        self.assertEquals("b", v.qualifier)
+        self.assertEquals(1, v.build)
+
+    def testInterned(self):
+        self.assert_(Version("1.6.1+1") is Version("1.6.1+1"))
+        self.assert_(Version(Version("1.6.1+1")) is Version("1.6.1+1"))
+        self.assertRaises(AttributeError, setattr, Version("1.0"), "foo", 1)
+
+        # the table of interned versions is bounded
+        limit = Version.maxInterned
+        Version.maxInterned = 3
+        try:
+            Version.clearCache()
+            map(Version, "1.0 1.1 1.2 1.3".split())
+            self.assertEquals(1, len(Version._interned))
+        finally:
+            Version.maxInterned = limit
+
+    def testCompareOther(self):
+        v = Version("1.0+3")
+        self.assert_(not (v == None))
+        self.assert_(v != None)
+        self.assert_(v != 3)
+        self.assert_(None != v)
+        self.assert_(v not in [None, 1.0, "1.0+2"])
+        self.assert_(v in [None, "1.0+3"])
+
+    def testOrder(self):
+        vcmp = VersionCompare()
+        versions = "1.0+23 1.0-5 2.3.1 1.0+3 1.1.2+1 1.0svn5 1.0+1".split()
+        self.assertEquals(sorted(versions, vcmp), 
+                          map(str, sorted(map(Version, versions))))
+        self.assert_(Version("1.0+3") < Version("1.0+23"))
+        self.assert_(Version("1.0+3") < "1.0+23")
+        self.assert_(Version("2.3.1") > "1.0.2+1")
+        self.assertEquals(Version("1.0+3"), "1.0+3")
+        self.assertEquals(2, len(set(map(Version, ["1.0+3", "1.0+3", "1.0"]))))
+        self.assert_(vcmp.sortKey("1.0+3") is Version("1.0+3"))
+
+        # a release that is a prefix of another is compared only as far 
+        # as the shorter goes, as by compare()
+        self.assert_(Version("1.0.1+1") < "1.0+2")
+        self.assert_(Version("1.0+1") > "1.0.1")
+        self.assert_(Version("1.0") <= "1.0.1" and Version("1.0") >= "1.0.1")
+        self.assertNotEquals(Version("1.0"), "1.0.1")
+
+        # a Version hashes as its string does
+        self.assertEquals(hash("1.0+3"), hash(Version("1.0+3")))
+        self.assert_("1.0+3" in set([Version("1.0+3")]))
+        self.assertEquals(1, {"1.0+3": 1}[Version("1.0+3")])
+
+class SortOrderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.versions = "1.0+23 1.0-5 2.3.1 1.0+3 1.1.2+1 1.0svn5 1.0+1 " \
+                        "2.3.0svn4355 1.0.2 1.0-23b1 1.0-23b3 10.1 2.3.1 " \
+                        "3260+1 1.0+rc 1.0.2.7+1".split()
+        self.expected = sorted(self.versions, key=Version)
+
+    def testPython(self):
+        order = sortOrder(self.versions, False)
+        self.assertEquals(self.expected, 
+                          map(lambda i: self.versions[i], order))
+        self.assertEquals(self.expected, sortVersions(self.versions, False))
+        self.assertEquals([], sortOrder([], False))
+
+    def testPrefix(self):
+        # releases that are prefixes of others are ordered as by compare()
+        versions = "1.0.1+1 1.0+2 2.0 1.0+1 1.0.1".split()
+        expected = sorted(versions, VersionCompare())
+        self.assertEquals(expected, sortVersions(versions, False))
+        self.assertEquals(expected, sortVersions(versions))
+
+    def testNumPy(self):
+        if onvers.numpy is None:
+            self.assertRaises(RuntimeError, sortOrder, self.versions, True)
+            return
+        self.assertEquals(self.expected, sortVersions(self.versions, True))
+        self.assertEquals(sortOrder(self.versions, False), 
+                          sortOrder(self.versions, True))
+        self.assertEquals(["1.0+1", "1.0+%d" % 2**63], 
+                          sortVersions(["1.0+%d" % 2**63, "1.0+1"], True))
+
 
 if __name__ == "__main__":
     unittest.main()